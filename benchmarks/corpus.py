@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+"""The fixed corpus of molecules and systems used to benchmark typing.
+
+Each entry has a unique name, a category and a SMILES. The systems are
+built directly from the SMILES as atoms and bonds, without coordinates,
+exactly as SEAMM stores them, so that large molecules that RDKit cannot
+embed in 3-D can still be included.
+"""
+
+import rdkit
+import rdkit.Chem
+
+
+def _alkane(n):
+    return 'C' * n
+
+
+def _repeat(unit, n, start='', end=''):
+    return start + unit * n + end
+
+
+def _box(solute, n_water):
+    return '.'.join([solute] + ['O'] * n_water)
+
+
+corpus = [
+    # Small organic molecules
+    {'name': 'methane', 'category': 'small', 'smiles': 'C'},
+    {'name': 'ethanol', 'category': 'small', 'smiles': 'CCO'},
+    {'name': 'isobutane', 'category': 'small', 'smiles': 'CC(C)C'},
+    {'name': 'cyclohexane', 'category': 'small', 'smiles': 'C1CCCCC1'},
+    {'name': 'propene', 'category': 'small', 'smiles': 'CC=C'},
+    {'name': 'acetylene', 'category': 'small', 'smiles': 'C#C'},
+    {'name': 'benzene', 'category': 'small', 'smiles': 'c1ccccc1'},
+    {'name': 'naphthalene', 'category': 'small', 'smiles': 'c1ccc2ccccc2c1'},
+    {'name': 'phenol', 'category': 'small', 'smiles': 'c1ccccc1O'},
+    {'name': 'diethyl ether', 'category': 'small', 'smiles': 'CCOCC'},
+    {'name': 'oxetane', 'category': 'small', 'smiles': 'C1COC1'},
+    {'name': 'acetaldehyde', 'category': 'small', 'smiles': 'CC=O'},
+    {'name': 'acetic acid', 'category': 'small', 'smiles': 'CC(=O)O'},
+    {'name': 'methyl acetate', 'category': 'small', 'smiles': 'CC(=O)OC'},
+    {'name': 'trimethylamine', 'category': 'small', 'smiles': 'CN(C)C'},
+    {'name': 'aniline', 'category': 'small', 'smiles': 'c1ccccc1N'},
+    {'name': 'acetamide', 'category': 'small', 'smiles': 'CC(=O)N'},
+    {'name': 'pyridine', 'category': 'small', 'smiles': 'c1ccncc1'},
+    {'name': 'pyrrole', 'category': 'small', 'smiles': 'c1cc[nH]c1'},
+    {'name': 'furan', 'category': 'small', 'smiles': 'c1ccoc1'},
+    {'name': 'nitromethane', 'category': 'small', 'smiles': 'C[N+](=O)[O-]'},
+    {'name': 'methanethiol', 'category': 'small', 'smiles': 'CS'},
+    {'name': 'argon', 'category': 'small', 'smiles': '[Ar]'},
+    # Linear alkanes of increasing length
+    {'name': 'butane', 'category': 'alkane', 'smiles': _alkane(4)},
+    {'name': 'octane', 'category': 'alkane', 'smiles': _alkane(8)},
+    {'name': 'hexadecane', 'category': 'alkane', 'smiles': _alkane(16)},
+    {'name': 'C32 alkane', 'category': 'alkane', 'smiles': _alkane(32)},
+    {'name': 'C64 alkane', 'category': 'alkane', 'smiles': _alkane(64)},
+    {'name': 'C128 alkane', 'category': 'alkane', 'smiles': _alkane(128)},
+    {'name': 'C256 alkane', 'category': 'alkane', 'smiles': _alkane(256)},
+    # Siloxanes
+    {
+        'name': 'hexamethyldisiloxane',
+        'category': 'siloxane',
+        'smiles': 'C[Si](C)(C)O[Si](C)(C)C'
+    },
+    {
+        'name': 'D4 siloxane',
+        'category': 'siloxane',
+        'smiles': 'C[Si]1(C)O[Si](C)(C)O[Si](C)(C)O[Si](C)(C)O1'
+    },
+    {
+        'name': 'PDMS 20-mer',
+        'category': 'siloxane',
+        'smiles': _repeat('[Si](C)(C)O', 20, start='C', end='C')
+    },
+    # Aromatic polymers
+    {
+        'name': 'polystyrene 10-mer',
+        'category': 'aromatic polymer',
+        'smiles': _repeat('CC(c1ccccc1)', 10)
+    },
+    {
+        'name': 'polystyrene 50-mer',
+        'category': 'aromatic polymer',
+        'smiles': _repeat('CC(c1ccccc1)', 50)
+    },
+    {
+        'name': 'poly(p-phenylene) 10-mer',
+        'category': 'aromatic polymer',
+        'smiles': _repeat('c1ccc(cc1)', 10)
+    },
+    {
+        'name': 'poly(phenylene oxide) 10-mer',
+        'category': 'aromatic polymer',
+        'smiles': _repeat('c1ccc(cc1)O', 10, start='C', end='C')
+    },
+    # Ionic liquids
+    {
+        'name': 'tetramethylammonium acetate',
+        'category': 'ionic liquid',
+        'smiles': 'C[N+](C)(C)C.CC(=O)[O-]'
+    },
+    {
+        'name': 'EMIM acetate',
+        'category': 'ionic liquid',
+        'smiles': 'CCn1cc[n+](C)c1.CC(=O)[O-]'
+    },
+    {
+        'name': 'imidazolium acetate',
+        'category': 'ionic liquid',
+        'smiles': 'c1c[nH+]c[nH]1.CC(=O)[O-]'
+    },
+    {
+        'name': 'guanidinium acetate',
+        'category': 'ionic liquid',
+        'smiles': 'NC(=[NH2+])N.CC(=O)[O-]'
+    },
+    # Solvated systems
+    {
+        'name': 'ethanol in 100 water',
+        'category': 'solvated box',
+        'smiles': _box('CCO', 100)
+    },
+    {
+        'name': 'phenol in 1000 water',
+        'category': 'solvated box',
+        'smiles': _box('c1ccccc1O', 1000)
+    },
+]
+
+
+def smiles_to_graph(smiles):
+    """The molecular graph for a SMILES, with all hydrogens explicit.
+
+    The aromatic bonds have bond order 5, as in SEAMM, and there are no
+    formal charges, which the typer works out from the bonds.
+
+    Parameters
+    ----------
+    smiles : str
+        The SMILES.
+
+    Returns
+    -------
+    {str: []}
+        The graph, like those from configuration_to_graph().
+    """
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smiles))
+    bonds = []
+    for bond in molecule.GetBonds():
+        if bond.GetIsAromatic():
+            order = 5
+        else:
+            order = int(bond.GetBondTypeAsDouble())
+        bonds.append((bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(), order))
+    return {
+        'atomic_numbers': [a.GetAtomicNum() for a in molecule.GetAtoms()],
+        'bonds': bonds,
+        'formal_charges': None,
+    }
+
+
+def graph_to_configuration(system_db, graph):
+    """Create a configuration with the atoms and bonds of a graph.
+
+    Parameters
+    ----------
+    system_db : molsystem.SystemDB
+        The database to create the configuration in.
+    graph : {str: []}
+        The molecular graph.
+
+    Returns
+    -------
+    molsystem.Configuration
+        The configuration, with all the atoms at the origin.
+    """
+    configuration = system_db.create_system().create_configuration()
+    n = len(graph['atomic_numbers'])
+    zeros = [0.0] * n
+    ids = configuration.atoms.append(
+        x=zeros, y=zeros, z=zeros, atno=graph['atomic_numbers']
+    )
+    if len(graph['bonds']) > 0:
+        configuration.bonds.append(
+            i=[ids[i] for i, _, _ in graph['bonds']],
+            j=[ids[j] for _, j, _ in graph['bonds']],
+            bondorder=[order for _, _, order in graph['bonds']],
+        )
+    return configuration
@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Benchmark the atom typing and charges on a fixed corpus of systems.
+
+Each system in the corpus is typed with
+SeammDefaultAtomtyping.assign_parameters() and FFAssigner.assign(). The
+time for each is reported along with the throughput, and the atom types
+and charges are checked against the golden results in golden.json.
+
+Run from the top directory of the repository::
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --category alkane --repeat 10
+    python benchmarks/run_benchmarks.py --update-golden
+
+The exit code is 1 if any result differs from the golden results.
+"""
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import molsystem
+import rdkit.RDLogger
+import seamm_util.printing as printing
+
+# Run from a checkout without installing
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+from corpus import (  # noqa: E402
+    corpus, graph_to_configuration, smiles_to_graph
+)
+import seamm_default_atomtyping  # noqa: E402
+from seamm_default_atomtyping.diagnostics import (  # noqa: E402
+    UntypedAtomsError, summary
+)
+from seamm_default_atomtyping.ff_assigner import FFAssigner  # noqa: E402
+
+golden_file = os.path.join(here, 'golden.json')
+
+#: The tolerance for comparing the charges with the golden ones.
+charge_tolerance = 1.0e-6
+
+
+def time_call(function, repeat):
+    """Call a function several times, timing each call.
+
+    Parameters
+    ----------
+    function : callable
+        The function, which takes no arguments.
+    repeat : int
+        The number of times to call it.
+
+    Returns
+    -------
+    (object, [float])
+        The result of the last call and the time in seconds for each.
+    """
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - t0)
+    return result, times
+
+
+def run_entry(entry, typer, assigner, system_db, repeat):
+    """Type one system of the corpus with both methods.
+
+    Parameters
+    ----------
+    entry : {str: str}
+        The entry in the corpus.
+    typer : SeammDefaultAtomtyping
+        The atom typer, with its cache of results turned off.
+    assigner : FFAssigner
+        The SMILES-based atom typer.
+    system_db : molsystem.SystemDB
+        The database for the configurations.
+    repeat : int
+        The number of times to type the system with each method.
+
+    Returns
+    -------
+    {str: object}
+        The number of atoms, the times, the atom types and charges from
+        assign_parameters() or the error it raised, and the atom types
+        from FFAssigner.
+    """
+    graph = smiles_to_graph(entry['smiles'])
+    configuration = graph_to_configuration(system_db, graph)
+    result = {'n_atoms': len(graph['atomic_numbers'])}
+
+    ff = typer.selected_forcefield
+    try:
+        _, times = time_call(
+            lambda: typer.assign_parameters(configuration), repeat
+        )
+    except Exception as e:
+        if isinstance(e, UntypedAtomsError):
+            # Without the path to the report, which changes
+            result['error'] = summary(e.report)
+        else:
+            result['error'] = str(e)
+        result['atomtypes'] = None
+        result['charges'] = None
+        result['times'] = None
+    else:
+        result['error'] = None
+        result['atomtypes'] = configuration.atoms.get_column_data(
+            f'atomtypes_{ff}'
+        )
+        key = f'charges_{ff}'
+        if key in configuration.atoms:
+            result['charges'] = [
+                round(q, 6) for q in configuration.atoms.get_column_data(key)
+            ]
+        else:
+            result['charges'] = None
+        result['times'] = times
+
+    atomtypes, times = time_call(
+        lambda: assigner.assign(smiles=entry['smiles']), repeat
+    )
+    result['assigner_types'] = atomtypes
+    result['assigner_times'] = times
+
+    return result
+
+
+def compare(entry, result, golden):
+    """Compare the results for a system with the golden ones.
+
+    Parameters
+    ----------
+    entry : {str: str}
+        The entry in the corpus.
+    result : {str: object}
+        The results from run_entry().
+    golden : {str: object}
+        The golden results for the system, or None if there are none.
+
+    Returns
+    -------
+    [str]
+        A description of each difference.
+    """
+    if golden is None:
+        return ['no golden results']
+    if golden['smiles'] != entry['smiles']:
+        return ['the SMILES in the corpus has changed']
+
+    problems = []
+    if result['assigner_types'] != golden['atomtypes']:
+        problems.append('FFAssigner atom types differ')
+    if result['error'] != golden['error']:
+        problems.append(f"error '{result['error']}' != '{golden['error']}'")
+    elif result['error'] is None:
+        if result['atomtypes'] != golden['atomtypes']:
+            problems.append('atom types differ')
+        if (result['charges'] is None) != (golden['charges'] is None):
+            problems.append('charges missing')
+        elif result['charges'] is not None and any(
+            abs(q - q0) > charge_tolerance
+            for q, q0 in zip(result['charges'], golden['charges'])
+        ):
+            problems.append('charges differ')
+    return problems
+
+
+def golden_entry(entry, result):
+    """The golden results for a system from its results."""
+    return {
+        'smiles': entry['smiles'],
+        'atomtypes': result['assigner_types'],
+        'charges': result['charges'],
+        'error': result['error'],
+    }
+
+
+def format_time(times):
+    """The median of a list of times, in milliseconds, as a string."""
+    if times is None:
+        return '-'
+    return f'{1000 * statistics.median(times):.2f}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark atom typing on a fixed corpus.'
+    )
+    parser.add_argument(
+        '--repeat',
+        type=int,
+        default=3,
+        help='the number of times to type each system (default 3)'
+    )
+    parser.add_argument(
+        '--category',
+        action='append',
+        help='only run the systems in this category; may be repeated'
+    )
+    parser.add_argument(
+        '--engine',
+        choices=('smarts', 'tree'),
+        default='smarts',
+        help='how the templates are matched (default smarts)'
+    )
+    parser.add_argument(
+        '--update-golden',
+        action='store_true',
+        help='write the results as the new golden results'
+    )
+    parser.add_argument(
+        '--json', help='write the detailed results to this JSON file'
+    )
+    parser.add_argument(
+        '--verbose', action='store_true', help='show the log messages'
+    )
+    options = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if options.verbose else logging.CRITICAL
+    )
+    if not options.verbose:
+        # Silence the output that would go to step.out
+        printing.getPrinter().setLevel(logging.CRITICAL)
+        rdkit.RDLogger.DisableLog('rdApp.*')
+
+    entries = [
+        entry for entry in corpus
+        if options.category is None or entry['category'] in options.category
+    ]
+
+    if os.path.exists(golden_file):
+        with open(golden_file, 'r') as fd:
+            golden = json.load(fd)
+    else:
+        golden = {}
+
+    # The cache of results would make every repeat after the first free.
+    t0 = time.perf_counter()
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_size=0, engine=options.engine
+    )
+    assigner = FFAssigner(typer.forcefield)
+    print(f'Loaded the forcefield in {time.perf_counter() - t0:.2f} s')
+    print()
+
+    system_db = molsystem.SystemDB(
+        filename='file:benchmark_db?mode=memory&cache=shared'
+    )
+
+    header = (
+        f"{'System':<30} {'Category':<17} {'Atoms':>6} "
+        f"{'assign (ms)':>12} {'FFAssigner (ms)':>16}  Status"
+    )
+    print(header)
+    print('-' * len(header))
+
+    results = {}
+    n_failed = 0
+    totals = {
+        'atoms': 0,
+        'assigner': 0.0,
+        'n_assign': 0,
+        'assign_atoms': 0,
+        'assign': 0.0,
+    }
+    # Both typers save a report on any untyped atoms in the current
+    # directory, so run in a scratch directory.
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        typer.directory = scratch
+        try:
+            for entry in entries:
+                name = entry['name']
+                result = run_entry(
+                    entry, typer, assigner, system_db, options.repeat
+                )
+                results[name] = result
+
+                if options.update_golden:
+                    golden[name] = golden_entry(entry, result)
+                    status = 'updated'
+                else:
+                    problems = compare(entry, result, golden.get(name))
+                    if len(problems) > 0:
+                        n_failed += 1
+                        status = 'FAILED: ' + '; '.join(problems)
+                    elif result['error'] is not None:
+                        status = 'ok (error)'
+                    else:
+                        status = 'ok'
+
+                n_atoms = result['n_atoms']
+                totals['atoms'] += n_atoms
+                totals['assigner'] += statistics.median(
+                    result['assigner_times']
+                )
+                if result['times'] is not None:
+                    totals['assign'] += statistics.median(result['times'])
+                    totals['n_assign'] += 1
+                    totals['assign_atoms'] += n_atoms
+
+                print(
+                    f"{name:<30} {entry['category']:<17} {n_atoms:6d} "
+                    f"{format_time(result['times']):>12} "
+                    f"{format_time(result['assigner_times']):>16}  {status}"
+                )
+        finally:
+            os.chdir(cwd)
+
+    system_db.close()
+
+    print()
+    if totals['assign'] > 0:
+        print(
+            f"assign_parameters: {totals['n_assign']} systems, "
+            f"{totals['assign_atoms']} atoms in {totals['assign']:.3f} s, "
+            f"{totals['n_assign'] / totals['assign']:.1f} systems/s, "
+            f"{totals['assign_atoms'] / totals['assign']:.0f} atoms/s"
+        )
+    if totals['assigner'] > 0:
+        print(
+            f"FFAssigner.assign: {len(entries)} systems, "
+            f"{totals['atoms']} atoms in {totals['assigner']:.3f} s, "
+            f"{len(entries) / totals['assigner']:.1f} systems/s, "
+            f"{totals['atoms'] / totals['assigner']:.0f} atoms/s"
+        )
+
+    if options.json is not None:
+        with open(options.json, 'w') as fd:
+            json.dump(results, fd, indent=1)
+
+    if options.update_golden:
+        # One line per system keeps the diffs readable
+        with open(golden_file, 'w') as fd:
+            fd.write('{\n')
+            fd.write(
+                ',\n'.join(
+                    f'{json.dumps(name)}: {json.dumps(golden[name])}'
+                    for name in sorted(golden)
+                )
+            )
+            fd.write('\n}\n')
+        print(f'Wrote the golden results to {golden_file}')
+        return 0
+
+    if n_failed > 0:
+        print(f'{n_failed} systems do not match the golden results!')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
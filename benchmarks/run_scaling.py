@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Measure how the cost of atom typing scales with the size of the system.
+
+Synthetic systems from synthetic.py are typed with
+SeammDefaultAtomtyping.assign_parameters() over a range of sizes. The
+time in each phase of typing and the peak memory are recorded for each
+size. A power law, time = a * N**b, is then fitted for each phase, and
+an exponent b well above 1 flags super-linear behavior.
+
+Each point runs in a fresh process, so that the peak memory belongs to
+that system alone. Run from the top directory of the repository::
+
+    python benchmarks/run_scaling.py
+    python benchmarks/run_scaling.py --system chain --max-atoms 1000000
+    python benchmarks/run_scaling.py --check --max-exponent 1.2
+
+With --check the exit code is 1 if the exponent for the total time of
+any system exceeds the maximum.
+"""
+
+import argparse
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+#: The phases of typing that are timed, which are those of TypingProfile
+#: apart from loading the forcefield.
+phases = ('graph', 'molecule', 'cache', 'match', 'charges', 'store')
+
+
+def peak_memory():
+    """The peak resident memory of this process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 2**20
+    return peak / 2**10
+
+
+def run_point(system, n_atoms):
+    """Build and type one system, in this process.
+
+    Parameters
+    ----------
+    system : str
+        The name of the generator in synthetic.generators.
+    n_atoms : int
+        The approximate number of atoms.
+
+    Returns
+    -------
+    {str: object}
+        The actual number of atoms, the time for each phase and in total,
+        the peak memory before and after typing, and any error raised.
+    """
+    sys.path.insert(0, os.path.dirname(here))
+    sys.path.insert(0, here)
+
+    import molsystem
+    import seamm_default_atomtyping
+    from corpus import graph_to_configuration
+    from synthetic import generators
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_size=0, profile=True
+    )
+    typer.charge_table  # Load the forcefield now, outside the timing
+
+    t0 = time.perf_counter()
+    graph = generators[system](n_atoms)
+    system_db = molsystem.SystemDB(
+        filename='file:scaling_db?mode=memory&cache=shared'
+    )
+    configuration = graph_to_configuration(system_db, graph)
+    build_time = time.perf_counter() - t0
+    del graph
+
+    typer.profile.clear()
+    memory_before = peak_memory()
+    t0 = time.perf_counter()
+    error = None
+    try:
+        typer.assign_parameters(configuration)
+    except Exception as e:
+        error = str(e)
+    total = time.perf_counter() - t0
+    memory_after = peak_memory()
+
+    result = {
+        'system': system,
+        'n_atoms': configuration.n_atoms,
+        'build': build_time,
+        'total': total,
+        'memory_before': memory_before,
+        'memory_after': memory_after,
+        'error': error,
+    }
+    result.update(typer.profile.phase_times)
+    system_db.close()
+    return result
+
+
+def fit_exponent(sizes, times):
+    """Fit time = a * N**b and return b.
+
+    Parameters
+    ----------
+    sizes : [int]
+        The sizes of the systems.
+    times : [float]
+        The times for the systems.
+
+    Returns
+    -------
+    float
+        The exponent b, or None if there are too few nonzero times.
+    """
+    points = [(n, t) for n, t in zip(sizes, times) if t > 0]
+    if len(points) < 2:
+        return None
+    x = np.log([n for n, _ in points])
+    y = np.log([t for _, t in points])
+    slope, _ = np.polyfit(x, y, 1)
+    return float(slope)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Measure the scaling of atom typing with system size.'
+    )
+    parser.add_argument(
+        '--system',
+        action='append',
+        choices=('chain', 'branched', 'water', 'silica'),
+        help='the type of system to run; may be repeated (default all)'
+    )
+    parser.add_argument(
+        '--min-atoms',
+        type=float,
+        default=1.0e2,
+        help='the smallest system (default 100 atoms)'
+    )
+    parser.add_argument(
+        '--max-atoms',
+        type=float,
+        default=1.0e5,
+        help='the largest system (default 100000 atoms); up to 1e6 is useful'
+    )
+    parser.add_argument(
+        '--per-decade',
+        type=int,
+        default=2,
+        help='the number of sizes per factor of 10 (default 2)'
+    )
+    parser.add_argument(
+        '--fit-min',
+        type=float,
+        default=1.0e3,
+        help='only fit systems at least this large (default 1000 atoms)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=3600,
+        help='the maximum time in seconds for one system (default 3600)'
+    )
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help='exit with 1 if the total time scales super-linearly'
+    )
+    parser.add_argument(
+        '--max-exponent',
+        type=float,
+        default=1.2,
+        help='the largest acceptable exponent for --check (default 1.2)'
+    )
+    parser.add_argument('--json', help='write the results to this JSON file')
+    parser.add_argument(
+        '--point', nargs=2, metavar=('SYSTEM', 'N'), help=argparse.SUPPRESS
+    )
+    options = parser.parse_args(argv)
+
+    if options.point is not None:
+        # Run one system in this process, for the parent harness
+        logging.basicConfig(level=logging.CRITICAL)
+        import rdkit.RDLogger
+        import seamm_util.printing as printing
+        printing.getPrinter().setLevel(logging.CRITICAL)
+        rdkit.RDLogger.DisableLog('rdApp.*')
+        system, n_atoms = options.point
+        print(json.dumps(run_point(system, int(n_atoms))))
+        return 0
+
+    systems = options.system
+    if systems is None:
+        systems = ['chain', 'branched', 'water', 'silica']
+
+    start = np.log10(options.min_atoms)
+    stop = np.log10(options.max_atoms)
+    n_sizes = int(round((stop - start) * options.per_decade)) + 1
+    sizes = [int(round(n)) for n in np.logspace(start, stop, n_sizes)]
+
+    results = []
+    exponents = {}
+    failed = False
+    for system in systems:
+        print(f'System: {system}')
+        header = (
+            f"{'Atoms':>9} " + ' '.join(f'{p:>9}' for p in phases) +
+            f" {'total':>9} {'MiB':>8}  Notes"
+        )
+        print(header)
+        print('-' * len(header))
+
+        points = []
+        for n_atoms in sizes:
+            command = [
+                sys.executable,
+                os.path.abspath(__file__), '--point', system,
+                str(n_atoms)
+            ]
+            try:
+                process = subprocess.run(
+                    command,
+                    capture_output=True,
+                    text=True,
+                    timeout=options.timeout
+                )
+            except subprocess.TimeoutExpired:
+                print(f'{n_atoms:9d}  timed out after {options.timeout} s')
+                break
+            if process.returncode != 0:
+                # A negative code is a signal, e.g. -9 when out of memory
+                print(f'{n_atoms:9d}  failed with code {process.returncode}')
+                print(process.stderr)
+                break
+            point = json.loads(process.stdout.strip().splitlines()[-1])
+            points.append(point)
+            results.append(point)
+
+            memory = point['memory_after'] - point['memory_before']
+            note = '' if point['error'] is None else point['error']
+            print(
+                f"{point['n_atoms']:9d} " +
+                ' '.join(f'{point[p]:9.4f}' for p in phases) +
+                f" {point['total']:9.4f} {memory:8.1f}  {note}"
+            )
+
+        fitted = [p for p in points if p['n_atoms'] >= options.fit_min]
+        n = [p['n_atoms'] for p in fitted]
+        exponents[system] = {
+            key: fit_exponent(n, [p[key] for p in fitted])
+            for key in phases + ('total',)
+        }
+        text = ' '.join(
+            f'{b:9.2f}' if b is not None else f"{'-':>9}"
+            for b in exponents[system].values()
+        )
+        print(f"{'exponent':>9} {text}")
+        print()
+
+        b = exponents[system]['total']
+        if b is not None and b > options.max_exponent:
+            failed = True
+            print(
+                f'The time for {system} scales as N**{b:.2f}, more than '
+                f'N**{options.max_exponent}!'
+            )
+            print()
+
+    if options.json is not None:
+        with open(options.json, 'w') as fd:
+            json.dump(
+                {
+                    'points': results,
+                    'exponents': exponents
+                }, fd, indent=1
+            )
+
+    if options.check and failed:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
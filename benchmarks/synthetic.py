@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+"""Generators of synthetic systems of any size for the scaling harness.
+
+Each generator takes the approximate number of atoms wanted and returns a
+molecular graph like those from configuration_to_graph(), with explicit
+hydrogens and no formal charges. The graphs are built directly, without
+SMILES or coordinates, so even systems of millions of atoms are cheap to
+make.
+"""
+
+import math
+
+
+def _add_hydrogens(atomic_numbers, bonds, valence):
+    """Cap every atom with hydrogens up to its valence.
+
+    Parameters
+    ----------
+    atomic_numbers : [int]
+        The atomic numbers, to which the hydrogens are appended.
+    bonds : [(int, int, int)]
+        The bonds, to which the bonds to the hydrogens are appended.
+    valence : {int: int}
+        The valence of each element to be capped.
+
+    Returns
+    -------
+    None
+    """
+    n_bonds = [0] * len(atomic_numbers)
+    for i, j, order in bonds:
+        n_bonds[i] += order
+        n_bonds[j] += order
+    for i in range(len(n_bonds)):
+        for _ in range(valence.get(atomic_numbers[i], 0) - n_bonds[i]):
+            bonds.append((i, len(atomic_numbers), 1))
+            atomic_numbers.append(1)
+
+
+def _graph(atomic_numbers, bonds):
+    return {
+        'atomic_numbers': atomic_numbers,
+        'bonds': bonds,
+        'formal_charges': None,
+    }
+
+
+def alkane_chain(n_atoms):
+    """A single linear alkane chain, CH3(CH2)nCH3.
+
+    Parameters
+    ----------
+    n_atoms : int
+        The approximate number of atoms.
+
+    Returns
+    -------
+    {str: []}
+        The molecular graph.
+    """
+    n_carbons = max(1, (n_atoms - 2) // 3)
+    atomic_numbers = [6] * n_carbons
+    bonds = [(i, i + 1, 1) for i in range(n_carbons - 1)]
+    _add_hydrogens(atomic_numbers, bonds, {6: 4})
+    return _graph(atomic_numbers, bonds)
+
+
+def branched_polymer(n_atoms, spacing=4, branch_length=4):
+    """A single polyethylene chain with alkyl branches.
+
+    Every spacing'th backbone carbon carries a branch, alternately a
+    methyl group and a chain of branch_length carbons, so the system has
+    primary, secondary, tertiary carbons in varied environments.
+
+    Parameters
+    ----------
+    n_atoms : int
+        The approximate number of atoms.
+    spacing : int = 4
+        The number of backbone carbons between branch points.
+    branch_length : int = 4
+        The number of carbons in the long branches.
+
+    Returns
+    -------
+    {str: []}
+        The molecular graph.
+    """
+    # Carbons per repeat: the backbone plus half a methyl and half a branch
+    carbons_per_unit = spacing + (1 + branch_length) / 2
+    n_units = max(1, round(n_atoms / (3 * carbons_per_unit)))
+
+    atomic_numbers = []
+    bonds = []
+    previous = None
+    for unit in range(n_units):
+        for k in range(spacing):
+            atomic_numbers.append(6)
+            current = len(atomic_numbers) - 1
+            if previous is not None:
+                bonds.append((previous, current, 1))
+            previous = current
+        length = 1 if unit % 2 == 0 else branch_length
+        anchor = previous
+        for _ in range(length):
+            atomic_numbers.append(6)
+            bonds.append((anchor, len(atomic_numbers) - 1, 1))
+            anchor = len(atomic_numbers) - 1
+    _add_hydrogens(atomic_numbers, bonds, {6: 4})
+    return _graph(atomic_numbers, bonds)
+
+
+def water_box(n_atoms):
+    """A box of separate water molecules.
+
+    Parameters
+    ----------
+    n_atoms : int
+        The approximate number of atoms.
+
+    Returns
+    -------
+    {str: []}
+        The molecular graph.
+    """
+    n_waters = max(1, n_atoms // 3)
+    atomic_numbers = [8, 1, 1] * n_waters
+    bonds = []
+    for n in range(n_waters):
+        bonds.append((3 * n, 3 * n + 1, 1))
+        bonds.append((3 * n, 3 * n + 2, 1))
+    return _graph(atomic_numbers, bonds)
+
+
+def silica_slab(n_atoms, n_layers=4):
+    """A slab of beta-cristobalite silica with hydroxylated surfaces.
+
+    The silicon atoms sit on a diamond lattice with an oxygen bridging
+    each pair of neighbors. The slab is periodic in the two directions
+    of its surface, with bonds across the periodic boundary, so the
+    whole slab is one connected network. The dangling bonds on the top
+    and bottom surfaces are capped with hydroxyl groups.
+
+    Parameters
+    ----------
+    n_atoms : int
+        The approximate number of atoms.
+    n_layers : int = 4
+        The thickness of the slab, in primitive cells.
+
+    Returns
+    -------
+    {str: []}
+        The molecular graph.
+    """
+    # About 6 atoms per primitive cell: 2 Si and 4 O, plus the hydroxyls
+    n_cells = max(1, n_atoms / 6)
+    n_side = max(2, round(math.sqrt(n_cells / n_layers)))
+
+    def index(i, j, k, site):
+        return 2 * ((k * n_side + j) * n_side + i) + site
+
+    atomic_numbers = [14] * (2 * n_side * n_side * n_layers)
+    bonds = []
+
+    def bridge(si_a, si_b):
+        atomic_numbers.append(8)
+        o = len(atomic_numbers) - 1
+        bonds.append((si_a, o, 1))
+        bonds.append((o, si_b, 1))
+
+    def hydroxyl(si):
+        atomic_numbers.append(8)
+        o = len(atomic_numbers) - 1
+        bonds.append((si, o, 1))
+        atomic_numbers.append(1)
+        bonds.append((o, len(atomic_numbers) - 1, 1))
+
+    # The A site of each cell bonds to the B sites of the cell and of the
+    # three cells behind it along the primitive vectors.
+    for k in range(n_layers):
+        for j in range(n_side):
+            for i in range(n_side):
+                a = index(i, j, k, 0)
+                bridge(a, index(i, j, k, 1))
+                bridge(a, index((i - 1) % n_side, j, k, 1))
+                bridge(a, index(i, (j - 1) % n_side, k, 1))
+                if k > 0:
+                    bridge(a, index(i, j, k - 1, 1))
+                else:
+                    hydroxyl(a)
+                if k == n_layers - 1:
+                    hydroxyl(index(i, j, k, 1))
+    return _graph(atomic_numbers, bonds)
+
+
+#: The generators, by name.
+generators = {
+    'chain': alkane_chain,
+    'branched': branched_polymer,
+    'water': water_box,
+    'silica': silica_slab,
+}
@@ -7,15 +7,32 @@ A plug-in that implements the default atomtypingyping method in SEAMM
 
 # Bring up the classes so that they appear to be directly in
 # the seamm_default_atomtypingyping package.
+#
+# SEAMM imports every plug-in at startup just to describe it, so only the
+# light stevedore helper is imported here. The atom typer, which needs
+# RDKit, NumPy and the forcefield code, and the version, which versioneer
+# may find by running git, are loaded when first used.
 
-from seamm_default_atomtyping.seamm_default_atomtyping import SeammDefaultAtomtyping  # noqa: F401, E501
 from seamm_default_atomtyping.seamm_default_atomtyping_step import SeammDefaultAtomtypingStep  # noqa: F401, E501
 
-# Handle versioneer
-from ._version import get_versions
 __author__ = """Eliseo Marin"""
 __email__ = 'meliseo@vt.edu'
-versions = get_versions()
-__version__ = versions['version']
-__git_revision__ = versions['full-revisionid']
-del get_versions, versions
+
+
+def __getattr__(name):
+    """Import the atom typer or find the version on first access."""
+    if name == 'SeammDefaultAtomtyping':
+        from seamm_default_atomtyping.seamm_default_atomtyping import (
+            SeammDefaultAtomtyping
+        )
+        globals()[name] = SeammDefaultAtomtyping
+        return SeammDefaultAtomtyping
+
+    if name in ('__version__', '__git_revision__'):
+        from ._version import get_versions
+        versions = get_versions()
+        globals()['__version__'] = versions['version']
+        globals()['__git_revision__'] = versions['full-revisionid']
+        return globals()[name]
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
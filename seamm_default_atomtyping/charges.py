@@ -1,35 +1,232 @@
-        #    # Now get the charges if forcefield has them.
-        #    terms = ff.terms
-        #    if 'bond charge increment' in terms:
-        #        logger.debug('Getting the charges for the system')
-        #        neighbors = configuration.bonded_neighbors(as_indices=True)
-
-        #        charges = []
-        #        total_q = 0.0
-        #        for i in range(configuration.n_atoms):
-        #            itype = atom_types[i]
-        #            parameters = ff.charges(itype)[3]
-        #            q = float(parameters['Q'])
-        #            for j in neighbors[i]:
-        #                jtype = atom_types[j]
-        #                parameters = ff.bond_increments(itype, jtype)[3]
-        #                q += float(parameters['deltaij'])
-        #            charges.append(q)
-        #            total_q += q
-        #        if abs(total_q) > 0.0001:
-        #            logger.warning(f'Total charge is not zero: {total_q:.4f}')
-        #            logger.info(
-        #                'Charges from increments and charges:\n' +
-        #                pprint.pformat(charges)
-        #            )
-        #        else:
-        #            logger.debug(
-        #                'Charges from increments:\n' + pprint.pformat(charges)
-        #            )
-
-        #        key = f'charges_{ffname}'
-        #        if key not in configuration.atoms:
-        #            configuration.atoms.add_attribute(key, coltype='float')
-        #        charge_column = configuration.atoms.get_column(key)
-        #        charge_column[0:] = charges
-        #        logger.debug(f"Set column '{key}' to the charges")
+# -*- coding: utf-8 -*-
+
+"""Atomic charges from the bond increments of a forcefield, using NumPy.
+
+The charge on an atom is the base charge of its atom type plus the bond
+increment for each of its bonds. Rather than looking up the parameters
+for every bond, the charges and bond increments of the forcefield are
+resolved, including any equivalences, into a vector and a type-by-type
+matrix indexed by integer type ids. Only the types and pairs of types
+in the bonds typed so far are looked up, each once. The increments are
+then gathered for every bond and summed onto the atoms.
+"""
+
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def bond_arrays(bonds):
+    """The two atom indices of a list of bonds as integer arrays.
+
+    Parameters
+    ----------
+    bonds : [(int, int, ...)]
+        The bonds, each starting with the indices of the two atoms.
+
+    Returns
+    -------
+    (numpy.ndarray, numpy.ndarray)
+        The indices of the first and second atoms of the bonds.
+    """
+    n = len(bonds)
+    i = np.fromiter((bond[0] for bond in bonds), dtype=np.intp, count=n)
+    j = np.fromiter((bond[1] for bond in bonds), dtype=np.intp, count=n)
+    return i, j
+
+
+class ChargeTable(object):
+
+    def __init__(self, forcefield, atom_types=None):
+        """The charges and bond increments of a forcefield as arrays.
+
+        The element [i, j] of the matrix delta is the increment on an atom
+        of type i from a bond to an atom of type j, so the increment on the
+        other atom, DeltaJI, is the element [j, i]. The increments of a
+        pair of types are looked up when first needed, after which
+        known[i, j] is True. Pairs of types that have no bond increments
+        are NaN.
+
+        Parameters
+        ----------
+        forcefield : seamm.Forcefield
+            The forcefield, with charges and bond increments.
+        atom_types : [str] = None
+            The atom types to start with, by default none. Other types are
+            added when first used.
+        """
+        self.forcefield = forcefield
+        self.types = []
+        self.index = {}
+        self.charge = np.zeros(0, dtype=np.float64)
+        self.delta = np.zeros((0, 0), dtype=np.float64)
+        self.known = np.zeros((0, 0), dtype=bool)
+        if atom_types is not None:
+            self.add_types(atom_types)
+
+    def __len__(self):
+        return len(self.types)
+
+    def add_types(self, atom_types):
+        """Add atom types to the table, looking up their charges.
+
+        Parameters
+        ----------
+        atom_types : iterable(str)
+            The atom types. Those already in the table are ignored.
+
+        Returns
+        -------
+        None
+        """
+        new_types = []
+        for atom_type in atom_types:
+            if atom_type not in self.index:
+                self.index[atom_type] = len(self.types) + len(new_types)
+                new_types.append(atom_type)
+        if len(new_types) == 0:
+            return
+
+        n_old = len(self.types)
+        self.types.extend(new_types)
+        n = len(self.types)
+
+        charge = np.empty(n, dtype=np.float64)
+        charge[0:n_old] = self.charge
+        for i in range(n_old, n):
+            charge[i] = float(self.forcefield.charges(self.types[i])[3]['Q'])
+        delta = np.full((n, n), np.nan, dtype=np.float64)
+        delta[0:n_old, 0:n_old] = self.delta
+        known = np.zeros((n, n), dtype=bool)
+        known[0:n_old, 0:n_old] = self.known
+
+        self.charge = charge
+        self.delta = delta
+        self.known = known
+
+    def add_pairs(self, itypes, jtypes):
+        """Look up the bond increments of pairs of types not yet known.
+
+        Parameters
+        ----------
+        itypes, jtypes : numpy.ndarray
+            The type ids of the two atoms of each bond.
+
+        Returns
+        -------
+        None
+        """
+        unknown = ~self.known[itypes, jtypes]
+        if not unknown.any():
+            return
+        pairs = set(zip(itypes[unknown].tolist(), jtypes[unknown].tolist()))
+        for i, j in pairs:
+            if self.known[i, j]:
+                continue
+            self.known[i, j] = self.known[j, i] = True
+            try:
+                parameters = self.forcefield.bond_increments(
+                    self.types[i], self.types[j]
+                )
+            except RuntimeError:
+                continue
+            self.delta[j, i] = float(parameters[3]['deltaji'])
+            self.delta[i, j] = float(parameters[3]['deltaij'])
+
+    def ids(self, atomtypes):
+        """The integer ids of atom types.
+
+        Parameters
+        ----------
+        atomtypes : [str]
+            The atom types.
+
+        Returns
+        -------
+        numpy.ndarray
+            The id of each atom type.
+        """
+        index = self.index
+        try:
+            return np.fromiter(
+                (index[atom_type] for atom_type in atomtypes),
+                dtype=np.intp,
+                count=len(atomtypes)
+            )
+        except KeyError:
+            self.add_types(atomtypes)
+            return self.ids(atomtypes)
+
+    def increments(self, itypes, jtypes):
+        """The bond increments for bonds between atoms of the given types.
+
+        Parameters
+        ----------
+        itypes, jtypes : numpy.ndarray
+            The type ids of the two atoms of each bond.
+
+        Returns
+        -------
+        (numpy.ndarray, numpy.ndarray)
+            The increments on the first and second atoms of each bond.
+        """
+        self.add_pairs(itypes, jtypes)
+        delta_ij = self.delta[itypes, jtypes]
+        delta_ji = self.delta[jtypes, itypes]
+        missing = np.isnan(delta_ij)
+        if missing.any():
+            k = int(np.flatnonzero(missing)[0])
+            raise RuntimeError(
+                'No bond increments for {}-{}'.format(
+                    self.types[itypes[k]], self.types[jtypes[k]]
+                )
+            )
+        return delta_ij, delta_ji
+
+
+def bond_increment_charges(
+    table, atomtypes, bond_i, bond_j, atoms=None, charges=None
+):
+    """Find the charges from the bond increments of the forcefield.
+
+    Parameters
+    ----------
+    table : ChargeTable
+        The charges and bond increments of the forcefield.
+    atomtypes : [str]
+        The atom type of each atom.
+    bond_i, bond_j : numpy.ndarray
+        The indices of the two atoms of each bond.
+    atoms : iterable(int) = None
+        The indices of the atoms to find charges for. By default, all.
+    charges : [float] = None
+        The current charges, used for the other atoms if atoms is given.
+
+    Returns
+    -------
+    numpy.ndarray
+        The charge on each atom.
+    """
+    n_atoms = len(atomtypes)
+    ids = table.ids(atomtypes)
+
+    if atoms is not None:
+        mask = np.zeros(n_atoms, dtype=bool)
+        mask[np.fromiter(atoms, dtype=np.intp)] = True
+        selected = mask[bond_i] | mask[bond_j]
+        bond_i = bond_i[selected]
+        bond_j = bond_j[selected]
+
+    result = table.charge[ids]
+
+    if len(bond_i) > 0:
+        delta_ij, delta_ji = table.increments(ids[bond_i], ids[bond_j])
+        result += np.bincount(bond_i, weights=delta_ij, minlength=n_atoms)
+        result += np.bincount(bond_j, weights=delta_ji, minlength=n_atoms)
+
+    if atoms is not None and charges is not None:
+        result = np.where(mask, result, np.asarray(charges, dtype=np.float64))
+
+    return result
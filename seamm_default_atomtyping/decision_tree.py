@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+"""A decision tree on atom properties for choosing an atom's template.
+
+The templates are tried in order of precedence, and the first that
+matches an atom gives its type. Most templates can be ruled out, or in,
+from a few properties of the atom being typed -- its element,
+aromaticity, charge, connectivity and rings -- so the templates are
+compiled into a tree that splits on these properties. Each leaf lists
+the templates that can still type an atom reaching it, in order, ending
+with the first that certainly does. Only those that need the rest of
+the molecule are then checked by matching their SMARTS.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The atom properties split on, in order, named as in templates.AtomArrays
+properties = (
+    'atomic_number', 'aromatic', 'charge', 'degree', 'h_count', 'n_rings',
+    'min_ring_size', 'explicit_degree'
+)
+
+# The branch for values of a property that no template tests for
+other = 'other'
+
+
+def _tested_values(query, result):
+    """Add the values of each property that a query tests to result."""
+    if query[0] in ('and', 'or'):
+        for child in query[1]:
+            _tested_values(child, result)
+    elif query[0] != 'any':
+        name, value, _ = query
+        if name == 'atom_type':
+            result.setdefault('atomic_number', set()).add(value % 1000)
+            result.setdefault('aromatic', set()).add(int(value >= 1000))
+        elif name == 'in_ring':
+            result.setdefault('n_rings', set()).add(0)
+        else:
+            result.setdefault(name, set()).add(value)
+
+
+def _equals(known, name, value):
+    """Whether a property has a value: True, False, or None if unknown."""
+    if name not in known:
+        return None
+    # The 'other' branch is taken only by values no template tests for
+    return known[name] == value
+
+
+def decide(query, known):
+    """Whether an atom matches a query, from some of its properties.
+
+    Parameters
+    ----------
+    query : tuple
+        The query, from templates.array_query(), or None for a query
+        that must be checked by matching its SMARTS.
+    known : {str: int}
+        The properties known so far, with 'other' for a value that no
+        query tests for.
+
+    Returns
+    -------
+    bool
+        Whether the atom matches, or None if it cannot be decided.
+    """
+    if query is None:
+        return None
+    kind = query[0]
+    if kind == 'any':
+        return True
+    if kind in ('and', 'or'):
+        result = kind == 'and'
+        for child in query[1]:
+            tmp = decide(child, known)
+            if tmp is None:
+                result = None
+            elif tmp != (kind == 'and'):
+                return tmp
+        return result
+
+    name, value, negated = query
+    if name == 'atom_type':
+        element = _equals(known, 'atomic_number', value % 1000)
+        aromatic = _equals(known, 'aromatic', int(value >= 1000))
+        if element is False or aromatic is False:
+            result = False
+        elif element is None or aromatic is None:
+            result = None
+        else:
+            result = True
+    elif name == 'in_ring':
+        if 'n_rings' not in known:
+            result = None
+        else:
+            # 0 is always tested for, so 'other' is one or more rings
+            result = (known['n_rings'] != 0) == bool(value)
+    else:
+        result = _equals(known, name, value)
+    if result is None:
+        return None
+    return result != negated
+
+
+class DecisionTree(object):
+
+    def __init__(self, entries):
+        """Compile the templates into a decision tree.
+
+        Parameters
+        ----------
+        entries : [(int, [tuple], bool)]
+            For each template, in order of precedence, its index, the
+            query from templates.array_query() for each of its mapped
+            atoms, None for any that has no such query, and whether a
+            match depends only on the atom itself, i.e. the template has
+            a single atom.
+
+        Attributes
+        ----------
+        root : tuple
+            The tree. A branch is ('split', property, {value: node},
+            node for other values) and a leaf is ('leaf', ((index,
+            certain),...)) with the templates to try in order, and whether
+            each certainly matches.
+        n_nodes : int
+            The number of nodes in the tree.
+        """
+        self.n_nodes = 0
+        tested = {}
+        for _, queries, _ in entries:
+            for query in queries:
+                if query is not None:
+                    _tested_values(query, tested)
+        self._tested = tested
+        self.properties = tuple(p for p in properties if p in tested)
+        self.root = self._build(list(entries), {})
+        logger.debug(
+            f'The decision tree for {len(entries)} templates has '
+            f'{self.n_nodes} nodes'
+        )
+
+    def _build(self, entries, known):
+        """Build the node of the tree for the known properties."""
+        self.n_nodes += 1
+        remaining = []
+        undecided = set()
+        for entry in entries:
+            index, queries, exact = entry
+            matches = [decide(query, known) for query in queries]
+            if all(x is False for x in matches):
+                continue
+            remaining.append(entry)
+            if any(x is True for x in matches) and exact:
+                # This template types every atom that gets this far
+                break
+            for query in queries:
+                if query is not None and decide(query, known) is None:
+                    tested = {}
+                    _tested_values(query, tested)
+                    undecided.update(tested)
+
+        for name in self.properties:
+            if name in undecided and name not in known:
+                children = {}
+                for value in sorted(self._tested[name]):
+                    children[value] = self._build(
+                        remaining, {**known, name: value}
+                    )
+                rest = self._build(remaining, {**known, name: other})
+                return ('split', name, children, rest)
+
+        steps = []
+        for index, queries, exact in remaining:
+            certain = exact and any(
+                decide(query, known) is True for query in queries
+            )
+            steps.append((index, certain))
+        return ('leaf', tuple(steps))
+
+    def leaf(self, values):
+        """Find the leaf for an atom.
+
+        Parameters
+        ----------
+        values : {str: int}
+            The values of the properties of the atom.
+
+        Returns
+        -------
+        ((int, bool),)
+            The templates to try, in order, and whether each certainly
+            matches.
+        """
+        node = self.root
+        while node[0] == 'split':
+            _, name, children, rest = node
+            node = children.get(values[name], rest)
+        return node[1]
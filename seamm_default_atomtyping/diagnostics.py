@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+
+"""Diagnostics for atoms that the templates of a forcefield do not type.
+
+The primary output is a plain dictionary, which can be written as JSON,
+that groups the untyped atoms by their local environment. Only one
+example of each environment is extracted and drawn, so the cost depends
+on the number of distinct problems rather than the size of the system.
+Drawing the environments is done in a background thread so that it does
+not hold up the typing.
+"""
+
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+
+import rdkit
+import rdkit.Chem
+
+from seamm_default_atomtyping.molecule import atoms_within, submolecule
+
+logger = logging.getLogger(__name__)
+
+#: The number of bonds around an untyped atom included in its environment.
+environment_radius = 2
+
+#: The largest rings included whole in an environment. Larger rings, such
+#: as those through the periodic boundaries of a network, are cut.
+max_ring_size = 8
+
+#: The most environments drawn in the image.
+max_images = 20
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class UntypedAtomsError(RuntimeError):
+    """Some atoms have no atom type in the forcefield."""
+
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report
+
+    def __reduce__(self):
+        # Keep the report when sent back from a worker process
+        return self.__class__, (str(self), self.report)
+
+
+def molecule_neighbors(molecule):
+    """The indices of the bonded neighbors of each atom of a molecule.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The molecule.
+
+    Returns
+    -------
+    [[int]]
+        The indices of the neighbors of each atom.
+    """
+    return [
+        [neighbor.GetIdx() for neighbor in atom.GetNeighbors()]
+        for atom in molecule.GetAtoms()
+    ]
+
+
+def _invariant(atom):
+    return (
+        atom.GetAtomicNum(), atom.GetFormalCharge(), atom.GetIsAromatic(),
+        _in_ring(atom), atom.GetDegree()
+    )
+
+
+def _in_ring(atom):
+    # Atom.IsInRing() may perceive the rings again, which is slow for
+    # molecules made with only the small rings.
+    return atom.GetOwningMol().GetRingInfo().NumAtomRings(atom.GetIdx()) > 0
+
+
+def environment_key(molecule, neighbors, i, radius=environment_radius):
+    """A hashable key that is the same for atoms in the same environment.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The molecule.
+    neighbors : [[int]]
+        The indices of the neighbors of each atom.
+    i : int
+        The index of the atom.
+    radius : int
+        The number of bonds around the atom to include.
+
+    Returns
+    -------
+    tuple
+        The key.
+    """
+    invariant = _invariant(molecule.GetAtomWithIdx(i))
+    if radius == 0:
+        return invariant
+    return (
+        invariant,
+        tuple(
+            sorted(
+                environment_key(molecule, neighbors, j, radius - 1)
+                for j in neighbors[i]
+            )
+        )
+    )
+
+
+def environment_molecule(molecule, neighbors, i, radius=environment_radius):
+    """Extract the environment of an atom as a small molecule.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The sanitized molecule.
+    neighbors : [[int]]
+        The indices of the neighbors of each atom.
+    i : int
+        The index of the atom.
+    radius : int
+        The number of bonds around the atom to include.
+
+    Returns
+    -------
+    (rdkit.Chem.RWMol, int)
+        The environment, including any small rings that it touches, and
+        the index of the atom in it.
+    """
+    environment, indices = submolecule(
+        molecule,
+        atoms_within(neighbors, [i], radius),
+        max_ring_size=max_ring_size
+    )
+    return environment, indices.index(i)
+
+
+def untyped_report(molecule, atom_types, radius=environment_radius):
+    """Describe the untyped atoms of a molecule, grouped by environment.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The sanitized molecule.
+    atom_types : [str]
+        The atom types, '?' for untyped atoms.
+    radius : int
+        The number of bonds around each atom used to group them.
+
+    Returns
+    -------
+    {str: object}
+        The number of atoms in 'n_atoms', the number untyped in
+        'n_untyped' and in 'environments' a list with a dictionary for
+        each distinct environment, most common first, giving the SMILES
+        of the environment with the untyped atom as atom map 1, the
+        element, formal charge, aromaticity, ring membership, degree and
+        number of hydrogens of the atom, and the indices of all the atoms
+        with that environment.
+    """
+    untyped = [i for i, atom_type in enumerate(atom_types) if atom_type == '?']
+    report = {
+        'n_atoms': len(atom_types),
+        'n_untyped': len(untyped),
+        'environments': [],
+    }
+    if len(untyped) == 0:
+        return report
+
+    neighbors = molecule_neighbors(molecule)
+    groups = {}
+    for i in untyped:
+        key = environment_key(molecule, neighbors, i, radius)
+        groups.setdefault(key, []).append(i)
+
+    for atoms in sorted(groups.values(), key=len, reverse=True):
+        i = atoms[0]
+        atom = molecule.GetAtomWithIdx(i)
+        environment, center = environment_molecule(
+            molecule, neighbors, i, radius
+        )
+        environment.GetAtomWithIdx(center).SetAtomMapNum(1)
+        report['environments'].append(
+            {
+                'smiles': rdkit.Chem.MolToSmiles(environment),
+                'element': atom.GetSymbol(),
+                'atomic_number': atom.GetAtomicNum(),
+                'formal_charge': atom.GetFormalCharge(),
+                'aromatic': atom.GetIsAromatic(),
+                'in_ring': _in_ring(atom),
+                'degree': atom.GetDegree(),
+                'n_hydrogens': atom.GetTotalNumHs(includeNeighbors=True),
+                'count': len(atoms),
+                'atoms': atoms,
+            }
+        )
+    return report
+
+
+def combine_reports(parts, n_atoms):
+    """Combine the reports on the molecules of a system into one.
+
+    Parameters
+    ----------
+    parts : [({str: object}, [[int]])]
+        The report from untyped_report() on each distinct molecule and,
+        for each copy of it in the system, the index in the system of
+        each of its atoms.
+    n_atoms : int
+        The number of atoms in the system.
+
+    Returns
+    -------
+    {str: object}
+        The report on the system, as from untyped_report(), with the
+        environments of the same SMILES in different molecules merged.
+    """
+    environments = {}
+    for report, copies in parts:
+        for environment in report['environments']:
+            smiles = environment['smiles']
+            if smiles not in environments:
+                environments[smiles] = dict(environment, count=0, atoms=[])
+            combined = environments[smiles]
+            local = environment['atoms']
+            for atoms in copies:
+                combined['atoms'].extend(atoms[i] for i in local)
+            combined['count'] += len(environment['atoms']) * len(copies)
+    for environment in environments.values():
+        environment['atoms'].sort()
+
+    return {
+        'n_atoms': n_atoms,
+        'n_untyped': sum(e['count'] for e in environments.values()),
+        'environments': sorted(
+            environments.values(), key=lambda e: e['count'], reverse=True
+        ),
+    }
+
+
+def environment_molecules(molecule, report, n=None):
+    """The environments of a report as small molecules, for drawing.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The sanitized molecule the report is on.
+    report : {str: object}
+        The report from untyped_report().
+    n : int = None
+        The number of environments, by default all.
+
+    Returns
+    -------
+    [rdkit.Chem.RWMol]
+        The first example of each environment, with the untyped atom as
+        atom map 1.
+    """
+    neighbors = molecule_neighbors(molecule)
+    result = []
+    for environment in report['environments'][0:n]:
+        i = environment['atoms'][0]
+        mol, center = environment_molecule(molecule, neighbors, i)
+        mol.GetAtomWithIdx(center).SetAtomMapNum(1)
+        result.append(mol)
+    return result
+
+
+def summary(report, n_environments=5, n_atoms=5):
+    """A short text summary of a report on untyped atoms.
+
+    Parameters
+    ----------
+    report : {str: object}
+        The report from untyped_report().
+    n_environments : int = 5
+        The number of environments to list.
+    n_atoms : int = 5
+        The number of atoms to give the index of for each environment.
+
+    Returns
+    -------
+    str
+        The summary.
+    """
+    environments = report['environments']
+    lines = [
+        f"{report['n_untyped']} of {report['n_atoms']} atoms have no atom "
+        f"type, in {len(environments)} distinct environments:"
+    ]
+    for environment in environments[0:n_environments]:
+        atoms = ', '.join(str(i) for i in environment['atoms'][0:n_atoms])
+        if environment['count'] > n_atoms:
+            atoms += ', ...'
+        lines.append(
+            f"    {environment['count']:6d} {environment['element']:<2} "
+            f"atoms like {environment['smiles']}: {atoms}"
+        )
+    if len(environments) > n_environments:
+        lines.append(f'    ... and {len(environments) - n_environments} more')
+    return '\n'.join(lines)
+
+
+def render(molecules, legends, filename):
+    """Draw the environments of untyped atoms in a grid and save it.
+
+    Parameters
+    ----------
+    molecules : [rdkit.Chem.Mol]
+        The environments, with the untyped atom as atom map 1.
+    legends : [str]
+        The caption for each environment.
+    filename : str
+        The image file to write.
+
+    Returns
+    -------
+    str
+        The filename.
+    """
+    import rdkit.Chem.AllChem
+    import rdkit.Chem.Draw
+
+    highlights = []
+    for molecule in molecules:
+        rdkit.Chem.AllChem.Compute2DCoords(molecule)
+        highlights.append(
+            [
+                atom.GetIdx()
+                for atom in molecule.GetAtoms()
+                if atom.GetAtomMapNum() == 1
+            ]
+        )
+    image = rdkit.Chem.Draw.MolsToGridImage(
+        molecules,
+        molsPerRow=min(4, len(molecules)),
+        subImgSize=(300, 300),
+        legends=legends,
+        highlightAtomLists=highlights
+    )
+    image.save(filename)
+    return filename
+
+
+def write_diagnostics(
+    molecule,
+    atom_types,
+    directory='.',
+    basename='missing_atom_types',
+    image=True,
+    background=True
+):
+    """Write the report on untyped atoms and, optionally, draw them.
+
+    The report is written as JSON before returning. The image of the
+    environments is drawn in a background thread unless background is
+    False.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The sanitized molecule.
+    atom_types : [str]
+        The atom types, '?' for untyped atoms.
+    directory : str = '.'
+        The directory for the files.
+    basename : str = 'missing_atom_types'
+        The name of the files, without the extension.
+    image : bool = True
+        Whether to draw the environments to <basename>.png.
+    background : bool = True
+        Whether to draw in a background thread.
+
+    Returns
+    -------
+    ({str: object}, concurrent.futures.Future)
+        The report, from untyped_report(), and a future for the filename
+        of the image, which is None if no image is drawn.
+    """
+    report = untyped_report(molecule, atom_types)
+    # Extract the small molecules now, so the worker does not share the
+    # full molecule with the caller.
+    molecules = None
+    if image:
+        molecules = environment_molecules(molecule, report, max_images)
+    _, future = write_report(
+        report,
+        molecules,
+        directory=directory,
+        basename=basename,
+        background=background
+    )
+    return report, future
+
+
+def write_report(
+    report,
+    molecules=None,
+    directory='.',
+    basename='missing_atom_types',
+    background=True
+):
+    """Write a report on untyped atoms and draw their environments.
+
+    Parameters
+    ----------
+    report : {str: object}
+        The report, from untyped_report() or combine_reports().
+    molecules : [rdkit.Chem.Mol] = None
+        The environments of the report, in order, with the untyped atom
+        as atom map 1, as from environment_molecules(). If None, no image
+        is drawn.
+    directory : str = '.'
+        The directory for the files.
+    basename : str = 'missing_atom_types'
+        The name of the files, without the extension.
+    background : bool = True
+        Whether to draw in a background thread.
+
+    Returns
+    -------
+    (str, concurrent.futures.Future)
+        The filename of the report and a future for the filename of the
+        image, which is None if no image is drawn.
+    """
+    filename = os.path.join(directory, basename + '.json')
+    with open(filename, 'w') as fd:
+        json.dump(report, fd, indent=1)
+    logger.debug(f"Wrote the report on untyped atoms to '{filename}'")
+
+    if molecules is None or report['n_untyped'] == 0:
+        return filename, None
+
+    molecules = molecules[0:max_images]
+    legends = [
+        f"{environment['element']}{environment['atoms'][0] + 1}: "
+        f"{environment['count']} atoms"
+        for environment in report['environments'][0:len(molecules)]
+    ]
+
+    image = os.path.join(directory, basename + '.png')
+    if background:
+        future = _get_executor().submit(render, molecules, legends, image)
+    else:
+        future = concurrent.futures.Future()
+        future.set_result(render(molecules, legends, image))
+    return filename, future
+
+
+def _get_executor():
+    """The single background thread used for drawing."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix='atomtyping-diagnostics'
+            )
+    return _executor
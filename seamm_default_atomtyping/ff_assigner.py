@@ -3,13 +3,15 @@
 """Main class for handling forcefields"""
 
 import logging
-from PIL import ImageTk
+import os
 import rdkit
 import rdkit.Chem
-import rdkit.Chem.Draw
-import rdkit.Chem.AllChem
 import re
-import tkinter as tk
+
+from seamm_default_atomtyping.diagnostics import (
+    summary as diagnostics_summary, write_diagnostics
+)
+from seamm_default_atomtyping.templates import CompiledTemplates
 
 logger = logging.getLogger(__name__)
 # logger.setLevel('DEBUG')
@@ -17,17 +19,37 @@ logger = logging.getLogger(__name__)
 
 class FFAssigner(object):
 
-    def __init__(self, forcefield, have_tk=False):
+    def __init__(self, forcefield, have_tk=False, directory=None):
         """Handle the assignment of the forcefield to the structure
 
         This class is closely related to the Forcefield class, but
         separated from it due to the dependencies it carries along,
         coupled with the fact that it is not needed in some
         computations where the forcefield itself is.
+
+        When atoms cannot be typed, a report grouping them by their local
+        environment is written to missing_atom_types.json and the
+        environments are drawn to missing_atom_types.png in the
+        background. Nothing is displayed unless show_diagnostics() is
+        called, which needs have_tk.
+
+        Parameters
+        ----------
+        forcefield : seamm_ff_util.Forcefield
+            The forcefield.
+        have_tk : bool = False
+            Whether a Tk display is available for show_diagnostics().
+        directory : str = None
+            The directory for the diagnostics, by default the current
+            directory when they are written.
         """
 
         self.forcefield = forcefield
         self.have_tk = have_tk
+        self.directory = directory
+        self.templates = CompiledTemplates.from_forcefield(forcefield)
+        self.untyped_report = None
+        self.diagnostics_image = None
 
     def assign(self, smiles=None, add_hydrogens=True):
         """Assign the atom types to the structure using SMARTS templates
@@ -80,62 +102,56 @@ class FFAssigner(object):
             n_atoms = molecule.GetNumAtoms()
             logger.debug("'{}' has {} atoms".format(smiles, n_atoms))
 
-        atom_types = ['?'] * n_atoms
-        templates = self.forcefield.get_templates()
-        for atom_type in templates:
-            template = templates[atom_type]
-            for smarts in template['smarts']:
-                pattern = rdkit.Chem.MolFromSmarts(smarts)
-
-                ind_map = {}
-                for atom in pattern.GetAtoms():
-                    map_num = atom.GetAtomMapNum()
-                    if map_num:
-                        ind_map[map_num - 1] = atom.GetIdx()
-                map_list = [ind_map[x] for x in sorted(ind_map)]
-
-                matches = molecule.GetSubstructMatches(pattern)
-                logger.debug(atom_type + ': ')
-                if len(matches) > 0:
-                    for match in matches:
-                        atom_ids = [match[x] for x in map_list]
-                        for x in atom_ids:
-                            atom_types[x] = atom_type
-                        tmp = [str(x) for x in atom_ids]
-                        logger.debug('\t' + ', '.join(tmp))
-
-        i = 0
-        untyped = []
-        for atom, atom_type in zip(molecule.GetAtoms(), atom_types):
-            if atom_type == '?':
-                untyped.append(i)
-            logger.debug("{}: {}".format(atom.GetSymbol(), atom_type))
-            i += 1
-
-        if len(untyped) > 0:
+        atom_types = self.templates.assign(molecule)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            for atom, atom_type in zip(molecule.GetAtoms(), atom_types):
+                logger.debug("{}: {}".format(atom.GetSymbol(), atom_type))
+
+        if '?' in atom_types:
+            directory = self.directory
+            if directory is None:
+                directory = os.getcwd()
+            self.untyped_report, self.diagnostics_image = write_diagnostics(
+                molecule, atom_types, directory=directory
+            )
             logger.warning(
-                'The forcefield does not have atom types for'
-                ' the molecule!. See missing_atom_types.png'
+                'The forcefield does not have atom types for the molecule!\n'
+                + diagnostics_summary(self.untyped_report) +
+                '\nSee missing_atom_types.json and missing_atom_types.png'
                 ' for more detail.'
             )
-            rdkit.Chem.AllChem.Compute2DCoords(molecule)
-            img = rdkit.Chem.Draw.MolToImage(
-                molecule,
-                size=(1000, 1000),
-                highlightAtoms=untyped,
-                highlightColor=(0, 1, 0)
-            )
-            img.save('missing_atom_types.png')
-
-            if self.have_tk:
-                root = tk.Tk()
-                root.title('Atom types')
-                tkPI = ImageTk.PhotoImage(img)
-                tkLabel = tk.Label(root, image=tkPI)
-                tkLabel.place(x=0, y=0, width=img.size[0], height=img.size[1])
-                root.geometry('%dx%d' % (img.size))
-                root.mainloop()
         else:
+            self.untyped_report = None
+            self.diagnostics_image = None
             logger.info('The molecule was successfully atom-typed')
 
         return atom_types
+
+    def show_diagnostics(self):
+        """Display the drawing of the untyped atoms from the last assign().
+
+        This waits for the drawing to finish and then runs a Tk window
+        until it is closed, so it is only for interactive use.
+
+        Returns
+        -------
+        bool
+            True if the drawing was displayed, False if there is no Tk
+            display or no drawing.
+        """
+        if not self.have_tk or self.diagnostics_image is None:
+            return False
+
+        from PIL import Image, ImageTk
+        import tkinter as tk
+
+        img = Image.open(self.diagnostics_image.result())
+        root = tk.Tk()
+        root.title('Atom types')
+        tkPI = ImageTk.PhotoImage(img)
+        tkLabel = tk.Label(root, image=tkPI)
+        tkLabel.place(x=0, y=0, width=img.size[0], height=img.size[1])
+        root.geometry('%dx%d' % (img.size))
+        root.mainloop()
+        return True
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""A persistent, on-disk cache of parsed forcefields and their templates.
+
+Parsing a large .frc file is the dominant cost of creating an atom typer,
+so the parsed forcefield and its compiled templates are pickled into a
+cache directory. Only the sections needed for typing are read, from the
+binary form of the file made by frc_binary if it is up to date, or else
+parsed using frc_index, unless the forcefield needs more, when
+seamm.Forcefield parses the whole file. The cache entry is keyed by a
+hash of the contents of the forcefield file and the version of this
+package, so editing the file or upgrading the package simply produces a
+new entry.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+from seamm_default_atomtyping.frc_binary import load_binary, source_hash
+from seamm_default_atomtyping.frc_index import UnsupportedForcefieldError
+from seamm_default_atomtyping.templates import CompiledTemplates
+
+logger = logging.getLogger(__name__)
+
+#: The environment variable that can be used to relocate the cache.
+cache_dir_variable = 'SEAMM_ATOMTYPING_CACHE'
+
+#: The format of the cache entries, changed when what is pickled changes.
+cache_format = 2
+
+
+def default_cache_dir():
+    """The directory for the forcefield cache.
+
+    Returns
+    -------
+    str
+        The value of the environment variable SEAMM_ATOMTYPING_CACHE if it
+        is set, otherwise ~/.seamm/cache/seamm_default_atomtyping
+    """
+    if cache_dir_variable in os.environ:
+        return os.path.expanduser(os.environ[cache_dir_variable])
+    return os.path.join(
+        os.path.expanduser('~'), '.seamm', 'cache', 'seamm_default_atomtyping'
+    )
+
+
+def cache_key(path, version='', digest=None):
+    """The key for a forcefield file in the cache.
+
+    Parameters
+    ----------
+    path : str
+        The path to the forcefield file.
+    version : str
+        The version of the package, which is part of the key so that
+        upgrading invalidates the cache.
+    digest : str = None
+        The SHA-256 hash of the file from source_hash(), if known.
+
+    Returns
+    -------
+    str
+        The hexadecimal SHA-256 digest of the hash of the file, the
+        version and the formats of the cache entries and compiled
+        templates.
+    """
+    if digest is None:
+        digest = source_hash(path)
+    sha = hashlib.sha256()
+    sha.update(digest.encode('utf-8'))
+    sha.update(str(version).encode('utf-8'))
+    sha.update(str(cache_format).encode('utf-8'))
+    sha.update(str(CompiledTemplates.format_version).encode('utf-8'))
+    return sha.hexdigest()
+
+
+def load_forcefield(
+    path, version='', cache_dir=None, use_cache=True, key=None, digest=None
+):
+    """Load a forcefield and its compiled templates, using the cache.
+
+    Parameters
+    ----------
+    path : str
+        The path to the forcefield (.frc) file.
+    version : str
+        The version of the package, used in the cache key.
+    cache_dir : str
+        The directory for the cache. Defaults to default_cache_dir().
+    use_cache : bool
+        If False, parse the file and do not touch the cache.
+    key : str
+        The cache key for the file, if already known.
+    digest : str
+        The SHA-256 hash of the file from source_hash(), if known.
+
+    Returns
+    -------
+    (TypingForcefield or seamm.Forcefield, CompiledTemplates)
+        The forcefield and its compiled templates.
+    """
+    if not use_cache:
+        return _parse(path, digest)
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+
+    if key is None:
+        if digest is None:
+            digest = source_hash(path)
+        key = cache_key(path, version, digest)
+    cache_file = os.path.join(cache_dir, key + '.pkl')
+
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as fd:
+                forcefield, templates = pickle.load(fd)
+            logger.debug(f"Loaded forcefield '{path}' from '{cache_file}'")
+            return forcefield, templates
+        except Exception as e:
+            logger.warning(
+                f"Could not read the cached forcefield '{cache_file}': {e}"
+            )
+
+    forcefield, templates = _parse(path, digest)
+
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file and rename so that concurrent processes
+        # never see a partially written entry.
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(
+                    (forcefield, templates),
+                    fp,
+                    protocol=pickle.HIGHEST_PROTOCOL
+                )
+            os.replace(tmp_file, cache_file)
+        except Exception:
+            os.remove(tmp_file)
+            raise
+        logger.debug(f"Cached forcefield '{path}' in '{cache_file}'")
+    except Exception as e:
+        logger.warning(f"Could not cache the forcefield '{path}': {e}")
+
+    return forcefield, templates
+
+
+def clear_cache(cache_dir=None):
+    """Remove all the entries in the forcefield cache.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory for the cache. Defaults to default_cache_dir().
+
+    Returns
+    -------
+    int
+        The number of entries removed.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return 0
+    n = 0
+    for filename in os.listdir(cache_dir):
+        if filename.endswith('.pkl'):
+            os.remove(os.path.join(cache_dir, filename))
+            n += 1
+    return n
+
+
+def _parse(path, digest=None):
+    """Parse the forcefield file and compile its templates."""
+    try:
+        forcefield = load_binary(path, digest)
+    except UnsupportedForcefieldError as e:
+        logger.debug(f'Parsing all of {path}: {e}')
+        import seamm
+        forcefield = seamm.Forcefield(filename=path)
+    templates = CompiledTemplates.from_forcefield(forcefield)
+    return forcefield, templates
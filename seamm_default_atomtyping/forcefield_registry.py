@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+"""A registry of the forcefield files available for atom typing.
+
+The forcefield files shipped in the package's data directory, and those
+in any directories given by the user, are found when first needed. Only
+the header of each file is read, for the names of its forcefields in the
+'#define' blocks and its version from the last '#version' line, so that
+finding them costs next to nothing. A forcefield is parsed, or loaded
+from the on-disk cache, only when it is first used, and the result is
+shared by every registry, and so every atom typer, in the process that
+uses the same file with the same version of this package.
+"""
+
+import logging
+import os
+import threading
+
+from seamm_default_atomtyping.forcefield_cache import (
+    cache_key, load_forcefield
+)
+from seamm_default_atomtyping.frc_binary import source_hash
+
+logger = logging.getLogger(__name__)
+
+#: The environment variable with further directories of forcefield files,
+#: separated by os.pathsep.
+forcefield_path_variable = 'SEAMM_FORCEFIELD_PATH'
+
+#: The extension of forcefield files.
+forcefield_extension = '.frc'
+
+# The headers of the files already read, keyed by path, modification time
+# and size.
+_headers = {}
+
+# The loaded forcefields and templates, keyed by the forcefield cache key.
+_loaded = {}
+_lock = threading.Lock()
+
+
+def data_dir():
+    """The directory of the forcefield files shipped with the package."""
+    return os.path.join(os.path.dirname(__file__), 'data')
+
+
+def forcefield_dirs(directories=None):
+    """The directories to look for forcefield files in, in order.
+
+    Parameters
+    ----------
+    directories : [str] = None
+        Further directories given by the user.
+
+    Returns
+    -------
+    [str]
+        The given directories, then those in SEAMM_FORCEFIELD_PATH, then
+        the package's data directory.
+    """
+    result = []
+    if directories is not None:
+        result.extend(os.path.expanduser(d) for d in directories)
+    if forcefield_path_variable in os.environ:
+        result.extend(
+            os.path.expanduser(d)
+            for d in os.environ[forcefield_path_variable].split(os.pathsep)
+            if d != ''
+        )
+    result.append(data_dir())
+    return result
+
+
+def read_header(path):
+    """Read the forcefield names and version from the header of a file.
+
+    Reading stops at the first section of parameters after the '#define'
+    blocks, so the rest of the file is never read.
+
+    Parameters
+    ----------
+    path : str
+        The path to the forcefield (.frc) file.
+
+    Returns
+    -------
+    {str: []}
+        The 'path', the 'forcefields' named in the '#define' blocks, in
+        order, and the 'version' from the last '#version' line, or None.
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    if key in _headers:
+        return _headers[key]
+
+    forcefields = []
+    version = None
+    with open(path, 'r', errors='replace') as fd:
+        for line in fd:
+            if not line.startswith('#'):
+                continue
+            words = line.split()
+            if words[0] == '#version':
+                if len(words) > 2:
+                    version = words[2]
+            elif words[0] == '#define':
+                if len(words) > 1:
+                    forcefields.append(words[1])
+            elif words[0] != '#end' and len(forcefields) > 0:
+                # The first section of parameters
+                break
+
+    header = {'path': path, 'forcefields': forcefields, 'version': version}
+    _headers[key] = header
+    return header
+
+
+class ForcefieldRegistry(object):
+
+    def __init__(self, directories=None):
+        """The forcefields in a set of directories, found when first needed.
+
+        Parameters
+        ----------
+        directories : [str] = None
+            Further directories of forcefield files, which take precedence
+            over those in SEAMM_FORCEFIELD_PATH and the package's data
+            directory.
+        """
+        self.directories = forcefield_dirs(directories)
+        self._files = []
+        self._entries = None
+
+    @property
+    def entries(self):
+        """The header of the file of each forcefield, keyed by its name.
+
+        A file can define several forcefields, but only the first, which
+        is the one parsed from the file, is registered. If several files
+        in the directories define the same forcefield, the first found is
+        used, but a file added by add_file() replaces any other.
+        """
+        if self._entries is None:
+            self._entries = self._discover()
+        return self._entries
+
+    def _discover(self):
+        """Read the headers of the forcefield files in the directories."""
+        paths = []
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                logger.debug(
+                    f"The forcefield directory '{directory}' does not exist"
+                )
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith(forcefield_extension):
+                    paths.append(os.path.join(directory, filename))
+
+        entries = {}
+        for path in paths + self._files:
+            try:
+                header = read_header(path)
+            except OSError as e:
+                logger.warning(f"Could not read the forcefield '{path}': {e}")
+                continue
+            if len(header['forcefields']) == 0:
+                logger.debug(f"'{path}' does not define a forcefield")
+                continue
+            name = header['forcefields'][0]
+            if name in entries and path not in self._files:
+                logger.debug(
+                    f"Ignoring the forcefield '{name}' in '{path}', which is "
+                    f"already defined in '{entries[name]['path']}'"
+                )
+                continue
+            entries[name] = header
+        logger.debug(
+            f'Found {len(entries)} forcefields: ' + ', '.join(entries)
+        )
+        return entries
+
+    def add_file(self, path):
+        """Add a forcefield file to the registry.
+
+        Parameters
+        ----------
+        path : str
+            The path to the forcefield (.frc) file.
+
+        Returns
+        -------
+        str
+            The name of the forcefield, from the file's first '#define'.
+        """
+        header = read_header(path)
+        if len(header['forcefields']) == 0:
+            raise ValueError(f"'{path}' does not define a forcefield")
+        name = header['forcefields'][0]
+        if path in self._files:
+            self._files.remove(path)
+        self._files.append(path)
+        # Found again, cheaply, when next needed
+        self._entries = None
+        return name
+
+    def names(self):
+        """The names of the forcefields in the registry."""
+        return list(self.entries)
+
+    def path(self, name):
+        """The path to the file of a forcefield.
+
+        Parameters
+        ----------
+        name : str
+            The name of the forcefield.
+
+        Returns
+        -------
+        str
+            The path to its file.
+        """
+        if name not in self.entries:
+            raise ValueError(
+                f"The forcefield '{name}' is not known. The known "
+                'forcefields are ' + ', '.join(self.entries)
+            )
+        return self.entries[name]['path']
+
+    def load(self, name, version='', cache_dir=None, use_cache=True):
+        """Load a forcefield, sharing it with any other user of its file.
+
+        Parameters
+        ----------
+        name : str
+            The name of the forcefield.
+        version : str
+            The version of the package, as in load_forcefield().
+        cache_dir : str
+            The directory for the on-disk cache, as in load_forcefield().
+        use_cache : bool
+            Whether to use the on-disk cache, as in load_forcefield().
+
+        Returns
+        -------
+        (TypingForcefield or seamm.Forcefield, CompiledTemplates, str)
+            The forcefield, its compiled templates, and its key in the
+            cache, which identifies the file and version. As from
+            load_forcefield(), the forcefield has only the sections needed
+            for typing unless it has a 'charges' section.
+        """
+        path = self.path(name)
+        # The file is read once for the key and to check its binary form
+        digest = source_hash(path)
+        key = cache_key(path, version, digest)
+        with _lock:
+            if key not in _loaded:
+                _loaded[key] = load_forcefield(
+                    path,
+                    version=version,
+                    cache_dir=cache_dir,
+                    use_cache=use_cache,
+                    key=key,
+                    digest=digest
+                )
+            forcefield, templates = _loaded[key]
+        return forcefield, templates, key
+
+
+def clear_loaded():
+    """Forget the forcefields loaded in this process.
+
+    Returns
+    -------
+    int
+        The number of forcefields forgotten.
+    """
+    with _lock:
+        n = len(_loaded)
+        _loaded.clear()
+    return n
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+
+"""A compact binary form of the parts of a forcefield needed for typing.
+
+The atom types, equivalences, bond increments and templates of a .frc
+file are written by write_binary() to a NumPy .npz archive next to it.
+The names of atom types, elements, references and versions are interned
+in one table and the sections are stored as arrays of indices into it
+and of numbers, with the templates as JSON. The archive holds the
+SHA-256 hash of the .frc file it was made from, so that a stale archive
+is detected when loaded and the text is parsed instead. Any other
+section is parsed from the .frc file when first used.
+
+An archive is written by load_binary() whenever it has to parse the
+text, if the directory of the forcefield can be written to. The archives
+of the forcefields in the package are made by 'make binary', and so
+shipped with it, with
+
+    python -m seamm_default_atomtyping.frc_binary pcff2018.frc
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+
+from seamm_default_atomtyping.frc_index import (
+    TypingForcefield, _Forms, typing_forms, version_key
+)
+
+logger = logging.getLogger(__name__)
+
+#: The format of the archives, changed whenever their contents change.
+binary_format = 2
+
+#: The extension of the archives.
+binary_extension = '.ffb'
+
+_equivalence_fields = ('nonbond', 'bond', 'angle', 'torsion', 'oop')
+_auto_fields = (
+    'nonbond', 'bond_increment', 'bond', 'angle_end_atom',
+    'angle_center_atom', 'torsion_end_atom', 'torsion_center_atom',
+    'oop_end_atom', 'oop_center_atom'
+)
+
+
+class StaleBinaryError(ValueError):
+    """The binary forcefield does not match its .frc file."""
+    pass
+
+
+def binary_path(path):
+    """The path of the binary form of a forcefield file."""
+    return os.path.splitext(path)[0] + binary_extension
+
+
+def source_hash(path):
+    """The hexadecimal SHA-256 digest of a file."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for block in iter(lambda: fd.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def write_binary(path, output=None, forcefield=None, digest=None):
+    """Write the binary form of the typing sections of a forcefield file.
+
+    Parameters
+    ----------
+    path : str
+        The path to the forcefield (.frc) file.
+    output : str = None
+        The path for the binary form, by default that of the .frc file
+        with the extension .ffb.
+    forcefield : TypingForcefield = None
+        The forcefield read from the file, if already read. All its
+        sections are parsed and the file is closed.
+    digest : str = None
+        The SHA-256 hash of the file from source_hash(), if known.
+
+    Returns
+    -------
+    str
+        The path of the binary form.
+    """
+    if output is None:
+        output = binary_path(path)
+    if forcefield is None:
+        forcefield = TypingForcefield(path)
+    if digest is None:
+        digest = source_hash(path)
+
+    names = {}
+
+    def intern(name):
+        if name not in names:
+            names[name] = len(names)
+        return names[name]
+
+    def ids(values):
+        return np.array([intern(x) for x in values], dtype=np.int32)
+
+    arrays = {}
+    forms = forcefield.forms
+    if 'atom_types' in forms:
+        data = forcefield.ff['atom_types']
+        arrays['atom_types.type'] = ids(data)
+        values = data.values()
+        arrays['atom_types.mass'] = np.array(
+            [float(p['mass']) for p in values], dtype=np.float64
+        )
+        arrays['atom_types.connections'] = np.array(
+            [int(p['connections']) for p in values], dtype=np.int32
+        )
+        arrays['atom_types.element'] = ids(p['element'] for p in values)
+        arrays['atom_types.reference'] = ids(p['reference'] for p in values)
+        arrays['atom_types.comment'] = np.array(
+            [p['comment'] for p in values], dtype=str
+        )
+    for form, fields in (
+        ('equivalence', _equivalence_fields),
+        ('auto_equivalence', _auto_fields),
+    ):
+        if form in forms:
+            data = forcefield.ff[form]
+            arrays[form + '.type'] = ids(data)
+            arrays[form + '.values'] = np.array(
+                [[intern(p[x]) for x in fields] for p in data.values()],
+                dtype=np.int32
+            ).reshape(-1, len(fields))
+            arrays[form + '.reference'] = ids(
+                p['reference'] for p in data.values()
+            )
+            if form == 'auto_equivalence':
+                arrays[form + '.version'] = ids(
+                    p['version'] for p in data.values()
+                )
+    if 'bond_increments' in forms:
+        data = forcefield.ff['bond_increments']
+        arrays['bond_increments.types'] = np.array(
+            [[intern(i), intern(j)] for i, j in data], dtype=np.int32
+        ).reshape(-1, 2)
+        arrays['bond_increments.deltas'] = np.array(
+            [
+                [float(p['deltaij']), float(p['deltaji'])]
+                for p in data.values()
+            ],
+            dtype=np.float64
+        ).reshape(-1, 2)
+        arrays['bond_increments.reference'] = ids(
+            p['reference'] for p in data.values()
+        )
+        arrays['bond_increments.version'] = ids(
+            p['version'] for p in data.values()
+        )
+    if 'templates' in forms:
+        arrays['templates'] = np.frombuffer(
+            json.dumps(forcefield.ff['templates']).encode('utf-8'),
+            dtype=np.uint8
+        )
+    forcefield.close()
+
+    definition = forcefield.data['forcefield'][forcefield.name]['parameters']
+    meta = {
+        'format': binary_format,
+        'source_hash': digest,
+        'name': forcefield.name,
+        'forcefields': forcefield.data['forcefields'],
+        'definition': {
+            form: list(versions.values())
+            for form, versions in definition.items()
+        },
+        'forms': forms,
+    }
+    arrays['meta'] = np.frombuffer(
+        json.dumps(meta).encode('utf-8'), dtype=np.uint8
+    )
+    arrays['names'] = np.array(list(names), dtype=str)
+
+    # Write to a temporary file and rename so that readers never see a
+    # partially written archive.
+    directory = os.path.dirname(os.path.abspath(output))
+    fd, tmp_file = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez(fp, **arrays)
+        os.replace(tmp_file, output)
+    except Exception:
+        os.remove(tmp_file)
+        raise
+    logger.info(f"Wrote the binary form of '{path}' to '{output}'")
+    return output
+
+
+class BinaryForcefield(TypingForcefield):
+
+    def __init__(self, path, source=None, digest=None):
+        """The typing sections of a forcefield, from its binary form.
+
+        The sections are turned into the same dictionaries as from the
+        text when first used, except that the numbers are floats and
+        integers rather than strings, and only the latest version of
+        each parameter is kept.
+
+        Parameters
+        ----------
+        path : str
+            The path to the binary form, from write_binary().
+        source : str = None
+            The path to the .frc file it was made from. If given, the
+            binary form must have been made from the current contents of
+            the file, otherwise StaleBinaryError is raised. The other
+            sections of the forcefield are parsed from it.
+        digest : str = None
+            The SHA-256 hash of the source from source_hash(), if known.
+        """
+        with np.load(path, allow_pickle=False) as archive:
+            arrays = {key: archive[key] for key in archive.files}
+        meta = json.loads(arrays.pop('meta').tobytes().decode('utf-8'))
+        if meta['format'] != binary_format:
+            raise StaleBinaryError(
+                f"'{path}' has format {meta['format']}, not {binary_format}"
+            )
+        if source is not None and digest is None:
+            digest = source_hash(source)
+        if source is not None and digest != meta['source_hash']:
+            raise StaleBinaryError(
+                f"'{path}' was not made from the current '{source}'"
+            )
+
+        self.path = path if source is None else source
+        self._source = source
+        self._index = None
+        self.name = meta['name']
+        self.data = {
+            'forcefields': meta['forcefields'],
+            'forcefield': {
+                self.name: {
+                    'parameters': {
+                        form: {
+                            version_key(x['version']): x
+                            for x in versions
+                        }
+                        for form, versions in meta['definition'].items()
+                    }
+                }
+            },
+        }
+        self.forms = meta['forms']
+        self._names = arrays.pop('names').tolist()
+        self._arrays = arrays
+        self.ff = _Forms(self)
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.pop('_arrays', None)
+        state.pop('_names', None)
+        return state
+
+    def close(self):
+        """Build the sections for typing if not yet used, and forget the
+        arrays."""
+        super().close()
+        self._parse_typing()
+        self._arrays = {}
+
+    def _parse_form(self, form):
+        """Build the parameters of a functional form from the arrays."""
+        if form not in typing_forms:
+            if self._source is None:
+                raise KeyError(
+                    f"'{form}' is not in '{self.path}' and there is no "
+                    "forcefield file to parse it from"
+                )
+            return super()._parse_form(form)
+
+        names = self._names
+        arrays = self._arrays
+
+        def column(name):
+            return [names[i] for i in arrays[name].tolist()]
+
+        if form == 'templates':
+            return json.loads(arrays['templates'].tobytes().decode('utf-8'))
+
+        result = {}
+        if form == 'atom_types':
+            for t, mass, connections, element, reference, comment in zip(
+                column('atom_types.type'), arrays['atom_types.mass'].tolist(),
+                arrays['atom_types.connections'].tolist(),
+                column('atom_types.element'),
+                column('atom_types.reference'),
+                arrays['atom_types.comment'].tolist()
+            ):
+                result[t] = {
+                    'reference': reference,
+                    'mass': mass,
+                    'element': element,
+                    'connections': connections,
+                    'comment': comment,
+                }
+        elif form in ('equivalence', 'auto_equivalence'):
+            fields = (
+                _equivalence_fields
+                if form == 'equivalence' else _auto_fields
+            )
+            versions = (
+                column(form + '.version')
+                if form == 'auto_equivalence' else None
+            )
+            for k, (t, values, reference) in enumerate(
+                zip(
+                    column(form + '.type'), arrays[form + '.values'].tolist(),
+                    column(form + '.reference')
+                )
+            ):
+                parameters = {'reference': reference}
+                if versions is not None:
+                    parameters['version'] = versions[k]
+                parameters.update(zip(fields, (names[i] for i in values)))
+                result[t] = parameters
+        elif form == 'bond_increments':
+            for (i, j), (deltaij, deltaji), reference, version in zip(
+                arrays['bond_increments.types'].tolist(),
+                arrays['bond_increments.deltas'].tolist(),
+                column('bond_increments.reference'),
+                column('bond_increments.version')
+            ):
+                result[(names[i], names[j])] = {
+                    'reference': reference,
+                    'version': version,
+                    'deltaij': deltaij,
+                    'deltaji': deltaji,
+                }
+        else:
+            raise KeyError(form)
+        return result
+
+
+def load_binary(path, digest=None, write=True):
+    """Load the typing sections of a forcefield, from its binary form if
+    that is up to date, otherwise from the text.
+
+    Parameters
+    ----------
+    path : str
+        The path to the forcefield (.frc) file.
+    digest : str = None
+        The SHA-256 hash of the file from source_hash(), if known.
+    write : bool = True
+        Whether to write the binary form if the text is parsed. Failures,
+        such as a directory that cannot be written to, are ignored.
+
+    Returns
+    -------
+    TypingForcefield
+        The forcefield.
+    """
+    binary = binary_path(path)
+    if os.path.exists(binary):
+        if digest is None:
+            digest = source_hash(path)
+        try:
+            return BinaryForcefield(binary, source=path, digest=digest)
+        except StaleBinaryError as e:
+            logger.warning(f'Parsing the forcefield file because {e}')
+        except Exception as e:
+            logger.warning(
+                f"Parsing the forcefield file because '{binary}' could not "
+                f'be read: {e}'
+            )
+    forcefield = TypingForcefield(path)
+    if write:
+        try:
+            write_binary(path, forcefield=forcefield, digest=digest)
+        except Exception as e:
+            logger.debug(f"Could not write the binary form of '{path}': {e}")
+    return forcefield
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Write the binary form of forcefield files for typing.'
+    )
+    parser.add_argument('files', nargs='+', help='The .frc files')
+    parser.add_argument(
+        '--output',
+        help='The binary file, if just one forcefield file is given'
+    )
+    args = parser.parse_args(argv)
+    if args.output is not None and len(args.files) > 1:
+        parser.error('--output needs exactly one forcefield file')
+
+    for path in args.files:
+        output = write_binary(path, args.output)
+        print(
+            f'{path} ({os.path.getsize(path)} bytes) -> {output} '
+            f'({os.path.getsize(output)} bytes)'
+        )
+
+
+if __name__ == '__main__':
+    main()
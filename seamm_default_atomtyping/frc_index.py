@@ -0,0 +1,528 @@
+# -*- coding: utf-8 -*-
+
+"""Lazy reading of the sections of a forcefield, as they are needed.
+
+Typing and the charges from bond increments need only the atom types,
+equivalences, bond increments and templates, a small part of a .frc file
+that is mostly the parameters of the class II cross terms. The file is
+memory-mapped and scanned once for the byte offsets of the '#section
+label' lines that start each section, and a section is decoded and parsed
+only when first used. The sections for typing are parsed here, so typing
+needs neither SEAMM nor the forcefield utilities, whose import is itself
+a large part of the cost of parsing the whole file. Any other section is
+parsed when first used by the parser of the forcefield utilities for it.
+
+The parsed parameters are the same as those of seamm.Forcefield, which
+is used instead for files whose forcefield takes charges from a
+'charges' section, as this reader does not handle them.
+"""
+
+import json
+import logging
+import mmap
+import re
+
+logger = logging.getLogger(__name__)
+
+#: The functional forms that typing and the charges need.
+typing_forms = (
+    'atom_types', 'equivalence', 'auto_equivalence', 'bond_increments',
+    'templates'
+)
+
+# A line starting a section, or closing one, and its label
+_section_line = re.compile(rb'^#(\S+)[ \t]*(\S*)', re.MULTILINE)
+
+
+class UnsupportedForcefieldError(ValueError):
+    """The forcefield needs sections that are not read lazily."""
+    pass
+
+
+def version_key(version):
+    """A key ordering versions such as '2.1' and '2020.10.5' numerically."""
+    try:
+        return tuple(int(x) for x in version.split('.'))
+    except ValueError:
+        return (version,)
+
+
+def scan_sections(buffer):
+    """Find the byte offsets of the sections of a forcefield file.
+
+    Parameters
+    ----------
+    buffer : bytes or mmap.mmap
+        The contents of the file.
+
+    Returns
+    -------
+    [(str, str, int, int)]
+        The name and label of each section, the offset of the line after
+        the one starting it, and the offset of the next '#' line, which
+        ends it. The '#version' and '#end' lines are not sections.
+    """
+    result = []
+    matches = list(_section_line.finditer(buffer))
+    for k, match in enumerate(matches):
+        section = match.group(1).decode('ascii', errors='replace')
+        if section in ('version', 'end'):
+            continue
+        label = match.group(2).decode('ascii', errors='replace')
+        start = buffer.find(b'\n', match.end())
+        start = len(buffer) if start < 0 else start + 1
+        end = matches[k + 1].start() if k + 1 < len(matches) else len(buffer)
+        result.append((section, label, start, max(start, end)))
+    return result
+
+
+class FrcIndex(object):
+
+    def __init__(self, path):
+        """The index of the sections of a forcefield file.
+
+        Parameters
+        ----------
+        path : str
+            The path to the forcefield (.frc) file.
+
+        Attributes
+        ----------
+        sections : {(str, str): (int, int)}
+            The start and end offsets of each section, keyed by its name
+            and label.
+        defines : [str]
+            The names of the forcefields defined, in order.
+        """
+        self.path = path
+        with open(path, 'rb') as fd:
+            try:
+                self._buffer = mmap.mmap(
+                    fd.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError:
+                # An empty file cannot be mapped
+                self._buffer = b''
+        self.sections = {}
+        self.defines = []
+        for section, label, start, end in scan_sections(self._buffer):
+            if (section, label) in self.sections:
+                raise RuntimeError(
+                    f"'{label}' already defined in section '{section}' of "
+                    f"'{path}'"
+                )
+            self.sections[(section, label)] = (start, end)
+            if section == 'define':
+                self.defines.append(label)
+
+    def close(self):
+        """Unmap the file."""
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._buffer = b''
+
+    def lines(self, section, label):
+        """The lines of data of a section.
+
+        As in the Biosym reader, blank lines, comments ('!'), annotations
+        ('>') and modifiers ('@') are skipped, and each line is stripped.
+
+        Parameters
+        ----------
+        section : str
+            The name of the section, e.g. 'atom_types'.
+        label : str
+            Its label, e.g. 'cff91'.
+
+        Returns
+        -------
+        [str]
+            The lines, or None if the file has no such section.
+        """
+        result = self.read(section, label)
+        return None if result is None else result['lines']
+
+    def read(self, section, label):
+        """The body of a section, as read by the Biosym reader.
+
+        Parameters
+        ----------
+        section : str
+            The name of the section, e.g. 'quartic_bond'.
+        label : str
+            Its label, e.g. 'cff91'.
+
+        Returns
+        -------
+        {str: [str]}
+            The 'comments', 'annotations', 'modifiers' and 'lines' of
+            data of the section, without their leading '!', '>' or '@',
+            or None if the file has no such section.
+        """
+        if (section, label) not in self.sections:
+            return None
+        start, end = self.sections[(section, label)]
+        text = self._buffer[start:end].decode('utf-8', errors='replace')
+        result = {
+            'comments': [],
+            'lines': [],
+            'annotations': [],
+            'modifiers': []
+        }
+        for line in text.splitlines():
+            line = line.strip()
+            if line == '':
+                continue
+            if line[0] == '!':
+                result['comments'].append(line[1:])
+            elif line[0] == '>':
+                result['annotations'].append(line[1:])
+            elif line[0] == '@' and not line.lower().startswith('@bibtex'):
+                result['modifiers'].append(line[1:])
+            else:
+                result['lines'].append(line)
+        return result
+
+
+def _parse_atom_types(lines):
+    result = {}
+    for line in lines:
+        words = line.split()
+        version, reference, atom_type, mass, element, connections = words[0:6]
+        result.setdefault(atom_type, []).append(
+            (
+                version, {
+                    'reference': reference,
+                    'mass': mass,
+                    'element': element,
+                    'connections': connections,
+                    'comment': ' '.join(words[6:]),
+                }
+            )
+        )
+    return result
+
+
+def _parse_equivalence(lines):
+    result = {}
+    for line in lines:
+        version, reference, atom_type, nonbond, bond, angle, torsion, oop = (
+            line.split()
+        )
+        result.setdefault(atom_type, []).append(
+            (
+                version, {
+                    'reference': reference,
+                    'nonbond': nonbond,
+                    'bond': bond,
+                    'angle': angle,
+                    'torsion': torsion,
+                    'oop': oop,
+                }
+            )
+        )
+    return result
+
+
+_auto_fields = (
+    'nonbond', 'bond_increment', 'bond', 'angle_end_atom',
+    'angle_center_atom', 'torsion_end_atom', 'torsion_center_atom',
+    'oop_end_atom', 'oop_center_atom'
+)
+
+
+def _parse_auto_equivalence(lines):
+    result = {}
+    for line in lines:
+        words = line.split()
+        if len(words) != 3 + len(_auto_fields):
+            raise ValueError(f"Bad line in auto_equivalence: '{line}'")
+        version, reference, atom_type = words[0:3]
+        parameters = {'reference': reference, 'version': version}
+        parameters.update(zip(_auto_fields, words[3:]))
+        result.setdefault(atom_type, []).append((version, parameters))
+    return result
+
+
+def _parse_bond_increments(lines):
+    result = {}
+    for line in lines:
+        version, reference, i, j, deltaij, deltaji = line.split()
+        # order canonically, i<j
+        if i > j:
+            i, j = j, i
+            deltaij, deltaji = deltaji, deltaij
+        result.setdefault((i, j), []).append(
+            (
+                version, {
+                    'reference': reference,
+                    'version': version,
+                    'deltaij': deltaij,
+                    'deltaji': deltaji,
+                }
+            )
+        )
+    return result
+
+
+def _parse_templates(lines):
+    result = {}
+    for atom_type, versions in json.loads('\n'.join(lines)).items():
+        result[atom_type] = list(versions.items())
+    return result
+
+
+_parsers = {
+    'atom_types': _parse_atom_types,
+    'equivalence': _parse_equivalence,
+    'auto_equivalence': _parse_auto_equivalence,
+    'bond_increments': _parse_bond_increments,
+    'templates': _parse_templates,
+}
+
+
+def _parse_other(form, label, data):
+    """Parse any other section with the forcefield utilities.
+
+    The parser is the one seamm.Forcefield uses for the section, so the
+    parameters are the same, including any conversion of units.
+
+    Parameters
+    ----------
+    form : str
+        The functional form, e.g. 'quartic_bond'.
+    label : str
+        The label of the section, e.g. 'cff91'.
+    data : {str: [str]}
+        The body of the section, from FrcIndex.read().
+
+    Returns
+    -------
+    {tuple: [(str, {})]}
+        The versions of the parameters of each key.
+    """
+    import seamm_ff_util
+    from seamm_ff_util.metadata import metadata
+
+    parser = seamm_ff_util.Forcefield()
+    data = dict(data, section=form, label=label, priority=0)
+    if 'nonbond' in form:
+        method = parser._parse_biosym_nonbonds
+    elif hasattr(parser, '_parse_biosym_' + form):
+        method = getattr(parser, '_parse_biosym_' + form)
+    elif form in metadata:
+        method = parser._parse_biosym_section
+    else:
+        raise KeyError(f"There is no parser for the section '#{form}'")
+    method(data)
+    return {
+        key: [(str(version), value) for version, value in versions.items()]
+        for key, versions in data.get('parameters', {}).items()
+    }
+
+
+class _Forms(dict):
+    """The parameters of each functional form, parsed when first used."""
+
+    def __init__(self, forcefield):
+        super().__init__()
+        self._forcefield = forcefield
+
+    def __contains__(self, form):
+        return (
+            super().__contains__(form) or form in self._forcefield.forms
+        )
+
+    def __missing__(self, form):
+        if form not in self._forcefield.forms:
+            raise KeyError(form)
+        value = self._forcefield._parse_form(form)
+        self[form] = value
+        return value
+
+
+class TypingForcefield(object):
+
+    def __init__(self, path, name=None):
+        """A forcefield whose sections are parsed when first used.
+
+        UnsupportedForcefieldError is raised for a forcefield with a
+        'charges' section, which must be read with seamm.Forcefield.
+
+        Parameters
+        ----------
+        path : str
+            The path to the forcefield (.frc) file.
+        name : str = None
+            The forcefield, by default the first defined in the file.
+
+        Attributes
+        ----------
+        data : {str: {}}
+            The definition of the forcefield, as in seamm.Forcefield, under
+            data['forcefield'][name]['parameters'].
+        forms : {str: [str]}
+            The labels of the sections of each functional form, from the
+            latest version of the definition.
+        ff : {str: {}}
+            The parameters of each functional form, with the latest
+            version of each, parsed when first used.
+        """
+        self.path = path
+        self._index = FrcIndex(path)
+        if name is None:
+            if len(self._index.defines) == 0:
+                raise ValueError(f"'{path}' does not define a forcefield")
+            name = self._index.defines[0]
+        self.name = name
+
+        definition = {}
+        lines = self._index.lines('define', name)
+        if lines is None:
+            raise ValueError(f"'{path}' does not define '{name}'")
+        for line in lines:
+            words = line.split()
+            if len(words) < 4:
+                logger.error(
+                    f"In a define section for {name}, the line is too short:"
+                )
+                logger.error('    ' + line)
+                continue
+            version, reference, form = words[0:3]
+            definition.setdefault(form, {})[version_key(version)] = {
+                'version': version,
+                'reference': reference,
+                'sections': words[3:],
+            }
+        self.data = {
+            'forcefields': list(self._index.defines),
+            'forcefield': {
+                name: {
+                    'parameters': definition
+                }
+            },
+        }
+
+        if 'charges' in definition:
+            self._index.close()
+            raise UnsupportedForcefieldError(
+                f"The forcefield '{name}' has charges, which are not read "
+                "lazily"
+            )
+        self.forms = {}
+        for form, versions in definition.items():
+            self.forms[form] = versions[max(versions)]['sections']
+        self.ff = _Forms(self)
+
+    def __getstate__(self):
+        """Parse the sections for typing, so that typing needs no file when
+        pickled. The file is read again for any other section."""
+        self._parse_typing()
+        state = self.__dict__.copy()
+        state['ff'] = dict(self.ff)
+        state['_index'] = None
+        return state
+
+    def __setstate__(self, state):
+        parsed = state.pop('ff')
+        self.__dict__.update(state)
+        self.ff = _Forms(self)
+        self.ff.update(parsed)
+
+    def close(self):
+        """Unmap the file, parsing the sections for typing if not yet
+        parsed. The file is mapped again for any other section."""
+        if self._index is not None:
+            self._parse_typing()
+            self._index.close()
+            self._index = None
+
+    def _parse_typing(self):
+        """Parse the sections needed for typing."""
+        for form in typing_forms:
+            if form in self.forms:
+                self.ff[form]
+
+    def _parse_form(self, form):
+        """Parse the sections of a functional form, as seamm.Forcefield."""
+        logger.debug(f"Parsing '{form}' from '{self.path}'")
+        if self._index is None:
+            self._index = FrcIndex(self.path)
+        result = {}
+        for label in self.forms[form]:
+            optional = label.endswith(':optional')
+            if optional:
+                label = label[:-9]
+            data = self._index.read(form, label)
+            if data is None:
+                if optional:
+                    continue
+                raise KeyError(
+                    f"The section '#{form} {label}' is not in '{self.path}'"
+                )
+            if form in _parsers:
+                parsed = _parsers[form](data['lines'])
+            else:
+                parsed = _parse_other(form, label, data)
+            for key, versions in parsed.items():
+                keys = [version_key(version) for version, _ in versions]
+                if len(set(keys)) != len(keys):
+                    raise RuntimeError(
+                        f"'{key}' defined more than once in section "
+                        f"'{form}'!"
+                    )
+                # The latest version of each parameter
+                latest = max(range(len(keys)), key=keys.__getitem__)
+                result[key] = versions[latest][1]
+        return result
+
+    def get_templates(self):
+        """The templates, keyed by atom type."""
+        if 'templates' in self.ff:
+            return self.ff['templates']
+        else:
+            return {}
+
+    def charges(self, i):
+        """The charge of an atom type, which is zero without a 'charges'
+        section, as in seamm.Forcefield."""
+        return ('default', ('*',), 'charges', {'Q': 0.0})
+
+    def bond_increments(self, i, j):
+        """The bond increments of two atom types, as in seamm.Forcefield.
+
+        Automatic equivalences are used if there are no explicit ones.
+        """
+        key, flipped = (i, j), False
+        if i > j:
+            key, flipped = (j, i), True
+        if key in self.ff['bond_increments']:
+            parameters = dict(self.ff['bond_increments'][key])
+            if flipped:
+                parameters['deltaij'], parameters['deltaji'] = (
+                    parameters['deltaji'], parameters['deltaij']
+                )
+            return ('explicit', key, 'bond_increments', parameters)
+
+        if self._have_equivalences('auto_equivalence', i, j):
+            iauto = self.ff['auto_equivalence'][i]['bond_increment']
+            jauto = self.ff['auto_equivalence'][j]['bond_increment']
+            key, flipped = (iauto, jauto), False
+            if iauto > jauto:
+                key, flipped = (jauto, iauto), True
+            if key in self.ff['bond_increments']:
+                parameters = dict(self.ff['bond_increments'][key])
+                if flipped:
+                    parameters['deltaij'], parameters['deltaji'] = (
+                        parameters['deltaji'], parameters['deltaij']
+                    )
+                return ('automatic', key, 'bond_increments', parameters)
+
+        raise RuntimeError('No bond increments for {}-{}'.format(i, j))
+
+    def _have_equivalences(self, table, *types):
+        """Whether an equivalence table has an entry for all the types."""
+        if table not in self.ff:
+            return False
+        known = self.ff[table]
+        return all(x in known for x in types if x is not None)
@@ -0,0 +1,873 @@
+# -*- coding: utf-8 -*-
+
+"""Build RDKit molecules directly from SEAMM configurations."""
+
+import logging
+
+import rdkit
+import rdkit.Chem
+
+from seamm_default_atomtyping.periodic import symop_offset
+
+logger = logging.getLogger(__name__)
+
+bond_types = {
+    1: rdkit.Chem.BondType.SINGLE,
+    2: rdkit.Chem.BondType.DOUBLE,
+    3: rdkit.Chem.BondType.TRIPLE,
+    5: rdkit.Chem.BondType.AROMATIC,
+}
+
+# The contribution of each bond order to the valence of its atoms.
+bond_valence = {1: 1.0, 2: 2.0, 3: 3.0, 5: 1.5}
+
+# The formal charge for elements where it follows unambiguously from the
+# valence, keyed by atomic number and then valence.
+formal_charges = {
+    5: {4: -1},
+    7: {2: -1, 4: 1},
+    8: {1: -1, 3: 1},
+}
+
+
+def configuration_to_graph(configuration):
+    """Extract the molecular graph of a configuration.
+
+    The graph is a plain dictionary, so unlike the configuration itself it
+    can be pickled and sent to other processes.
+
+    Parameters
+    ----------
+    configuration : molsystem.Configuration
+        The configuration.
+
+    Returns
+    -------
+    {str: []}
+        The atomic numbers in 'atomic_numbers', the bonds as tuples of
+        (i, j, bond order) with zero-based atom indices in 'bonds', and
+        the formal charges, or None if the configuration does not have
+        them, in 'formal_charges'. For periodic configurations the cell
+        offset of the second atom of each bond relative to the first is
+        in 'offsets'; otherwise it is None.
+    """
+    atoms = configuration.atoms
+    index = {atom_id: i for i, atom_id in enumerate(atoms.ids)}
+    periodic = configuration.periodicity != 0
+
+    if 'formal_charge' in atoms:
+        formal_charges = atoms.get_column_data('formal_charge')
+    else:
+        formal_charges = None
+
+    bonds = []
+    offsets = [] if periodic else None
+    if configuration.bonds.n_bonds > 0:
+        columns = [
+            configuration.bonds.get_column_data('i'),
+            configuration.bonds.get_column_data('j'),
+            configuration.bonds.get_column_data('bondorder'),
+        ]
+        if periodic:
+            columns.append(configuration.bonds.get_column_data('symop1'))
+            columns.append(configuration.bonds.get_column_data('symop2'))
+        for i, j, order, *symops in zip(*columns):
+            if order is not None and order <= 0:
+                continue
+            bonds.append((index[i], index[j], order))
+            if periodic:
+                offset_i = symop_offset(symops[0])
+                offset_j = symop_offset(symops[1])
+                offsets.append(
+                    tuple(b - a for a, b in zip(offset_i, offset_j))
+                )
+
+    return {
+        'atomic_numbers': atoms.atomic_numbers,
+        'bonds': bonds,
+        'formal_charges': formal_charges,
+        'offsets': offsets,
+    }
+
+
+def configuration_to_molecule(configuration):
+    """Create an RDKit molecule from the atoms and bonds of a configuration.
+
+    The atoms of the molecule are in the same order as those in the
+    configuration, and every hydrogen atom is an explicit atom, so the
+    atom types found for the molecule apply directly to the
+    configuration without any remapping.
+
+    Parameters
+    ----------
+    configuration : molsystem.Configuration
+        The configuration to convert.
+
+    Returns
+    -------
+    rdkit.Chem.RWMol
+        The sanitized molecule.
+    """
+    return graph_to_molecule(configuration_to_graph(configuration))
+
+
+def graph_to_molecule(graph, max_ring_size=None):
+    """Create an RDKit molecule from a molecular graph.
+
+    By default the molecule is fully sanitized, which finds the smallest
+    set of smallest rings. That can take time and memory growing faster
+    than the size of the system for network solids, which have rings
+    everywhere. With max_ring_size only the smallest rings through each
+    atom up to that size are found, directly on the graph, and
+    aromaticity is perceived separately for each system of fused small
+    rings, so the cost grows linearly with the size of the system.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+    max_ring_size : int = None
+        If given, the largest ring to find.
+
+    Returns
+    -------
+    rdkit.Chem.RWMol
+        The sanitized molecule.
+    """
+    atomic_numbers = graph['atomic_numbers']
+    charges = graph['formal_charges']
+    if charges is None:
+        charges = graph_formal_charges(graph)
+
+    molecule = rdkit.Chem.RWMol()
+    for atno, charge in zip(atomic_numbers, charges):
+        atom = rdkit.Chem.Atom(atno)
+        atom.SetNoImplicit(True)
+        if charge is not None and charge != 0:
+            atom.SetFormalCharge(int(charge))
+        molecule.AddAtom(atom)
+
+    for iatom, jatom, order in graph['bonds']:
+        bond_type = bond_types.get(order, rdkit.Chem.BondType.SINGLE)
+        molecule.AddBond(iatom, jatom, bond_type)
+
+    if max_ring_size is None:
+        _sanitize(molecule)
+        return molecule
+
+    neighbors = graph_neighbors(graph)
+    rings = small_rings(neighbors, max_ring_size)
+    _set_aromaticity(molecule, graph, rings)
+    _sanitize(
+        molecule,
+        rdkit.Chem.SanitizeFlags.SANITIZE_ALL ^
+        rdkit.Chem.SanitizeFlags.SANITIZE_SYMMRINGS ^
+        rdkit.Chem.SanitizeFlags.SANITIZE_KEKULIZE ^
+        rdkit.Chem.SanitizeFlags.SANITIZE_SETAROMATICITY
+    )
+
+    # Sanitizing clears the rings, so they are added afterwards. An empty
+    # ring marks the ring information as found when there are no rings.
+    bond_index = {}
+    for k, (i, j, _) in enumerate(graph['bonds']):
+        bond_index[(i, j) if i < j else (j, i)] = k
+    ring_info = molecule.GetRingInfo()
+    if len(rings) == 0:
+        ring_info.AddRing([], [])
+    for ring in rings:
+        bonds = []
+        for i, j in zip(ring, ring[1:] + ring[0:1]):
+            bonds.append(bond_index[(i, j) if i < j else (j, i)])
+        ring_info.AddRing(ring, bonds)
+
+    return molecule
+
+
+def _sanitize(molecule, flags=rdkit.Chem.SanitizeFlags.SANITIZE_ALL):
+    """Sanitize a molecule, relaxing the checks if it fails."""
+    try:
+        rdkit.Chem.SanitizeMol(molecule, sanitizeOps=flags)
+    except Exception as e:
+        logger.warning(f'Could not fully sanitize the molecule: {e}')
+        flags &= ~(
+            rdkit.Chem.SanitizeFlags.SANITIZE_PROPERTIES |
+            rdkit.Chem.SanitizeFlags.SANITIZE_KEKULIZE
+        )
+        rdkit.Chem.SanitizeMol(molecule, sanitizeOps=flags)
+
+
+def _set_aromaticity(molecule, graph, rings):
+    """Perceive the aromaticity of the small ring systems of a molecule.
+
+    Each system of fused rings containing double or aromatic bonds is
+    extracted with its immediate neighbors and fully sanitized on its
+    own. The resulting aromaticity and bond types are copied back to the
+    molecule.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.RWMol
+        The unsanitized molecule built from the graph.
+    graph : {str: []}
+        The graph.
+    rings : [[int]]
+        The small rings, from small_rings().
+
+    Returns
+    -------
+    None
+    """
+    neighbors = graph_bond_orders(graph)
+    candidates = []
+    for ring in rings:
+        for i, j in zip(ring, ring[1:] + ring[0:1]):
+            if neighbors[i][j] in (2, 5):
+                candidates.append(ring)
+                break
+    if len(candidates) == 0:
+        return
+
+    # Group the rings sharing a bond, i.e. two atoms, into fused systems
+    parent = list(range(len(candidates)))
+
+    def find(k):
+        while parent[k] != k:
+            parent[k] = parent[parent[k]]
+            k = parent[k]
+        return k
+
+    owners = {}
+    for k, ring in enumerate(candidates):
+        for i, j in zip(ring, ring[1:] + ring[0:1]):
+            key = (i, j) if i < j else (j, i)
+            if key in owners:
+                parent[find(k)] = find(owners[key])
+            else:
+                owners[key] = k
+    systems = {}
+    for k, ring in enumerate(candidates):
+        systems.setdefault(find(k), set()).update(ring)
+
+    formal_charges = graph_formal_charges(graph)
+    for atoms in systems.values():
+        region = atoms_within(neighbors, atoms, 1)
+        indices, subgraph = extract_subgraph(
+            graph, neighbors, region, formal_charges
+        )
+        local = {i: k for k, i in enumerate(indices)}
+        submol = graph_to_molecule(subgraph)
+        for i in atoms:
+            molecule.GetAtomWithIdx(i).SetIsAromatic(
+                submol.GetAtomWithIdx(local[i]).GetIsAromatic()
+            )
+            for j in neighbors[i]:
+                if j > i and j in atoms:
+                    sub_bond = submol.GetBondBetweenAtoms(local[i], local[j])
+                    bond = molecule.GetBondBetweenAtoms(i, j)
+                    bond.SetBondType(sub_bond.GetBondType())
+                    bond.SetIsAromatic(sub_bond.GetIsAromatic())
+
+
+def graph_formal_charges(graph):
+    """The formal charges of the atoms of a graph.
+
+    Charges given in the graph are used as they are. Otherwise they are
+    found from the valence of the atoms, which needs all their bonds, so
+    they must be found before taking part of a graph.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Returns
+    -------
+    [int]
+        The formal charge of each atom.
+    """
+    atomic_numbers = graph['atomic_numbers']
+    charges = graph['formal_charges']
+    if charges is not None:
+        return [0 if q is None else int(q) for q in charges]
+
+    valences = [0.0] * len(atomic_numbers)
+    for i, j, order in graph['bonds']:
+        valence = bond_valence.get(order, 1.0)
+        valences[i] += valence
+        valences[j] += valence
+
+    result = []
+    for atno, valence in zip(atomic_numbers, valences):
+        if atno in formal_charges:
+            result.append(formal_charges[atno].get(round(valence), 0))
+        else:
+            result.append(0)
+    return result
+
+
+def molecule_bonds(molecule):
+    """The bonds of an RDKit molecule as pairs of atom indices.
+
+    The bonds are found from the neighbors of each atom because stepping
+    through Mol.GetBonds() takes time proportional to the square of the
+    number of bonds.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The molecule.
+
+    Returns
+    -------
+    [(int, int)]
+        The indices of the two atoms of each bond, the lower first.
+    """
+    result = []
+    for atom in molecule.GetAtoms():
+        i = atom.GetIdx()
+        for neighbor in atom.GetNeighbors():
+            j = neighbor.GetIdx()
+            if j > i:
+                result.append((i, j))
+    return result
+
+
+def connected_components(graph):
+    """Split a molecular graph into its connected components.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Returns
+    -------
+    [[int]]
+        The indices of the atoms in each component, in increasing order.
+        The components are ordered by their first atom.
+    """
+    n_atoms = len(graph['atomic_numbers'])
+    parent = list(range(n_atoms))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j, _ in graph['bonds']:
+        root_i = find(i)
+        root_j = find(j)
+        if root_i != root_j:
+            if root_i < root_j:
+                parent[root_j] = root_i
+            else:
+                parent[root_i] = root_j
+
+    components = {}
+    for i in range(n_atoms):
+        components.setdefault(find(i), []).append(i)
+    return list(components.values())
+
+
+def split_graph(graph):
+    """Split a molecular graph into the graphs of its components.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Returns
+    -------
+    [([int], {str: []})]
+        For each connected component, the indices of its atoms in the
+        full graph and the graph of the component, with the atoms in the
+        same relative order.
+    """
+    return list(iter_split_graph(graph))
+
+
+def iter_split_graph(graph):
+    """Split a molecular graph into its components one at a time.
+
+    Only the graph of the current component is held, so this is the way
+    to walk the components of a very large system.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Yields
+    ------
+    ([int], {str: []})
+        For each connected component, the indices of its atoms in the
+        full graph and the graph of the component, with the atoms in the
+        same relative order.
+    """
+    components = connected_components(graph)
+
+    owner = [None] * len(graph['atomic_numbers'])
+    local = [None] * len(owner)
+    for n, atoms in enumerate(components):
+        for k, i in enumerate(atoms):
+            owner[i] = n
+            local[i] = k
+
+    bonds = [[] for _ in components]
+    for i, j, order in graph['bonds']:
+        bonds[owner[i]].append((local[i], local[j], order))
+
+    atomic_numbers = graph['atomic_numbers']
+    charges = graph['formal_charges']
+    for atoms, component_bonds in zip(components, bonds):
+        subgraph = {
+            'atomic_numbers': [atomic_numbers[i] for i in atoms],
+            'bonds': component_bonds,
+            'formal_charges': (
+                None if charges is None else [charges[i] for i in atoms]
+            ),
+        }
+        yield atoms, subgraph
+
+
+def extract_subgraph(graph, neighbors, atoms, formal_charges):
+    """Extract the graph of some of the atoms of a graph.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+    neighbors : [{int: int}]
+        The bond order to each bonded neighbor of each atom.
+    atoms : iterable(int)
+        The indices of the atoms to extract.
+    formal_charges : [int]
+        The formal charges of all the atoms, from graph_formal_charges(),
+        which are kept so that atoms that lose bonds keep their charge.
+
+    Returns
+    -------
+    ([int], {str: []})
+        The indices of the atoms in the full graph, in increasing order,
+        and the graph of just those atoms and the bonds between them.
+    """
+    indices = sorted(atoms)
+    local = {i: k for k, i in enumerate(indices)}
+    atomic_numbers = graph['atomic_numbers']
+    bonds = []
+    for k, i in enumerate(indices):
+        for j, order in neighbors[i].items():
+            if j > i and j in local:
+                bonds.append((k, local[j], order))
+    subgraph = {
+        'atomic_numbers': [atomic_numbers[i] for i in indices],
+        'bonds': bonds,
+        'formal_charges': [formal_charges[i] for i in indices],
+    }
+    return indices, subgraph
+
+
+def graph_chunks(neighbors, size):
+    """Divide the atoms of a graph into compact chunks of a given size.
+
+    The atoms are ordered by a breadth-first walk through the bonds and
+    cut into consecutive pieces, so each chunk is a compact region of the
+    graph, like a spatial domain of a network solid.
+
+    Parameters
+    ----------
+    neighbors : [[int]]
+        The indices of the bonded neighbors of each atom.
+    size : int
+        The number of atoms in each chunk, apart from the last.
+
+    Returns
+    -------
+    [[int]]
+        The indices of the atoms in each chunk.
+    """
+    n_atoms = len(neighbors)
+    seen = [False] * n_atoms
+    order = []
+    for start in range(n_atoms):
+        if seen[start]:
+            continue
+        seen[start] = True
+        order.append(start)
+        k = len(order) - 1
+        while k < len(order):
+            for j in neighbors[order[k]]:
+                if not seen[j]:
+                    seen[j] = True
+                    order.append(j)
+            k += 1
+    return [order[k:k + size] for k in range(0, n_atoms, size)]
+
+
+def graph_signature(graph):
+    """A hashable signature that is identical for identical graphs.
+
+    Two graphs with the same signature have the same atoms, in the same
+    order, with the same bonds, so the atom types of one apply directly
+    to the other. Graphs of the same molecule with the atoms in a
+    different order have different signatures.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Returns
+    -------
+    tuple
+        The signature.
+    """
+    bonds = sorted(
+        (i, j, order) if i < j else (j, i, order)
+        for i, j, order in graph['bonds']
+    )
+    charges = graph['formal_charges']
+    return (
+        tuple(graph['atomic_numbers']),
+        tuple(bonds),
+        None if charges is None else tuple(charges),
+    )
+
+
+def graph_neighbors(graph):
+    """The indices of the bonded neighbors of each atom in a graph.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Returns
+    -------
+    [[int]]
+        The indices of the neighbors of each atom.
+    """
+    neighbors = [[] for _ in graph['atomic_numbers']]
+    for i, j, _ in graph['bonds']:
+        neighbors[i].append(j)
+        neighbors[j].append(i)
+    return neighbors
+
+
+def graph_bond_orders(graph):
+    """The bond order to each bonded neighbor of each atom in a graph.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, as returned by configuration_to_graph().
+
+    Returns
+    -------
+    [{int: int}]
+        The bond order keyed by the index of the neighbor, for each atom.
+        Iterating over each dictionary gives the neighbors, so this can
+        be used where the neighbors are needed.
+    """
+    neighbors = [{} for _ in graph['atomic_numbers']]
+    for i, j, order in graph['bonds']:
+        neighbors[i][j] = order
+        neighbors[j][i] = order
+    return neighbors
+
+
+def atoms_within(neighbors, seeds, radius):
+    """The atoms within a given number of bonds of any of the seed atoms.
+
+    Parameters
+    ----------
+    neighbors : [[int]]
+        The indices of the bonded neighbors of each atom.
+    seeds : iterable(int)
+        The indices of the atoms to start from.
+    radius : int
+        The maximum number of bonds from a seed atom.
+
+    Returns
+    -------
+    set(int)
+        The indices of the atoms, including the seeds.
+    """
+    result = set(seeds)
+    shell = list(result)
+    for _ in range(radius):
+        next_shell = []
+        for i in shell:
+            for j in neighbors[i]:
+                if j not in result:
+                    result.add(j)
+                    next_shell.append(j)
+        if len(next_shell) == 0:
+            break
+        shell = next_shell
+    return result
+
+
+def ring_core(neighbors):
+    """The atoms that could be in rings, i.e. the 2-core of the graph.
+
+    Parameters
+    ----------
+    neighbors : [[int]]
+        The indices of the bonded neighbors of each atom.
+
+    Returns
+    -------
+    set(int)
+        The atoms left after repeatedly removing atoms with fewer than two
+        bonds.
+    """
+    degree = [len(atom_neighbors) for atom_neighbors in neighbors]
+    removed = [False] * len(neighbors)
+    stack = [i for i, n in enumerate(degree) if n < 2]
+    for i in stack:
+        removed[i] = True
+    while len(stack) > 0:
+        i = stack.pop()
+        for j in neighbors[i]:
+            if not removed[j]:
+                degree[j] -= 1
+                if degree[j] < 2:
+                    removed[j] = True
+                    stack.append(j)
+    return {i for i, gone in enumerate(removed) if not gone}
+
+
+def small_rings(neighbors, max_size):
+    """The smallest rings through each atom, up to a given size.
+
+    A breadth-first search from each atom that could be in a ring finds
+    all the shortest cycles through it, which for normal molecules are
+    the rings of the smallest set of smallest rings and for cages such as
+    cubane every face. The search only reaches half the largest ring
+    size from each atom, so the time is proportional to the number of
+    atoms.
+
+    Parameters
+    ----------
+    neighbors : [[int]]
+        The indices of the bonded neighbors of each atom.
+    max_size : int
+        The largest ring to find.
+
+    Returns
+    -------
+    [[int]]
+        The atoms of each ring, in order around the ring.
+    """
+    core = ring_core(neighbors)
+    rings = {}
+    for root in sorted(core):
+        depth = {root: 0}
+        parent = {root: None}
+        branch = {root: None}
+        shell = [root]
+        found = []
+        for d in range(max_size // 2):
+            next_shell = []
+            for u in shell:
+                for v in neighbors[u]:
+                    if v not in core or v == parent[u]:
+                        continue
+                    if v not in depth:
+                        depth[v] = d + 1
+                        parent[v] = u
+                        branch[v] = v if u == root else branch[u]
+                        next_shell.append(v)
+                    elif branch[v] != branch[u] and v != root:
+                        found.append((depth[u] + depth[v] + 1, u, v))
+            if len(found) > 0:
+                break
+            shell = next_shell
+
+        if len(found) == 0:
+            continue
+        size = min(n for n, _, _ in found)
+        if size > max_size:
+            continue
+        for n, u, v in found:
+            if n != size:
+                continue
+            ring = []
+            while u is not None:
+                ring.append(u)
+                u = parent[u]
+            ring.reverse()
+            while v != root:
+                ring.append(v)
+                v = parent[v]
+            key = frozenset(ring)
+            if key not in rings:
+                rings[key] = ring
+    return list(rings.values())
+
+
+def aromatic_systems(molecule, atoms):
+    """The atoms of the aromatic ring systems containing any of the atoms.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The sanitized molecule.
+    atoms : iterable(int)
+        The indices of the atoms.
+
+    Returns
+    -------
+    set(int)
+        The indices of the atoms in the fused aromatic ring systems that
+        contain any of the atoms, which are not themselves included.
+    """
+    result = set()
+    shell = [i for i in atoms if molecule.GetAtomWithIdx(i).GetIsAromatic()]
+    seen = set(shell)
+    while len(shell) > 0:
+        i = shell.pop()
+        for neighbor in molecule.GetAtomWithIdx(i).GetNeighbors():
+            j = neighbor.GetIdx()
+            if j in seen or not neighbor.GetIsAromatic():
+                continue
+            bond = molecule.GetBondBetweenAtoms(i, j)
+            if bond.GetIsAromatic():
+                seen.add(j)
+                result.add(j)
+                shell.append(j)
+    return result
+
+
+def graph_aromatic_systems(neighbors, atoms):
+    """The atoms joined by aromatic bonds to any of the atoms in a graph.
+
+    Parameters
+    ----------
+    neighbors : [{int: int}]
+        The bond order to each bonded neighbor of each atom.
+    atoms : iterable(int)
+        The indices of the atoms.
+
+    Returns
+    -------
+    set(int)
+        The indices of the atoms reached through bonds of order 5 from
+        any of the atoms, which are not themselves included.
+    """
+    atoms = set(atoms)
+    result = set()
+    shell = [
+        i for i in atoms if any(o == 5 for o in neighbors[i].values())
+    ]
+    seen = set(shell)
+    while len(shell) > 0:
+        i = shell.pop()
+        for j, order in neighbors[i].items():
+            if order == 5 and j not in seen:
+                seen.add(j)
+                shell.append(j)
+                if j not in atoms:
+                    result.add(j)
+    return result
+
+
+def graph_conjugated_systems(neighbors, atoms):
+    """The atoms of the conjugated systems containing any of the atoms.
+
+    Atoms with a double or aromatic bond are joined into systems by their
+    bonds to each other, whatever the order of those bonds, so that
+    aromatic rings given as alternating single and double bonds are
+    found, as well as those with aromatic bonds.
+
+    Parameters
+    ----------
+    neighbors : [{int: int}]
+        The bond order to each bonded neighbor of each atom.
+    atoms : iterable(int)
+        The indices of the atoms.
+
+    Returns
+    -------
+    set(int)
+        The indices of the atoms in the conjugated systems that contain
+        any of the atoms, which are not themselves included.
+    """
+
+    def unsaturated(i):
+        return any(o in (2, 5) for o in neighbors[i].values())
+
+    atoms = set(atoms)
+    result = set()
+    shell = [i for i in atoms if unsaturated(i)]
+    seen = set(shell)
+    while len(shell) > 0:
+        i = shell.pop()
+        for j in neighbors[i]:
+            if j not in seen and unsaturated(j):
+                seen.add(j)
+                shell.append(j)
+                if j not in atoms:
+                    result.add(j)
+    return result
+
+
+def submolecule(molecule, atoms, max_ring_size=None):
+    """Extract part of a molecule, keeping the perception of the whole.
+
+    The aromaticity and formal charges of the atoms and the types of the
+    bonds are copied from the full molecule rather than perceived again,
+    and every ring of the full molecule that touches the atoms is
+    included whole, so that the ring sizes seen by SMARTS are those of the
+    full molecule. Atoms at the edge of the region will have fewer
+    neighbors than in the full molecule.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The sanitized molecule.
+    atoms : iterable(int)
+        The indices of the atoms to extract.
+    max_ring_size : int = None
+        If given, only rings up to this size are included whole.
+
+    Returns
+    -------
+    (rdkit.Chem.RWMol, [int])
+        The submolecule and the index in the full molecule of each of its
+        atoms.
+    """
+    atoms = set(atoms)
+    for ring in molecule.GetRingInfo().AtomRings():
+        if max_ring_size is not None and len(ring) > max_ring_size:
+            continue
+        if not atoms.isdisjoint(ring):
+            atoms.update(ring)
+    indices = sorted(atoms)
+    local = {i: k for k, i in enumerate(indices)}
+
+    result = rdkit.Chem.RWMol()
+    for i in indices:
+        atom = molecule.GetAtomWithIdx(i)
+        new_atom = rdkit.Chem.Atom(atom.GetAtomicNum())
+        new_atom.SetFormalCharge(atom.GetFormalCharge())
+        new_atom.SetIsAromatic(atom.GetIsAromatic())
+        new_atom.SetNoImplicit(True)
+        result.AddAtom(new_atom)
+
+    for i in indices:
+        for bond in molecule.GetAtomWithIdx(i).GetBonds():
+            j = bond.GetOtherAtomIdx(i)
+            if j > i and j in local:
+                result.AddBond(local[i], local[j], bond.GetBondType())
+                new_bond = result.GetBondBetweenAtoms(local[i], local[j])
+                new_bond.SetIsAromatic(bond.GetIsAromatic())
+
+    result.UpdatePropertyCache(strict=False)
+    rdkit.Chem.SanitizeMol(
+        result, sanitizeOps=rdkit.Chem.SanitizeFlags.SANITIZE_SYMMRINGS
+    )
+    return result, indices
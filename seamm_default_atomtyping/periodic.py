@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+"""Molecular graphs of periodic systems with bonds across the cell.
+
+The bonds of a periodic configuration join an atom to the nearest image
+of another atom, or to an image of itself, given by the cell offset of
+the second atom. In a small cell the same two atoms can be bonded more
+than once through different images, and short cycles can wrap around the
+cell, which RDKit would take for small rings. Such cells are repeated
+into a supercell large enough that neither happens, so the graph is
+locally the same as the infinite crystal.
+"""
+
+import itertools
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def symop_offset(symop):
+    """The cell offset of an atom from its CIF-style symmetry operator.
+
+    Parameters
+    ----------
+    symop : str
+        The operator, '.' for the atom in the cell, or e.g. '1_556' for
+        the identity and an offset of +1 along the third axis.
+
+    Returns
+    -------
+    (int, int, int)
+        The offset along each axis.
+    """
+    if symop is None or symop == '.':
+        return (0, 0, 0)
+    if '_' in symop:
+        operator, translation = symop.split('_')
+    else:
+        operator, translation = symop, '555'
+    if operator != '1':
+        raise NotImplementedError(
+            'Atom typing is only supported for periodic systems without '
+            f"symmetry (P1), not operator '{symop}'."
+        )
+    return tuple(int(x) - 5 for x in translation)
+
+
+def wrap_vectors(graph, max_length):
+    """Find the cycles that wrap around the cell within a given length.
+
+    Every such cycle crosses the cell boundary, so a breadth-first
+    search through the periodic images, out to max_length bonds from
+    each atom with a bond across the boundary, finds them all.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, with the cell offset of the second atom of each bond,
+        relative to the first, in 'offsets'.
+    max_length : int
+        The longest cycle of interest, in bonds.
+
+    Returns
+    -------
+    set((int, int, int))
+        The cell offsets between an atom and the images of itself that it
+        reaches in at most max_length bonds.
+    """
+    neighbors = [[] for _ in graph['atomic_numbers']]
+    starts = set()
+    for (i, j, _), offset in zip(graph['bonds'], graph['offsets']):
+        neighbors[i].append((j, offset))
+        neighbors[j].append((i, tuple(-x for x in offset)))
+        if any(offset):
+            starts.add(i)
+            starts.add(j)
+
+    result = set()
+    for start in starts:
+        seen = {(start, (0, 0, 0))}
+        shell = [(start, (0, 0, 0))]
+        for _ in range(max_length):
+            next_shell = []
+            for i, cell in shell:
+                for j, offset in neighbors[i]:
+                    image = (
+                        j, (
+                            cell[0] + offset[0], cell[1] + offset[1],
+                            cell[2] + offset[2]
+                        )
+                    )
+                    if image in seen:
+                        continue
+                    seen.add(image)
+                    if j == start:
+                        result.add(image[1])
+                    next_shell.append(image)
+            shell = next_shell
+    return result
+
+
+def unwrap_periodic_graph(graph, max_length):
+    """Make an ordinary graph, in a supercell if needed, of a periodic graph.
+
+    The cell is repeated along each axis just enough that no cycle of
+    max_length bonds or fewer wraps around the supercell. The atoms of the
+    original cell come first in the new graph, in the same order.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph, with the cell offset of each bond in 'offsets'.
+    max_length : int
+        The longest cycle that must not wrap around the supercell.
+
+    Returns
+    -------
+    ({str: []}, (int, int, int))
+        The graph, without offsets, and the number of repeats of the cell
+        along each axis.
+    """
+    vectors = wrap_vectors(graph, max_length)
+    repeats = tuple(
+        1 + max((abs(v[axis]) for v in vectors), default=0)
+        for axis in range(3)
+    )
+    if repeats != (1, 1, 1):
+        logger.info(
+            f'Typing a {repeats[0]}x{repeats[1]}x{repeats[2]} supercell '
+            'because of cycles wrapping around the small cell.'
+        )
+
+    n_atoms = len(graph['atomic_numbers'])
+    cells = list(itertools.product(*(range(n) for n in repeats)))
+    index = {cell: k for k, cell in enumerate(cells)}
+
+    bonds = []
+    for k, cell in enumerate(cells):
+        for (i, j, order), offset in zip(graph['bonds'], graph['offsets']):
+            other = tuple(
+                (c + o) % n for c, o, n in zip(cell, offset, repeats)
+            )
+            bonds.append(
+                (k * n_atoms + i, index[other] * n_atoms + j, order)
+            )
+
+    charges = graph['formal_charges']
+    result = {
+        'atomic_numbers': graph['atomic_numbers'] * len(cells),
+        'bonds': bonds,
+        'formal_charges': None if charges is None else charges * len(cells),
+    }
+    return result, repeats
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+
+"""Repeat units of polymer chains, so only a short chain need be typed.
+
+An atom's type depends only on the atoms within the radius of the
+templates, and its charge on the types of its bonded neighbors, so all
+the repeat units far enough from the ends of a chain have the same types
+and charges. A long chain is therefore shortened to a few units at each
+end, which is typed as an ordinary molecule, and the types and charges of
+the units next to the junction are copied along the rest of the chain.
+
+The repeat units are lists of the indices of their atoms, with
+corresponding atoms at the same position in each unit, in order along
+the chain.
+"""
+
+import logging
+
+from seamm_default_atomtyping.molecule import graph_bond_orders
+
+logger = logging.getLogger(__name__)
+
+# The largest repeat unit looked for, in heavy atoms
+max_unit_size = 100
+
+
+def find_repeat_units(graph, min_repeats=3):
+    """Find the repeat units of a polymer chain from its atom order.
+
+    The heavy atoms of the units must follow each other in the atom
+    order, as they do from builders and SMILES, but the hydrogen atoms
+    may be anywhere. Each unit is the run of heavy atoms repeating with
+    the shortest period, starting from the middle of the chain, plus
+    their hydrogen atoms.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph of one molecule.
+    min_repeats : int = 3
+        The fewest repeat units worth finding.
+
+    Returns
+    -------
+    [[int]]
+        The atoms of each repeat unit, or None if the molecule does not
+        have at least min_repeats repeat units.
+    """
+    atomic_numbers = graph['atomic_numbers']
+    charges = graph['formal_charges']
+    neighbors = graph_bond_orders(graph)
+
+    heavy = [i for i, z in enumerate(atomic_numbers) if z != 1]
+    position = {i: k for k, i in enumerate(heavy)}
+    hydrogens = {i: [] for i in heavy}
+    for i, z in enumerate(atomic_numbers):
+        if z == 1:
+            if len(neighbors[i]) != 1:
+                return None
+            j = next(iter(neighbors[i]))
+            if j not in hydrogens:
+                return None
+            hydrogens[j].append(i)
+
+    # Each heavy atom with its hydrogens, and the bonds to other heavy
+    # atoms relative to its position in the order, is unchanged by moving
+    # along the chain one repeat unit at a time.
+    signatures = []
+    for k, i in enumerate(heavy):
+        signatures.append(
+            (
+                atomic_numbers[i], len(hydrogens[i]),
+                0 if charges is None else charges[i],
+                tuple(
+                    sorted(
+                        (position[j] - k, order)
+                        for j, order in neighbors[i].items()
+                        if j in position
+                    )
+                )
+            )
+        )
+
+    n_heavy = len(heavy)
+    middle = n_heavy // 2
+    for period in range(1, min(max_unit_size, n_heavy // min_repeats) + 1):
+        if (
+            middle + period >= n_heavy or
+            signatures[middle + period] != signatures[middle]
+        ):
+            continue
+        start = middle
+        while (
+            start > 0 and
+            signatures[start - 1] == signatures[start - 1 + period]
+        ):
+            start -= 1
+        end = middle
+        while (
+            end + period < n_heavy and
+            signatures[end] == signatures[end + period]
+        ):
+            end += 1
+        n_units = (end + period - start) // period
+        if n_units >= min_repeats:
+            break
+    else:
+        return None
+
+    units = []
+    for t in range(n_units):
+        unit = []
+        for k in range(start + t * period, start + (t + 1) * period):
+            unit.append(heavy[k])
+            unit.extend(hydrogens[heavy[k]])
+        units.append(unit)
+    return units if check_repeat_units(graph, units) else None
+
+
+def check_repeat_units(graph, units):
+    """Check that repeat units are the same, and bonded only in order.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph of one molecule.
+    units : [[int]]
+        The atoms of each repeat unit, in order along the chain.
+
+    Returns
+    -------
+    bool
+        True if every unit has the same atoms and bonds as the next,
+        bonds join only atoms in the same or neighboring units, and other
+        atoms are bonded only to the units at the ends.
+    """
+    atomic_numbers = graph['atomic_numbers']
+    charges = graph['formal_charges']
+    neighbors = graph_bond_orders(graph)
+    n_units = len(units)
+    if n_units < 2:
+        return False
+
+    slot = {}
+    for t, unit in enumerate(units):
+        if len(unit) != len(units[0]):
+            return False
+        for s, i in enumerate(unit):
+            if i in slot:
+                return False
+            slot[i] = (t, s)
+
+    for t in range(n_units - 1):
+        for s, i in enumerate(units[t]):
+            j = units[t + 1][s]
+            if atomic_numbers[i] != atomic_numbers[j]:
+                return False
+            if charges is not None and charges[i] != charges[j]:
+                return False
+
+    for i, j, order in graph['bonds']:
+        if i not in slot or j not in slot:
+            # Bonds to the end groups
+            t = slot[i][0] if i in slot else slot[j][0] if j in slot else 0
+            if t not in (0, n_units - 1):
+                return False
+            continue
+        (t, s), (u, r) = slot[i], slot[j]
+        if abs(t - u) > 1:
+            return False
+        if max(t, u) + 1 < n_units:
+            # The same bond in the next unit along
+            ii, jj = units[t + 1][s], units[u + 1][r]
+            if neighbors[ii].get(jj) != order:
+                return False
+        if min(t, u) > 0:
+            # ... and the one before
+            ii, jj = units[t - 1][s], units[u - 1][r]
+            if neighbors[ii].get(jj) != order:
+                return False
+    return True
+
+
+def shorten_chain(graph, units, n_end):
+    """Remove the middle repeat units of a chain, joining up the rest.
+
+    Parameters
+    ----------
+    graph : {str: []}
+        The graph of one molecule.
+    units : [[int]]
+        The atoms of each repeat unit, in order along the chain, as
+        checked by check_repeat_units().
+    n_end : int
+        The number of units to keep at each end.
+
+    Returns
+    -------
+    ([int], {str: []})
+        The indices of the atoms kept, in increasing order, and the graph
+        of the shortened chain with the atoms in that order.
+    """
+    n_units = len(units)
+    shift = n_units - 2 * n_end
+    slot = {}
+    removed = set()
+    for t, unit in enumerate(units):
+        for s, i in enumerate(unit):
+            slot[i] = (t, s)
+            if n_end <= t < n_units - n_end:
+                removed.add(i)
+
+    indices = [
+        i for i in range(len(graph['atomic_numbers'])) if i not in removed
+    ]
+    local = {i: k for k, i in enumerate(indices)}
+
+    bonds = {}
+    for i, j, order in graph['bonds']:
+        if i in removed and j in removed:
+            continue
+        if i in removed:
+            i, j = j, i
+        if j in removed:
+            # Bond the kept atom to the image of the removed one that is
+            # at the other end of the gap.
+            u, r = slot[j]
+            if slot[i][0] < n_end:
+                j = units[u + shift][r]
+            else:
+                j = units[u - shift][r]
+        bonds[(min(local[i], local[j]), max(local[i], local[j]))] = order
+
+    charges = graph['formal_charges']
+    subgraph = {
+        'atomic_numbers': [graph['atomic_numbers'][i] for i in indices],
+        'bonds': [(i, j, order) for (i, j), order in bonds.items()],
+        'formal_charges': (
+            None if charges is None else [charges[i] for i in indices]
+        ),
+    }
+    return indices, subgraph
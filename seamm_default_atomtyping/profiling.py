@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+"""Timing and match counts for the phases of typing and each template.
+
+Profiling is optional. When it is off the typer does not create a
+TypingProfile, and the only cost is checking for one.
+"""
+
+import contextlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+#: The phases of typing, in the order they happen.
+phases = ('load', 'graph', 'molecule', 'cache', 'match', 'charges', 'store')
+
+
+class TypingProfile(object):
+
+    def __init__(self):
+        """The time spent in each phase of typing and in each template.
+
+        Attributes
+        ----------
+        phase_times : {str: float}
+            The total time, in seconds, spent in each phase.
+        templates : {(str, str): {str: float or int}}
+            The statistics for each template, keyed by atom type and SMARTS.
+        """
+        self.phase_times = {phase: 0.0 for phase in phases}
+        self.templates = {}
+        # The time spent in phases nested in each open phase
+        self._nested = []
+
+    def clear(self):
+        """Reset all the times and counts to zero."""
+        self.phase_times = {phase: 0.0 for phase in phases}
+        self.templates = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """A context manager that adds the time spent in it to a phase.
+
+        A phase opened inside another, such as loading the forcefield when
+        it is first needed while matching, is only counted once, in the
+        inner phase, so the times of the phases add up to the total.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase.
+        """
+        t0 = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - t0
+            nested = self._nested.pop()
+            self.phase_times[name] = (
+                self.phase_times.get(name, 0.0) + seconds - nested
+            )
+            if len(self._nested) > 0:
+                self._nested[-1] += seconds
+
+    def add_template(
+        self, template, seconds, n_matches=0, n_set=0, n_overridden=0
+    ):
+        """Record one run of a template.
+
+        Parameters
+        ----------
+        template : CompiledTemplate
+            The template.
+        seconds : float
+            The time taken to find the matches.
+        n_matches : int
+            The number of matches found.
+        n_set : int
+            The number of atoms whose type the template set.
+        n_overridden : int
+            The number of matched atoms that already had a type from a
+            template with higher precedence. When matching in file order,
+            as the forcefield is written, these are the atoms whose type
+            this template would have set and another later overwritten.
+
+        Returns
+        -------
+        None
+        """
+        key = (template.atom_type, template.smarts)
+        if key not in self.templates:
+            self.templates[key] = {
+                'atom_type': template.atom_type,
+                'smarts': template.smarts,
+                'compile_time': template.compile_time,
+                'calls': 0,
+                'match_time': 0.0,
+                'matches': 0,
+                'set': 0,
+                'overridden': 0,
+            }
+        data = self.templates[key]
+        data['calls'] += 1
+        data['match_time'] += seconds
+        data['matches'] += n_matches
+        data['set'] += n_set
+        data['overridden'] += n_overridden
+
+    def statistics(self):
+        """The times and counts, as plain data.
+
+        Returns
+        -------
+        {str: []}
+            The time in each phase in 'phases', and in 'templates' a list
+            of dictionaries with the atom type, SMARTS, compile time,
+            number of calls, total match time, number of matches and
+            number of atoms set and overridden for each template that was
+            run, in decreasing order of match time.
+        """
+        templates = sorted(
+            (dict(data) for data in self.templates.values()),
+            key=lambda data: data['match_time'],
+            reverse=True
+        )
+        return {'phases': dict(self.phase_times), 'templates': templates}
+
+    def report(self, n_templates=None):
+        """A text table of the times and counts.
+
+        Parameters
+        ----------
+        n_templates : int = None
+            The number of the most expensive templates to list. By default
+            all the templates that were run are listed.
+
+        Returns
+        -------
+        str
+            The table.
+        """
+        statistics = self.statistics()
+
+        total = sum(statistics['phases'].values())
+        lines = ['Phase        Time (s)     %']
+        for phase, seconds in statistics['phases'].items():
+            percent = 100 * seconds / total if total > 0 else 0.0
+            lines.append(f'{phase:<10} {seconds:10.4f} {percent:5.1f}')
+        lines.append(f"{'total':<10} {total:10.4f}")
+        lines.append('')
+
+        templates = statistics['templates']
+        if n_templates is not None:
+            templates = templates[0:n_templates]
+        lines.append(
+            'Type       Compile (ms)  Match (ms)  Calls  Matches'
+            '    Set  Overridden  SMARTS'
+        )
+        for data in templates:
+            lines.append(
+                f"{data['atom_type']:<10} "
+                f"{1000 * data['compile_time']:12.3f} "
+                f"{1000 * data['match_time']:11.3f} "
+                f"{data['calls']:6d} {data['matches']:8d} "
+                f"{data['set']:6d} {data['overridden']:11d}  "
+                f"{data['smarts']}"
+            )
+        return '\n'.join(lines)
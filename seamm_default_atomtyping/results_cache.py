@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""A bounded, least-recently-used cache of atom typing results.
+
+The results are keyed by the canonical SMILES of the molecule together
+with the name and version of the forcefield. The atom types and charges
+are stored in the canonical atom order, so a hit can be mapped back onto
+any atom ordering of the same molecule.
+"""
+
+import collections
+import logging
+import sys
+
+import rdkit
+import rdkit.Chem
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_key(molecule):
+    """The canonical SMILES and atom ranks for a molecule.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The molecule, with explicit hydrogens.
+
+    Returns
+    -------
+    (str, [int])
+        The canonical SMILES, without stereochemistry since it does not
+        affect the atom types, and the canonical rank of each atom.
+    """
+    smiles = rdkit.Chem.MolToSmiles(molecule, isomericSmiles=False)
+    ranks = list(rdkit.Chem.CanonicalRankAtoms(molecule, breakTies=True))
+    return smiles, ranks
+
+
+class TypingCache(object):
+
+    def __init__(self, maxsize=1024, max_memory=64 * 1024 * 1024):
+        """A cache of atom types and charges for molecules.
+
+        Parameters
+        ----------
+        maxsize : int = 1024
+            The maximum number of molecules to keep. 0 disables the cache.
+        max_memory : int = 64 MiB
+            The approximate maximum memory, in bytes, for the cached results.
+        """
+        self.maxsize = maxsize
+        self.max_memory = max_memory
+        self._data = collections.OrderedDict()
+        self._memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def enabled(self):
+        """Whether the cache holds anything at all."""
+        return self.maxsize > 0 and self.max_memory > 0
+
+    @property
+    def memory(self):
+        """The approximate memory used by the cached results, in bytes."""
+        return self._memory
+
+    def clear(self):
+        """Remove all the cached results and reset the statistics."""
+        self._data.clear()
+        self._memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, ranks):
+        """Get the atom types and charges for a molecule, if cached.
+
+        Parameters
+        ----------
+        key : (str, str, str)
+            The canonical SMILES and the forcefield name and version.
+        ranks : [int]
+            The canonical rank of each atom of the molecule.
+
+        Returns
+        -------
+        ([str], [float])
+            The atom types and charges in the atom order of the molecule,
+            or None if the molecule is not in the cache. The charges are
+            None if they were not assigned.
+        """
+        if key not in self._data:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._data.move_to_end(key)
+        canonical_types, canonical_charges, _ = self._data[key]
+        atomtypes = [canonical_types[rank] for rank in ranks]
+        if canonical_charges is None:
+            charges = None
+        else:
+            charges = [canonical_charges[rank] for rank in ranks]
+        return atomtypes, charges
+
+    def put(self, key, ranks, atomtypes, charges=None):
+        """Add the atom types and charges for a molecule to the cache.
+
+        Parameters
+        ----------
+        key : (str, str, str)
+            The canonical SMILES and the forcefield name and version.
+        ranks : [int]
+            The canonical rank of each atom of the molecule.
+        atomtypes : [str]
+            The atom types in the atom order of the molecule.
+        charges : [float] = None
+            The charges in the atom order of the molecule.
+
+        Returns
+        -------
+        None
+        """
+        if not self.enabled:
+            return
+
+        n = len(ranks)
+        canonical_types = [None] * n
+        for rank, atom_type in zip(ranks, atomtypes):
+            canonical_types[rank] = atom_type
+        if charges is None:
+            canonical_charges = None
+        else:
+            canonical_charges = [None] * n
+            for rank, charge in zip(ranks, charges):
+                canonical_charges[rank] = charge
+
+        size = sys.getsizeof(key[0]) + 64 * n
+        if size > self.max_memory:
+            return
+
+        if key in self._data:
+            self._memory -= self._data.pop(key)[2]
+        self._data[key] = (canonical_types, canonical_charges, size)
+        self._memory += size
+
+        while (
+            len(self._data) > self.maxsize or self._memory > self.max_memory
+        ):
+            _, (_, _, evicted_size) = self._data.popitem(last=False)
+            self._memory -= evicted_size
+            self.evictions += 1
+
+    def statistics(self):
+        """The statistics of the cache.
+
+        Returns
+        -------
+        {str: int}
+            The number of hits, misses and evictions, the number of
+            molecules cached and the approximate memory used.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self._data),
+            'memory': self._memory,
+        }
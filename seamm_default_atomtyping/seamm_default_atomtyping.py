@@ -3,18 +3,58 @@
 """Non-graphical part of the seamm_default_atomtyping step in a SEAMM flowchart
 """
 
+import concurrent.futures
+import contextlib
 import logging
 import pprint  # noqa: F401
 import os
 import seamm_default_atomtyping
-import seamm
 from seamm_util import ureg, Q_  # noqa: F401
 import seamm_util.printing as printing
 from seamm_util.printing import FormattedText as __
-import rdkit
-import rdkit.Chem
-import rdkit.Chem.AllChem
-import re
+from seamm_default_atomtyping.charges import (
+    ChargeTable, bond_arrays, bond_increment_charges
+)
+from seamm_default_atomtyping.diagnostics import (
+    UntypedAtomsError, combine_reports, environment_molecules,
+    summary as diagnostics_summary, untyped_report, write_report
+)
+from seamm_default_atomtyping.forcefield_registry import ForcefieldRegistry
+from seamm_default_atomtyping.frc_index import TypingForcefield
+from seamm_default_atomtyping.molecule import (
+    atoms_within, configuration_to_graph, extract_subgraph,
+    graph_aromatic_systems, graph_bond_orders, graph_chunks,
+    graph_conjugated_systems, graph_formal_charges, graph_signature,
+    graph_to_molecule, iter_split_graph, molecule_bonds
+)
+from seamm_default_atomtyping.periodic import unwrap_periodic_graph
+from seamm_default_atomtyping.polymer import (
+    check_repeat_units, find_repeat_units, shorten_chain
+)
+from seamm_default_atomtyping.profiling import TypingProfile
+from seamm_default_atomtyping.results_cache import TypingCache, canonical_key
+from seamm_default_atomtyping.templates import AtomArrays, engines
+
+# Rings, and so aromaticity, can change for atoms this many bonds from an
+# edit, which covers breaking or closing rings of up to 8 atoms.
+ring_margin = 4
+
+# The most distinct molecules whose results are remembered while streaming
+max_molecules = 1024
+
+# The largest rings found when the rings are found directly on the graph,
+# which covers the rings of up to 8 atoms that matter to the templates.
+small_ring_size = 2 * ring_margin
+
+# With ring_perception='auto' molecules at least this large, and all
+# periodic systems, have their rings found directly on the graph.
+small_rings_above = 1000
+
+# Molecules at least this large are checked for repeat units
+repeat_units_above = 200
+
+# The forcefield typed with unless another is selected
+default_forcefield = 'pcff'
 
 # In addition to the normal logger, two logger-like printing facilities are
 # defined: 'job' and 'printer'. 'job' send output to the main job.out file for
@@ -58,6 +98,14 @@ class SeammDefaultAtomtyping:
         self,
         parameter_set=None,
         logger=logger,
+        use_cache=True,
+        cache_dir=None,
+        cache_size=1024,
+        profile=False,
+        ring_perception='auto',
+        detect_repeat_units=True,
+        engine='smarts',
+        forcefield_dirs=None,
         **_ignore
     ):
         """A step for seamm_default_atomtyping in a SEAMM flowchart.
@@ -76,6 +124,34 @@ class SeammDefaultAtomtyping:
             Not yet implemented
         logger : Logger = logger
             The logger to use and pass to parent classes
+        use_cache : bool = True
+            Whether to use the on-disk cache of parsed forcefields.
+        cache_dir : str = None
+            The directory for the forcefield cache, defaulting to
+            ~/.seamm/cache/seamm_default_atomtyping
+        cache_size : int = 1024
+            The number of molecules whose atom types and charges are kept
+            in memory for reuse. 0 turns off this cache.
+        profile : bool = False
+            Whether to collect the time spent in each phase of typing and
+            in each template, which is then printed to step.out.
+        ring_perception : str = 'auto'
+            How rings are found: 'full' for RDKit's smallest set of
+            smallest rings, 'small' for the rings of up to 8 atoms found
+            directly on the graph, which takes time proportional to the
+            size of the system, or 'auto' for 'small' with periodic
+            systems and large molecules and 'full' otherwise.
+        detect_repeat_units : bool = True
+            Whether to look for repeat units in large molecules, so that
+            only a short chain need be typed.
+        engine : str = 'smarts'
+            How the templates are matched: 'smarts' to run them in turn,
+            or 'tree' to use the decision tree compiled from them, which
+            gives the same atom types.
+        forcefield_dirs : [str] = None
+            Further directories of forcefield files, searched before
+            those in SEAMM_FORCEFIELD_PATH and the package's data
+            directory.
 
         Returns
         -------
@@ -84,11 +160,140 @@ class SeammDefaultAtomtyping:
         logger.debug('Creating seamm_default_atomtyping {}'.format(self))
         self.directory = os.getcwd()
         self.name = self.__class__.__name__
-        self.forcefield = seamm.Forcefield(filename="/Users/meliseo/Git/SEAMM2/seamm_default_atomtyping/seamm_default_atomtyping/data/pcff2018.frc")
+        self._use_cache = use_cache
+        self._cache_dir = cache_dir
+        self._cache_size = cache_size
+        self.profile = TypingProfile() if profile else None
+        if ring_perception not in ('auto', 'full', 'small'):
+            raise ValueError(f"Unknown ring perception '{ring_perception}'")
+        self.ring_perception = ring_perception
+        self.detect_repeat_units = detect_repeat_units
+        if engine not in engines:
+            raise ValueError(f"Unknown template engine '{engine}'")
+        self.engine = engine
+
+        # The forcefields are found when first needed, and each is loaded
+        # when first used. The selected one is the one typed with.
+        self._forcefield_dirs = forcefield_dirs
+        self.registry = ForcefieldRegistry(forcefield_dirs)
+        self._forcefields = {}
+        self.selected_forcefield = default_forcefield
+
+        self.result_cache = TypingCache(maxsize=cache_size)
+        # The report on the atoms the last call could not type, if any
+        self.untyped_report = None
+
+    @property
+    def supported_forcefield(self):
+        """The names of the forcefields that can be typed with."""
+        return self.registry.names()
+
+    @property
+    def forcefield(self):
+        """The selected forcefield, loaded when first used.
+
+        Unless the forcefield has a 'charges' section, this is a
+        frc_index.TypingForcefield, which parses each functional form in
+        ff when first used, with the same parameters as seamm.Forcefield.
+        Use full_forcefield for the methods of seamm.Forcefield.
+        """
+        return self._loaded()['forcefield']
+
+    @property
+    def full_forcefield(self):
+        """The selected forcefield as a seamm.Forcefield.
+
+        This is needed only for its methods, such as energy_expression(),
+        as the parameters are all in forcefield. The whole file is parsed
+        when first used.
+        """
+        data = self._loaded()
+        if data['full_forcefield'] is None:
+            forcefield = data['forcefield']
+            if isinstance(forcefield, TypingForcefield):
+                import seamm
+                forcefield = seamm.Forcefield(
+                    filename=self.registry.path(self.selected_forcefield)
+                )
+            data['full_forcefield'] = forcefield
+        return data['full_forcefield']
+
+    @property
+    def templates(self):
+        """The compiled templates of the selected forcefield."""
+        return self._loaded()['templates']
+
+    @property
+    def forcefield_version(self):
+        """The key identifying the file of the selected forcefield."""
+        return self._loaded()['version']
+
+    def _loaded(self):
+        """The selected forcefield and its data, loading it if needed."""
+        name = self.selected_forcefield
+        if name not in self._forcefields:
+            with self._phase('load'):
+                forcefield, templates, version = self.registry.load(
+                    name,
+                    version=self.version,
+                    cache_dir=self._cache_dir,
+                    use_cache=self._use_cache
+                )
+            self._forcefields[name] = {
+                'forcefield': forcefield,
+                'templates': templates,
+                'version': version,
+                'charge_table': None,
+                'full_forcefield': None,
+            }
+        return self._forcefields[name]
 
-        self.supported_forcefield = [self.forcefield.name]
+    def add_forcefield(self, path):
+        """Add a forcefield file, to select or to type with the others.
 
-        self.selected_forcefield = self.forcefield.name
+        The forcefield is loaded when first used.
+
+        Parameters
+        ----------
+        path : str
+            The path to the forcefield file.
+
+        Returns
+        -------
+        str
+            The name of the forcefield, which is added to
+            supported_forcefield.
+        """
+        name = self.registry.add_file(path)
+        # A forcefield of the same name from another file is replaced
+        self._forcefields.pop(name, None)
+        return name
+
+    def select_forcefield(self, name):
+        """Select the forcefield to type with.
+
+        Parameters
+        ----------
+        name : str
+            The name of the forcefield, one of supported_forcefield.
+
+        Returns
+        -------
+        None
+        """
+        if name not in self.registry.entries:
+            raise ValueError(f"The forcefield '{name}' is not known")
+        self.selected_forcefield = name
+
+    @contextlib.contextmanager
+    def _using(self, name):
+        """Select a forcefield for the duration of a with statement."""
+        previous = self.selected_forcefield
+        self.select_forcefield(name)
+        try:
+            yield
+        finally:
+            self.select_forcefield(previous)
 
     @property
     def version(self):
@@ -127,12 +332,28 @@ class SeammDefaultAtomtyping:
 
         return self.header + '\n' + __(text, **P, indent=4 * ' ').__str__()
 
+    def assign_parameters(self, configuration=None, forcefields=None):
+        """Assign the atom types and charges to a configuration.
 
-    def assign_parameters(self, configuration=None):
+        Parameters
+        ----------
+        configuration : molsystem.Configuration
+            The configuration to type.
+        forcefields : [str] = None
+            The forcefields to type for, all in one pass, as in
+            type_graph_forcefields(). By default just the selected one.
 
+        Returns
+        -------
+        None
+        """
         if configuration is None:
             raise TypeError("A configuration must be provided when assigning forcefield parameters")
 
+        if forcefields is not None:
+            self._assign_parameters_forcefields(configuration, forcefields)
+            return
+
         printer.important(
             __(
                 "Assigning the atom types and charges for forcefield "
@@ -140,146 +361,423 @@ class SeammDefaultAtomtyping:
             )
         )
 
-        logger.debug('Atom typing, getting the SMILES for the system')
-        smiles = configuration.to_smiles(hydrogens=True)
-        logger.debug('Atom typing -- smiles = ' + smiles)
+        logger.debug('Atom typing, getting the molecular graph of the system')
+        with self._phase('graph'):
+            graph = configuration_to_graph(configuration)
+
+        atomtypes, charges = self.type_graph(graph)
+        with self._phase('store'):
+            self.store_parameters(configuration, atomtypes, charges)
+
+        if charges is None:
+            printer.important(
+                __(
+                    f"Assigned atom types to {configuration.n_atoms} "
+                    "atoms.",
+                )
+            )
+        else:
+            printer.important(
+                __(
+                    "Assigned atom types and charges to "
+                    f"{configuration.n_atoms} atoms.",
+                )
+            )
+
+        self.print_profile()
+
+    def _assign_parameters_forcefields(self, configuration, forcefields):
+        """Assign the types and charges of several forcefields at once."""
+        names = ', '.join(f"'{name}'" for name in forcefields)
+        printer.important(
+            __(
+                "Assigning the atom types and charges for forcefields "
+                f"{names} to the system",
+            )
+        )
+
+        with self._phase('graph'):
+            graph = configuration_to_graph(configuration)
+
+        results = self.type_graph_forcefields(graph, forcefields)
+        with self._phase('store'):
+            for name, (atomtypes, charges) in results.items():
+                with self._using(name):
+                    self.store_parameters(configuration, atomtypes, charges)
+
+        printer.important(
+            __(
+                f"Assigned atom types for {len(results)} forcefields to "
+                f"{configuration.n_atoms} atoms.",
+            )
+        )
+
+        self.print_profile()
 
+    def assign_parameters_many(
+        self, configurations, workers=None, chunksize=1
+    ):
+        """Assign the atom types and charges to many configurations.
 
-        pat3 = re.compile(r'H3\]')
-        pat2 = re.compile(r'H2\]')
-        pat1 = re.compile(r'(?P<c1>[^[])H\]')
+        The typing is spread across a pool of processes, each of which
+        loads the selected forcefield once, from the on-disk cache if
+        possible, and types with the same options as this typer. The atom
+        types and charges are written into the configurations in this
+        process.
 
-        smiles = pat3.sub(']([H])([H])([H])', smiles)
-        smiles = pat2.sub(']([H])([H])', smiles)
-        smiles = pat1.sub(r'\g<c1>]([H])', smiles)
+        Only the work done in this process is profiled, so with more than
+        one worker the time matching templates is not included.
 
-        h_subst = None
-        for el in ('Rb', 'Cs', 'Fr', 'At'):
-            if el not in smiles:
-                h_subst = el
-                pat4 = re.compile(r'\[H\]')
-                smiles = pat4.sub('[{}]'.format(el), smiles)
-                logger.debug("Subst SMILES = '{}'".format(smiles))
-                break
+        Parameters
+        ----------
+        configurations : [molsystem.Configuration]
+            The configurations to type.
+        workers : int = None
+            The number of processes to use. None uses all the processors,
+            and 1 types the configurations in this process.
+        chunksize : int = 1
+            The number of configurations sent to a process at a time.
+
+        Returns
+        -------
+        [([str], [float])]
+            The atom types and charges for each configuration, in the same
+            order as the configurations. The charges are None if the
+            forcefield does not have bond increments.
+        """
+        configurations = list(configurations)
 
-        molecule = rdkit.Chem.MolFromSmiles(smiles)
-        if molecule is None:
-            print("There was problem with the SMILES '{}'".format(smiles))
+        printer.important(
+            __(
+                "Assigning the atom types and charges for forcefield "
+                f"'{self.selected_forcefield}' to {len(configurations)} "
+                "systems",
+            )
+        )
+
+        with self._phase('graph'):
+            graphs = [configuration_to_graph(c) for c in configurations]
+
+        if workers is None:
+            workers = os.cpu_count()
+        workers = max(1, min(workers, len(graphs)))
+
+        if workers == 1:
+            results = [self.type_graph(graph) for graph in graphs]
+        else:
+            # The workers type just like this typer
+            options = {
+                'use_cache': self._use_cache,
+                'cache_dir': self._cache_dir,
+                'cache_size': self._cache_size,
+                'ring_perception': self.ring_perception,
+                'detect_repeat_units': self.detect_repeat_units,
+                'engine': self.engine,
+                'forcefield_dirs': self._forcefield_dirs,
+            }
+            name = self.selected_forcefield
+            with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_initialize_worker,
+                initargs=(
+                    options, name, self.registry.path(name), self.directory
+                ),
+            ) as executor:
+                try:
+                    results = list(
+                        executor.map(
+                            _assign_graph, graphs, chunksize=chunksize
+                        )
+                    )
+                except UntypedAtomsError as e:
+                    self.untyped_report = e.report
+                    raise
+
+        with self._phase('store'):
+            for configuration, (atomtypes, charges) in zip(
+                configurations, results
+            ):
+                self.store_parameters(configuration, atomtypes, charges)
+
+        printer.important(
+            __(
+                f"Assigned atom types to {len(configurations)} systems "
+                f"using {workers} processes.",
+            )
+        )
+
+        self.print_profile()
+
+        return results
+
+    def type_molecule(self, molecule, use_cache=True):
+        """Find the atom types and charges for an RDKit molecule.
+
+        Molecules that have been typed before are found in the cache of
+        results and not typed again.
+
+        Parameters
+        ----------
+        molecule : rdkit.Chem.Mol
+            The molecule, with explicit hydrogens.
+        use_cache : bool = True
+            Whether to use the cache of results, which needs the canonical
+            SMILES of the molecule. That is not wanted for networks.
+
+        Returns
+        -------
+        ([str], [float])
+            The atom types, '?' for atoms that could not be typed, and the
+            charges, which are None if the forcefield has no bond
+            increments or any atom could not be typed.
+        """
+        name = self.selected_forcefield
+        result = self.type_molecule_forcefields(molecule, [name], use_cache)
+        return result[name]
+
+    def type_molecule_forcefields(self, molecule, forcefields, use_cache=True):
+        """Find the atom types and charges of a molecule for forcefields.
+
+        The canonical SMILES, the arrays of atom properties and the
+        matches of any SMARTS shared by the forcefields' templates are
+        found once for all the forcefields.
+
+        Parameters
+        ----------
+        molecule : rdkit.Chem.Mol
+            The molecule, with explicit hydrogens.
+        forcefields : [str]
+            The names of the forcefields, which must have been loaded.
+        use_cache : bool = True
+            Whether to use the cache of results, as in type_molecule().
+
+        Returns
+        -------
+        {str: ([str], [float])}
+            The atom types and charges for each forcefield, the charges
+            being None if the forcefield has no bond increments or any
+            atom could not be typed.
+        """
+        use_cache = use_cache and self.result_cache.enabled
+        if use_cache:
+            with self._phase('cache'):
+                smiles, ranks = canonical_key(molecule)
+
+        arrays = AtomArrays(molecule)
+        matches = {}
+        bonds = None
+        result = {}
+        for name in forcefields:
+            with self._using(name):
+                if use_cache:
+                    with self._phase('cache'):
+                        key = (smiles, name, self.forcefield_version)
+                        cached = self.result_cache.get(key, ranks)
+                    if cached is not None:
+                        logger.debug(
+                            f"Found the atom types for '{smiles}' in the "
+                            "cache"
+                        )
+                        result[name] = cached
+                        continue
+
+                with self._phase('match'):
+                    atomtypes = self.assign_atomtypes(
+                        molecule, arrays=arrays, matches=matches
+                    )
+                if '?' in atomtypes:
+                    # Reported by the caller, rather than failing here
+                    charges = None
+                else:
+                    with self._phase('charges'):
+                        if bonds is None:
+                            bonds = molecule_bonds(molecule)
+                        charges = self.assign_charges(atomtypes, bonds)
+
+                if use_cache:
+                    with self._phase('cache'):
+                        self.result_cache.put(key, ranks, atomtypes, charges)
+                result[name] = (atomtypes, charges)
+        return result
+
+    def cache_statistics(self):
+        """The hits, misses and evictions of the cache of typing results.
+
+        Returns
+        -------
+        {str: int}
+            The statistics, as given by TypingCache.statistics().
+        """
+        return self.result_cache.statistics()
+
+    def profile_statistics(self):
+        """The time spent in each phase of typing and in each template.
+
+        Returns
+        -------
+        {str: []}
+            The statistics, as given by TypingProfile.statistics(), or None
+            if profiling is not turned on.
+        """
+        if self.profile is None:
+            return None
+        return self.profile.statistics()
+
+    def print_profile(self):
+        """Print the profile of the typing to step.out, if profiling."""
+        if self.profile is None:
             return
+        printer.important(
+            __(
+                'Time spent in each phase of atom typing and in each '
+                'template:',
+                indent=4 * ' '
+            )
+        )
+        printer.important(
+            __(
+                self.profile.report(),
+                indent=8 * ' ',
+                indent_all=True,
+                wrap=False,
+                dedent=False
+            )
+        )
 
-        if h_subst is not None:
-            for atom in molecule.GetAtoms():
-                if atom.GetSymbol() == h_subst:
-                    atom.SetAtomicNum(1)
-
-        # if add_hydrogens:
-        #     molecule = rdkit.Chem.AddHs(molecule)
-        #     n_atoms = molecule.GetNumAtoms()
-        #     logger.debug(
-        #         "'{}' has {} atoms with hydrogens added".format(
-        #             smiles, n_atoms
-        #         )
-        #     )
-        # else:
-        #     n_atoms = molecule.GetNumAtoms()
-        #     logger.debug("'{}' has {} atoms".format(smiles, n_atoms))
-        n_atoms = molecule.GetNumAtoms()
-
-        atomtypes = ['?'] * n_atoms
-        templates = self.forcefield.get_templates()
-        for atom_type in templates:
-            template = templates[atom_type]
-            for smarts in template['smarts']:
-                pattern = rdkit.Chem.MolFromSmarts(smarts)
-
-                ind_map = {}
-                for atom in pattern.GetAtoms():
-                    map_num = atom.GetAtomMapNum()
-                    if map_num:
-                        ind_map[map_num - 1] = atom.GetIdx()
-                map_list = [ind_map[x] for x in sorted(ind_map)]
-
-                matches = molecule.GetSubstructMatches(pattern)
-                logger.debug(atom_type + ': ')
-                if len(matches) > 0:
-                    for match in matches:
-                        atom_ids = [match[x] for x in map_list]
-                        for x in atom_ids:
-                            atomtypes[x] = atom_type
-                        tmp = [str(x) for x in atom_ids]
-                        logger.debug('\t' + ', '.join(tmp))
-
-        i = 0
-        untyped = []
-        for atom, atom_type in zip(molecule.GetAtoms(), atomtypes):
-            if atom_type == '?':
-                untyped.append(i)
-            logger.debug("{}: {}".format(atom.GetSymbol(), atom_type))
-            i += 1
+    def _phase(self, name):
+        """A context manager timing a phase of typing, if profiling."""
+        if self.profile is None:
+            return contextlib.nullcontext()
+        return self.profile.phase(name)
+
+    def assign_atomtypes(
+        self, molecule, atom_types=None, arrays=None, matches=None
+    ):
+        """Find the atom types for an RDKit molecule.
+
+        Parameters
+        ----------
+        molecule : rdkit.Chem.Mol
+            The molecule, with explicit hydrogens.
+        atom_types : [str] = None
+            The current atom types. Only atoms with the type '?' are
+            typed, as in CompiledTemplates.assign(). By default, all.
+        arrays : AtomArrays = None
+            The arrays of the atom properties of the molecule, if already
+            made.
+        matches : {} = None
+            The matches of SMARTS in the molecule, shared with the typing
+            for other forcefields, as in CompiledTemplates.assign().
+
+        Returns
+        -------
+        [str]
+            The atom types, '?' for atoms that could not be typed.
+        """
+        atomtypes = self.templates.assign(
+            molecule,
+            atom_types,
+            profile=self.profile,
+            engine=self.engine,
+            arrays=arrays,
+            matches=matches
+        )
+
+        untyped = [
+            i for i, atom_type in enumerate(atomtypes) if atom_type == '?'
+        ]
+        if logger.isEnabledFor(logging.DEBUG):
+            for atom, atom_type in zip(molecule.GetAtoms(), atomtypes):
+                logger.debug("{}: {}".format(atom.GetSymbol(), atom_type))
 
         if len(untyped) > 0:
-            logger.warning(
-                'The forcefield does not have atom types for'
-                ' the molecule!. See missing_atomtypes.png'
-                ' for more detail.'
+            # Reported for the whole system by the caller
+            logger.debug(
+                f'{len(untyped)} atoms of the molecule have no atom type'
             )
-            #rdkit.Chem.AllChem.Compute2DCoords(molecule)
-            #img = rdkit.Chem.Draw.MolToImage(
-            #    molecule,
-            #    size=(1000, 1000),
-            #    highlightAtoms=untyped,
-            #    highlightColor=(0, 1, 0)
-            #)
-            #img.save('missing_atomtypes.png')
-
-            #if self.have_tk:
-            #    root = tk.Tk()
-            #    root.title('Atom types')
-            #    tkPI = ImageTk.PhotoImage(img)
-            #    tkLabel = tk.Label(root, image=tkPI)
-            #    tkLabel.place(x=0, y=0, width=img.size[0], height=img.size[1])
-            #    root.geometry('%dx%d' % (img.size))
-            #    root.mainloop()
         else:
             logger.info('The molecule was successfully atom-typed')
 
+        if logger.isEnabledFor(logging.INFO):
+            logger.info('Atom types: ' + ', '.join(atomtypes))
+
+        return atomtypes
+
+    def assign_charges(self, atomtypes, bonds, atoms=None, charges=None):
+        """Find the charges from the bond increments of the forcefield.
+
+        Parameters
+        ----------
+        atomtypes : [str]
+            The atom types of the atoms.
+        bonds : [(int, int, ...)]
+            The bonds, each starting with the indices of its two atoms.
+        atoms : iterable(int) = None
+            The indices of the atoms to find charges for. By default, all.
+        charges : [float] = None
+            The current charges, which are kept for the other atoms.
+
+        Returns
+        -------
+        [float]
+            The charges, or None if the forcefield has no bond increments.
+        """
+        if not self.have_bond_increments:
+            return None
+
+        logger.debug('Getting the charges for the system')
+
+        bond_i, bond_j = bond_arrays(bonds)
+        result = bond_increment_charges(
+            self.charge_table,
+            atomtypes,
+            bond_i,
+            bond_j,
+            atoms=atoms,
+            charges=charges
+        )
+        return result.tolist()
+
+    @property
+    def charge_table(self):
+        """The charges and bond increments of the forcefield as arrays.
+
+        The table is built the first time it is needed and then reused.
+        """
+        data = self._loaded()
+        if data['charge_table'] is None:
+            data['charge_table'] = ChargeTable(self.forcefield)
+        return data['charge_table']
+
+    @property
+    def have_bond_increments(self):
+        """Whether the selected forcefield has bond increments for charges."""
+        forcefields = self.forcefield.data['forcefield']
+        terms = forcefields[self.selected_forcefield]['parameters']
+        return 'bond_increments' in terms
+
+    def store_parameters(self, configuration, atomtypes, charges=None):
+        """Write the atom types and charges into the configuration.
 
-        logger.info('Atom types: ' + ', '.join(atomtypes))
+        Parameters
+        ----------
+        configuration : molsystem.Configuration
+            The configuration.
+        atomtypes : [str]
+            The atom types.
+        charges : [float] = None
+            The charges, if any.
+
+        Returns
+        -------
+        None
+        """
         key = f'atomtypes_{self.selected_forcefield}'
         if key not in configuration.atoms:
             configuration.atoms.add_attribute(key, coltype='str')
         configuration.atoms[key] = atomtypes
 
-        # Now get the charges if forcefield has them.
-        terms = self.forcefield.data['forcefield'][self.selected_forcefield]['parameters']
-
-        if 'bond_increments' in terms:
-            logger.debug('Getting the charges for the system')
-            neighbors = configuration.bonded_neighbors(as_indices=True)
-
-            charges = []
-            total_q = 0.0
-            for i in range(configuration.n_atoms):
-                itype = atomtypes[i]
-                parameters = self.forcefield.charges(itype)[3]
-                q = float(parameters['Q'])
-                for j in neighbors[i]:
-                    jtype = atomtypes[j]
-                    parameters = self.forcefield.bond_increments(itype, jtype)[3]
-                    q += float(parameters['deltaij'])
-                charges.append(q)
-                total_q += q
-            if abs(total_q) > 0.0001:
-                logger.warning('Total charge is not zero: {}'.format(total_q))
-                logger.info(
-                    'Charges from increments and charges:\n' +
-                    pprint.pformat(charges)
-                )
-            else:
-                logger.debug(
-                    'Charges from increments:\n' + pprint.pformat(charges)
-                )
-
+        if charges is not None:
             key = f'charges_{self.selected_forcefield}'
             if key not in configuration.atoms:
                 configuration.atoms.add_attribute(key, coltype='float')
@@ -287,16 +785,898 @@ class SeammDefaultAtomtyping:
             charge_column[0:] = charges
             logger.debug(f"Set column '{key}' to the charges")
 
-            printer.important(
-                __(
-                    "Assigned atom types and charges to "
-                    f"{configuration.n_atoms} atoms.",
+    def reassign_parameters(
+        self, configuration, changed_atoms=None, changed_bonds=None
+    ):
+        """Update the atom types and charges after a structure edit.
+
+        Only the atoms close enough to the edit that their types could
+        change are typed again, giving the same result as typing the whole
+        configuration. If the configuration has not been typed before, it
+        is typed in full.
+
+        Parameters
+        ----------
+        configuration : molsystem.Configuration
+            The edited configuration, with the atom types from before the
+            edit in its atomtypes column.
+        changed_atoms : iterable(int) = None
+            The indices of atoms that were added or changed.
+        changed_bonds : iterable((int, int)) = None
+            The pairs of atom indices of bonds that were added, removed or
+            changed.
+
+        Returns
+        -------
+        None
+        """
+        key = f'atomtypes_{self.selected_forcefield}'
+        if key not in configuration.atoms:
+            self.assign_parameters(configuration)
+            return
+
+        changed = set() if changed_atoms is None else set(changed_atoms)
+        if changed_bonds is not None:
+            for i, j in changed_bonds:
+                changed.add(i)
+                changed.add(j)
+
+        atomtypes = configuration.atoms.get_column_data(key)
+        key = f'charges_{self.selected_forcefield}'
+        if key in configuration.atoms:
+            charges = configuration.atoms.get_column_data(key)
+        else:
+            charges = None
+
+        with self._phase('graph'):
+            graph = configuration_to_graph(configuration)
+        atomtypes, charges = self.retype_graph(
+            graph, atomtypes, changed, charges=charges
+        )
+        with self._phase('store'):
+            self.store_parameters(configuration, atomtypes, charges)
+
+        printer.important(
+            __(
+                f"Updated the atom types of {configuration.n_atoms} atoms "
+                f"after changes to {len(changed)} atoms.",
+            )
+        )
+
+        self.print_profile()
+
+    def retype_graph(self, graph, atomtypes, changed_atoms, charges=None):
+        """Update the atom types and charges of part of a molecular graph.
+
+        An atom's type depends only on the atoms within the radius of the
+        largest template, so only the atoms that close to a change are
+        typed again, in a molecule built from just enough of their
+        surroundings, so that the cost does not depend on the size of the
+        system. Aromaticity and small rings can reach further, so the
+        region also includes the atoms within a few bonds of the changes
+        and any conjugated systems they are part of.
+
+        Parameters
+        ----------
+        graph : {str: []}
+            The graph after the edit, as returned by
+            configuration_to_graph().
+        atomtypes : [str]
+            The atom types before the edit. Atoms with no type, including
+            any beyond the end of the list, are typed again.
+        changed_atoms : iterable(int)
+            The indices of the atoms that changed or whose bonds changed.
+        charges : [float] = None
+            The charges before the edit. If given, only the charges that
+            can change are recalculated.
+
+        Returns
+        -------
+        ([str], [float])
+            The atom types and charges, which are None if the forcefield
+            has no bond increments.
+        """
+        n_atoms = len(graph['atomic_numbers'])
+        atomtypes = list(atomtypes)[0:n_atoms]
+        atomtypes.extend([None] * (n_atoms - len(atomtypes)))
+        changed = set(changed_atoms)
+        changed.update(
+            i for i, atom_type in enumerate(atomtypes)
+            if atom_type is None or atom_type == ''
+        )
+
+        radius = self.templates.radius
+        if radius is None or graph.get('offsets') is not None:
+            return self.type_graph(graph)
+
+        neighbors = graph_bond_orders(graph)
+        seeds = atoms_within(neighbors, changed, ring_margin)
+        seeds.update(graph_conjugated_systems(neighbors, seeds))
+        affected = atoms_within(neighbors, seeds, radius)
+        if 2 * len(affected) > n_atoms:
+            # Not worth the overhead
+            return self.type_graph(graph)
+
+        # The region around the atoms being typed holds their small rings
+        # and the whole of any conjugated systems, so that the rings and
+        # aromaticity are those of the full molecule.
+        context = atoms_within(neighbors, affected, radius + ring_margin)
+        conjugated = graph_conjugated_systems(neighbors, context)
+        context.update(atoms_within(neighbors, conjugated, 1))
+        indices, subgraph = extract_subgraph(
+            graph, neighbors, context, graph_formal_charges(graph)
+        )
+        local = {i: k for k, i in enumerate(indices)}
+        with self._phase('molecule'):
+            submol = graph_to_molecule(
+                subgraph, max_ring_size=self._max_ring_size(n_atoms)
+            )
+        logger.debug(
+            f'Retyping {len(affected)} atoms in a submolecule of '
+            f'{len(indices)} atoms'
+        )
+
+        # Mark the atoms that are not being retyped so they are left alone
+        sub_types = ['?' if i in affected else '-' for i in indices]
+        with self._phase('match'):
+            sub_types = self.templates.assign(
+                submol, sub_types, profile=self.profile, engine=self.engine
+            )
+        del submol
+        for i, atom_type in zip(indices, sub_types):
+            if i in affected:
+                atomtypes[i] = atom_type
+
+        self.untyped_report = None
+        self._check_untyped(
+            graph, [i for i in affected if atomtypes[i] == '?']
+        )
+
+        with self._phase('charges'):
+            if charges is None or len(charges) != n_atoms:
+                return atomtypes, self.assign_charges(
+                    atomtypes, graph['bonds']
+                )
+
+            # All the bonds of the atoms whose charges change are in the
+            # region.
+            atoms = atoms_within(neighbors, affected, 1)
+            sub_charges = self.assign_charges(
+                [atomtypes[i] for i in indices],
+                subgraph['bonds'],
+                atoms=[local[i] for i in atoms],
+                charges=[charges[i] for i in indices]
+            )
+        if sub_charges is None:
+            return atomtypes, None
+        charges = list(charges)
+        for i in atoms:
+            charges[i] = sub_charges[local[i]]
+        return atomtypes, charges
+
+    def type_graph(self, graph, chunk_size=None, repeat_units=None):
+        """Find the atom types and charges for a molecular graph.
+
+        The graph is split into its molecules, i.e. connected components,
+        and identical molecules are grouped so that only one of each is
+        typed. Its atom types and charges are then copied to the others.
+
+        Parameters
+        ----------
+        graph : {str: []}
+            The graph, as returned by configuration_to_graph().
+        chunk_size : int = None
+            If given, molecules with more atoms than this are typed in
+            chunks, as in stream_graph().
+        repeat_units : [[int]] = None
+            The atoms of the repeat units of polymer chains, as in
+            stream_graph().
+
+        Returns
+        -------
+        ([str], [float])
+            The atom types and charges, which are None if the forcefield
+            has no bond increments.
+
+        Raises
+        ------
+        UntypedAtomsError
+            If any atoms could not be typed, which are described in
+            untyped_report, and the forcefield has bond increments, so
+            the charges cannot be found. Otherwise the untyped atoms have
+            the type '?'.
+        """
+        atomtypes, charges = _gather(
+            len(graph['atomic_numbers']),
+            self.stream_graph(
+                graph, chunk_size=chunk_size, repeat_units=repeat_units
+            )
+        )
+        if charges is None:
+            return atomtypes, None
+
+        if logger.isEnabledFor(logging.INFO) and abs(sum(charges)) > 0.0001:
+            logger.info(
+                'Charges from increments and charges:\n' +
+                pprint.pformat(charges)
+            )
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                'Charges from increments:\n' + pprint.pformat(charges)
+            )
+
+        return atomtypes, charges
+
+    def type_graph_forcefields(self, graph, forcefields=None):
+        """Find the atom types and charges of a graph for forcefields.
+
+        Each distinct molecule in the graph is built once and typed for
+        all the forcefields, sharing the work as in
+        type_molecule_forcefields(). Periodic graphs, and molecules long
+        enough to be typed from their repeat units, are typed with
+        type_graph() one forcefield at a time.
+
+        Parameters
+        ----------
+        graph : {str: []}
+            The graph, as returned by configuration_to_graph().
+        forcefields : [str] = None
+            The names of the forcefields, by default all those loaded.
+
+        Returns
+        -------
+        {str: ([str], [float])}
+            The atom types and charges for each forcefield, the charges
+            being None if the forcefield has no bond increments.
+        """
+        if forcefields is None:
+            forcefields = list(self.supported_forcefield)
+
+        self.untyped_report = None
+        if graph.get('offsets') is not None:
+            result = {}
+            for name in forcefields:
+                with self._using(name):
+                    result[name] = self.type_graph(graph)
+            return result
+
+        n_atoms = len(graph['atomic_numbers'])
+        atomtypes = {name: ['?'] * n_atoms for name in forcefields}
+        charges = {name: [0.0] * n_atoms for name in forcefields}
+        results = {}
+        for atoms, subgraph in iter_split_graph(graph):
+            signature = graph_signature(subgraph)
+            if signature not in results:
+                if (
+                    self.detect_repeat_units and
+                    len(atoms) >= repeat_units_above
+                ):
+                    # Checked for untyped atoms in the whole graph below
+                    typed = {}
+                    for name in forcefields:
+                        with self._using(name):
+                            typed[name] = _gather(
+                                len(atoms), self._stream_graph(subgraph)
+                            )
+                else:
+                    max_ring_size = self._max_ring_size(len(atoms))
+                    with self._phase('molecule'):
+                        molecule = graph_to_molecule(
+                            subgraph, max_ring_size=max_ring_size
+                        )
+                    typed = self.type_molecule_forcefields(
+                        molecule, forcefields, use_cache=max_ring_size is None
+                    )
+                    del molecule
+                if len(results) >= max_molecules:
+                    # Forget the oldest to bound the memory
+                    del results[next(iter(results))]
+                results[signature] = typed
+            for name, (part_types, part_charges) in results[signature].items():
+                for i, atom_type in zip(atoms, part_types):
+                    atomtypes[name][i] = atom_type
+                if part_charges is None:
+                    charges[name] = None
+                elif charges[name] is not None:
+                    for i, q in zip(atoms, part_charges):
+                        charges[name][i] = q
+
+        for name in forcefields:
+            with self._using(name):
+                self._check_untyped(
+                    graph, [
+                        i for i, atom_type in enumerate(atomtypes[name])
+                        if atom_type == '?'
+                    ]
+                )
+
+        return {name: (atomtypes[name], charges[name]) for name in forcefields}
+
+    def stream_graph(self, graph, chunk_size=None, repeat_units=None):
+        """Find the atom types and charges of a graph a piece at a time.
+
+        The molecules, i.e. connected components, of the graph are typed
+        one at a time, and the types and charges of each are yielded as
+        soon as they are found. Only the RDKit molecule of the current
+        molecule is held, so the memory needed is set by the largest
+        molecule rather than the whole system. The results for identical
+        molecules are reused.
+
+        Molecules larger than chunk_size, such as network solids, are
+        typed in compact chunks of that many atoms. Each chunk is typed in
+        a region that adds the atoms within the radius of the templates,
+        plus a margin for rings of up to 8 atoms and any aromatic systems
+        joined by aromatic bonds, so the types are those of the whole
+        molecule. Fused rings given as alternating single and double
+        bonds are not extended, so large ones should use aromatic bonds
+        when chunking.
+
+        Polymer chains with many repeat units, given or found from the
+        atom order, are shortened to a few units at each end. Only the
+        short chain is typed, and the types and charges of the units at
+        the junction, which must agree, are copied to the others.
+
+        Parameters
+        ----------
+        graph : {str: []}
+            The graph, as returned by configuration_to_graph().
+        chunk_size : int = None
+            The number of atoms in each chunk of a large molecule. By
+            default, molecules are not divided.
+        repeat_units : [[int]] = None
+            The atoms of each repeat unit of the polymer chains, e.g. from
+            the builder, with corresponding atoms in the same order in
+            each unit, and the units in order along each chain. Ignored
+            for periodic systems.
+
+        Yields
+        ------
+        ([int], [str], [float])
+            The indices of the atoms of a molecule or chunk, and their
+            atom types and charges. The charges are None if the forcefield
+            has no bond increments.
+
+        Raises
+        ------
+        UntypedAtomsError
+            After the last piece, if any atoms could not be typed, which
+            are described in untyped_report, and the forcefield has bond
+            increments, so the charges cannot be found.
+        """
+        self.untyped_report = None
+        untyped = []
+        for part in self._stream_graph(graph, chunk_size, repeat_units):
+            untyped.extend(
+                i for i, atom_type in zip(*part[0:2]) if atom_type == '?'
+            )
+            yield part
+        self._check_untyped(graph, untyped)
+
+    def _stream_graph(self, graph, chunk_size=None, repeat_units=None):
+        """Type a graph a piece at a time, for stream_graph().
+
+        The same as stream_graph(), except that atoms that could not be
+        typed are left with the type '?' and no charges.
+        """
+        # A periodic graph is typed as an ordinary graph of a large enough
+        # supercell, keeping just the atoms of the original cell.
+        n_atoms = len(graph['atomic_numbers'])
+        periodic = graph.get('offsets') is not None
+        if periodic:
+            with self._phase('graph'):
+                graph, _ = unwrap_periodic_graph(
+                    graph, 2 * max(self.templates.radius or 0, ring_margin)
+                )
+
+        def select(atoms, atomtypes, charges):
+            if not periodic:
+                return atoms, atomtypes, charges
+            keep = [k for k, i in enumerate(atoms) if i < n_atoms]
+            return (
+                [atoms[k] for k in keep], [atomtypes[k] for k in keep],
+                None if charges is None else [charges[k] for k in keep]
+            )
+
+        # The given repeat units, keyed by their first atom
+        first_atoms = {}
+        if repeat_units is not None and not periodic:
+            first_atoms = {unit[0]: t for t, unit in enumerate(repeat_units)}
+
+        results = {}
+        n_molecules = 0
+        # The total charge, or None if any piece has no charges
+        total_q = 0.0
+        for atoms, subgraph in iter_split_graph(graph):
+            if periodic and atoms[0] >= n_atoms:
+                # An image of a molecule in another cell of the supercell
+                continue
+            n_molecules += 1
+
+            signature = graph_signature(subgraph)
+            if signature not in results:
+                typed = None
+                units = self._repeat_units(
+                    atoms, subgraph, repeat_units, first_atoms
+                )
+                if units is not None:
+                    typed = self._type_repeat_units(subgraph, units, periodic)
+                if (
+                    typed is None and chunk_size is not None and
+                    len(atoms) > chunk_size
+                ):
+                    for chunk, atomtypes, charges in self._stream_chunks(
+                        subgraph, chunk_size, periodic
+                    ):
+                        part = select(
+                            [atoms[i] for i in chunk], atomtypes, charges
+                        )
+                        if len(part[0]) == 0:
+                            continue
+                        if part[2] is None:
+                            total_q = None
+                        elif total_q is not None:
+                            total_q += sum(part[2])
+                        yield part
+                    continue
+                if typed is None:
+                    max_ring_size = self._max_ring_size(len(atoms), periodic)
+                    with self._phase('molecule'):
+                        molecule = graph_to_molecule(
+                            subgraph, max_ring_size=max_ring_size
+                        )
+                    typed = self.type_molecule(
+                        molecule, use_cache=max_ring_size is None
+                    )
+                    del molecule
+                if len(results) >= max_molecules:
+                    # Forget the oldest to bound the memory
+                    del results[next(iter(results))]
+                results[signature] = typed
+            atomtypes, charges = results[signature]
+            part = select(atoms, atomtypes, charges)
+            if part[2] is None:
+                total_q = None
+            elif total_q is not None:
+                total_q += sum(part[2])
+            yield part
+
+        logger.debug(
+            f'The system has {n_molecules} molecules, with at least '
+            f'{len(results)} unique ones'
+        )
+        if total_q is not None and abs(total_q) > 0.0001:
+            logger.warning('Total charge is not zero: {}'.format(total_q))
+
+    def _check_untyped(self, graph, untyped):
+        """Report any atoms that could not be typed.
+
+        The untyped atoms are grouped by their environment in the system,
+        including all the copies of identical molecules, and the report
+        is kept in untyped_report and written to missing_atom_types.json,
+        with a drawing of the environments, in the directory of the step.
+        If the forcefield has bond increments, the charges cannot be found
+        so UntypedAtomsError is raised, otherwise a warning is logged.
+
+        Parameters
+        ----------
+        graph : {str: []}
+            The graph, as returned by configuration_to_graph().
+        untyped : iterable(int)
+            The indices of the atoms that could not be typed.
+
+        Returns
+        -------
+        None
+        """
+        untyped = set(untyped)
+        if len(untyped) == 0:
+            return
+
+        # The environments of the atoms of a periodic system are found in
+        # a supercell, as in stream_graph(), ignoring the images.
+        n_atoms = len(graph['atomic_numbers'])
+        periodic = graph.get('offsets') is not None
+        if periodic:
+            graph, _ = unwrap_periodic_graph(
+                graph, 2 * max(self.templates.radius or 0, ring_margin)
+            )
+
+        # Only one of each distinct molecule with untyped atoms is built
+        groups = {}
+        for atoms, subgraph in iter_split_graph(graph):
+            if atoms[0] >= n_atoms or untyped.isdisjoint(atoms):
+                continue
+            atomtypes = ['?' if i in untyped else '-' for i in atoms]
+            key = (graph_signature(subgraph), tuple(atomtypes))
+            if key not in groups:
+                groups[key] = (subgraph, atomtypes, [])
+            groups[key][2].append(atoms)
+
+        parts = []
+        molecules = {}
+        for subgraph, atomtypes, copies in groups.values():
+            with self._phase('molecule'):
+                molecule = graph_to_molecule(
+                    subgraph,
+                    max_ring_size=self._max_ring_size(len(copies[0]), periodic)
                 )
+            report = untyped_report(molecule, atomtypes)
+            for environment, mol in zip(
+                report['environments'],
+                environment_molecules(molecule, report)
+            ):
+                molecules.setdefault(environment['smiles'], mol)
+            parts.append((report, copies))
+            del molecule
+
+        report = combine_reports(parts, n_atoms)
+        self.untyped_report = report
+        message = (
+            f"The forcefield '{self.selected_forcefield}' does not have atom "
+            'types for all the atoms. ' + diagnostics_summary(report)
+        )
+        try:
+            filename, _ = write_report(
+                report,
+                [molecules[e['smiles']] for e in report['environments']],
+                directory=self.directory
             )
+        except OSError as e:
+            logger.warning(f'Could not write the report on untyped atoms: {e}')
         else:
-            printer.important(
-                __(
-                    f"Assigned atom types to {configuration.n_atoms} "
-                    "atoms.",
+            message += f"\nThe full report is in '{filename}'."
+        if self.have_bond_increments:
+            raise UntypedAtomsError(message, report)
+        logger.warning(message)
+
+    def _repeat_units(self, atoms, graph, repeat_units, first_atoms):
+        """The repeat units of a molecule, if it is worth using them.
+
+        Parameters
+        ----------
+        atoms : [int]
+            The indices of the atoms of the molecule in the full graph.
+        graph : {str: []}
+            The graph of the molecule.
+        repeat_units : [[int]]
+            The repeat units given for the full graph, or None.
+        first_atoms : {int: int}
+            The index of each given repeat unit, keyed by its first atom.
+
+        Returns
+        -------
+        [[int]]
+            The atoms of the repeat units in the molecule's graph, or None.
+        """
+        if self.templates.radius is None:
+            return None
+        min_repeats = 2 * (self.templates.radius + 2) + 1
+
+        units = [first_atoms[i] for i in atoms if i in first_atoms]
+        if len(units) > 0:
+            local = {i: k for k, i in enumerate(atoms)}
+            try:
+                units = [
+                    [local[i] for i in repeat_units[t]] for t in sorted(units)
+                ]
+            except KeyError:
+                units = None
+            if units is None or not check_repeat_units(graph, units):
+                logger.warning(
+                    'The repeat units given do not match the molecule, so '
+                    'it is typed in full.'
+                )
+                return None
+            return units if len(units) >= min_repeats else None
+
+        if not self.detect_repeat_units or len(atoms) < repeat_units_above:
+            return None
+        with self._phase('graph'):
+            return find_repeat_units(graph, min_repeats=min_repeats)
+
+    def _type_repeat_units(self, graph, units, periodic=False):
+        """Type a polymer chain from a short chain with the same ends.
+
+        Parameters
+        ----------
+        graph : {str: []}
+            The graph of the molecule.
+        units : [[int]]
+            The atoms of the repeat units, in order along the chain.
+        periodic : bool = False
+            Whether the molecule is part of a periodic system.
+
+        Returns
+        -------
+        ([str], [float])
+            The atom types and charges, or None if the units either side
+            of the junction in the short chain differ, so the chain must
+            be typed in full.
+        """
+        n_end = self.templates.radius + 2
+        with self._phase('molecule'):
+            indices, short = shorten_chain(graph, units, n_end)
+            max_ring_size = self._max_ring_size(len(indices), periodic)
+            molecule = graph_to_molecule(short, max_ring_size=max_ring_size)
+        atomtypes, charges = self.type_molecule(
+            molecule, use_cache=max_ring_size is None
+        )
+        del molecule
+
+        # The units either side of the junction are far enough from the
+        # ends to be like any in the middle of the chain.
+        local = {i: k for k, i in enumerate(indices)}
+        before = [local[i] for i in units[n_end - 1]]
+        after = [local[i] for i in units[-n_end]]
+        same = all(atomtypes[k] == atomtypes[m] for k, m in zip(before, after))
+        if same and charges is not None:
+            same = all(
+                abs(charges[k] - charges[m]) < 1.0e-6
+                for k, m in zip(before, after)
+            )
+        if not same:
+            logger.debug(
+                'The repeat units at the junction of the short chain differ, '
+                'so the chain is typed in full.'
+            )
+            return None
+
+        n_atoms = len(graph['atomic_numbers'])
+        result_types = [None] * n_atoms
+        result_charges = None if charges is None else [0.0] * n_atoms
+        for k, i in enumerate(indices):
+            result_types[i] = atomtypes[k]
+            if charges is not None:
+                result_charges[i] = charges[k]
+        for unit in units[n_end:-n_end]:
+            for i, k in zip(unit, before):
+                result_types[i] = atomtypes[k]
+                if charges is not None:
+                    result_charges[i] = charges[k]
+        return result_types, result_charges
+
+    def _max_ring_size(self, n_atoms, periodic=False):
+        """The largest ring to find in a molecule, or None for all rings.
+
+        Parameters
+        ----------
+        n_atoms : int
+            The number of atoms in the molecule.
+        periodic : bool = False
+            Whether the molecule is part of a periodic system.
+
+        Returns
+        -------
+        int
+            The max_ring_size for graph_to_molecule().
+        """
+        if self.ring_perception == 'full':
+            return None
+        if (
+            self.ring_perception == 'small' or periodic or
+            n_atoms >= small_rings_above
+        ):
+            return small_ring_size
+        return None
+
+    def _stream_chunks(self, graph, chunk_size, periodic=False):
+        """Type a large molecular graph in chunks, for stream_graph()."""
+        n_atoms = len(graph['atomic_numbers'])
+        radius = self.templates.radius
+        if radius is None:
+            # Templates of unbounded reach need the whole molecule
+            max_ring_size = self._max_ring_size(n_atoms, periodic)
+            with self._phase('molecule'):
+                molecule = graph_to_molecule(
+                    graph, max_ring_size=max_ring_size
                 )
-            )
\ No newline at end of file
+            atomtypes, charges = self.type_molecule(
+                molecule, use_cache=max_ring_size is None
+            )
+            yield list(range(n_atoms)), atomtypes, charges
+            return
+
+        neighbors = graph_bond_orders(graph)
+        formal_charges = graph_formal_charges(graph)
+        chunks = graph_chunks(neighbors, chunk_size)
+        logger.debug(
+            f'Typing a molecule of {n_atoms} atoms in {len(chunks)} chunks'
+        )
+        for chunk in chunks:
+            # The charges need the types of the neighbors of the chunk
+            typed = atoms_within(neighbors, chunk, 1)
+            context = atoms_within(neighbors, typed, radius + ring_margin)
+            aromatic = graph_aromatic_systems(neighbors, context)
+            context.update(atoms_within(neighbors, aromatic, 1))
+            indices, subgraph = extract_subgraph(
+                graph, neighbors, context, formal_charges
+            )
+            local = {i: k for k, i in enumerate(indices)}
+            with self._phase('molecule'):
+                molecule = graph_to_molecule(
+                    subgraph,
+                    max_ring_size=self._max_ring_size(len(indices), periodic)
+                )
+
+            atomtypes = ['-'] * len(indices)
+            for i in typed:
+                atomtypes[local[i]] = '?'
+            with self._phase('match'):
+                atomtypes = self.assign_atomtypes(molecule, atomtypes)
+            del molecule
+
+            core = [local[i] for i in chunk]
+            if '?' in atomtypes:
+                # Reported by stream_graph(), rather than failing here
+                charges = None
+            else:
+                with self._phase('charges'):
+                    charges = self.assign_charges(
+                        atomtypes, subgraph['bonds'], atoms=core
+                    )
+            yield (
+                chunk, [atomtypes[k] for k in core],
+                None if charges is None else [charges[k] for k in core]
+            )
+
+    def stream_parameters(
+        self,
+        configuration,
+        chunk_size=None,
+        batch_size=10000,
+        repeat_units=None
+    ):
+        """Type a configuration a piece at a time, writing as it goes.
+
+        This is the counterpart of assign_parameters() for very large
+        systems. The atom types and charges from stream_graph() are
+        written into the columns of the configuration in batches, and
+        each piece is also yielded. The configuration is completely typed
+        only when the generator is exhausted.
+
+        Parameters
+        ----------
+        configuration : molsystem.Configuration
+            The configuration to type.
+        chunk_size : int = None
+            The number of atoms in each chunk of a large molecule. By
+            default, molecules are not divided.
+        batch_size : int = 10000
+            The number of atoms to gather before writing to the
+            configuration.
+        repeat_units : [[int]] = None
+            The atoms of the repeat units of polymer chains, as in
+            stream_graph().
+
+        Yields
+        ------
+        ([int], [str], [float])
+            The indices of the atoms of a molecule or chunk, and their
+            atom types and charges. The charges are None if the forcefield
+            has no bond increments.
+        """
+        with self._phase('graph'):
+            graph = configuration_to_graph(configuration)
+
+        pending = []
+        n_pending = 0
+        for part in self.stream_graph(
+            graph, chunk_size=chunk_size, repeat_units=repeat_units
+        ):
+            pending.append(part)
+            n_pending += len(part[0])
+            if n_pending >= batch_size:
+                with self._phase('store'):
+                    self._store_parts(configuration, pending)
+                pending = []
+                n_pending = 0
+            yield part
+        with self._phase('store'):
+            self._store_parts(configuration, pending)
+
+    def _store_parts(self, configuration, parts):
+        """Write pieces of the atom types and charges to a configuration.
+
+        Each run of consecutive atoms is written with one update.
+
+        Parameters
+        ----------
+        configuration : molsystem.Configuration
+            The configuration.
+        parts : [([int], [str], [float])]
+            The atom indices, types and charges of each piece.
+
+        Returns
+        -------
+        None
+        """
+        if len(parts) == 0:
+            return
+        values = sorted(
+            (i, atom_type, None if charges is None else charges[k])
+            for atoms, atomtypes, charges in parts
+            for k, (i, atom_type) in enumerate(zip(atoms, atomtypes))
+        )
+
+        columns = [(1, f'atomtypes_{self.selected_forcefield}', 'str')]
+        if values[0][2] is not None:
+            columns.append(
+                (2, f'charges_{self.selected_forcefield}', 'float')
+            )
+        for position, key, coltype in columns:
+            if key not in configuration.atoms:
+                configuration.atoms.add_attribute(key, coltype=coltype)
+            column = configuration.atoms.get_column(key)
+            start = 0
+            for end in range(1, len(values) + 1):
+                if (
+                    end == len(values) or
+                    values[end][0] != values[end - 1][0] + 1
+                ):
+                    column[values[start][0]:values[end - 1][0] + 1] = [
+                        v[position] for v in values[start:end]
+                    ]
+                    start = end
+
+
+# The atom typer in each worker process of assign_parameters_many
+_worker_typer = None
+
+
+def _initialize_worker(options, forcefield, path, directory):
+    """Create the atom typer of a worker process when it starts.
+
+    Parameters
+    ----------
+    options : {str: object}
+        The arguments for SeammDefaultAtomtyping.
+    forcefield : str
+        The name of the forcefield to type with.
+    path : str
+        The path to its file, which is added in case it is not found in
+        the forcefield directories.
+    directory : str
+        The directory for any report on untyped atoms.
+
+    Returns
+    -------
+    None
+    """
+    global _worker_typer
+    _worker_typer = SeammDefaultAtomtyping(**options)
+    _worker_typer.directory = directory
+    _worker_typer.add_forcefield(path)
+    _worker_typer.select_forcefield(forcefield)
+
+
+def _gather(n_atoms, parts):
+    """The atom types and charges of a graph from the pieces typed.
+
+    Parameters
+    ----------
+    n_atoms : int
+        The number of atoms in the graph.
+    parts : iterable(([int], [str], [float]))
+        The pieces, as from stream_graph().
+
+    Returns
+    -------
+    ([str], [float])
+        The atom types and charges, which are None if any piece has none.
+    """
+    atomtypes = ['?'] * n_atoms
+    charges = [0.0] * n_atoms
+    for atoms, part_types, part_charges in parts:
+        for i, atom_type in zip(atoms, part_types):
+            atomtypes[i] = atom_type
+        if part_charges is None:
+            charges = None
+        elif charges is not None:
+            for i, q in zip(atoms, part_charges):
+                charges[i] = q
+    return atomtypes, charges
+
+
+def _assign_graph(graph):
+    """Type a molecular graph in a worker process."""
+    return _worker_typer.type_graph(graph)
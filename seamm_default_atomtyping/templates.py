@@ -0,0 +1,889 @@
+# -*- coding: utf-8 -*-
+
+"""The SMARTS templates of a forcefield, compiled once for reuse."""
+
+import collections
+import logging
+import time
+
+import numpy as np
+import rdkit
+import rdkit.Chem
+
+from seamm_default_atomtyping.decision_tree import DecisionTree
+
+logger = logging.getLogger(__name__)
+
+# RDKit stops after 1000 matches by default, which silently leaves atoms
+# untyped in large systems.
+max_matches = 2**31 - 1
+
+CompiledTemplate = collections.namedtuple(
+    'CompiledTemplate',
+    [
+        'atom_type', 'smarts', 'pattern', 'map_list', 'elements',
+        'requirements', 'query', 'compile_time'
+    ]
+)
+
+# The features of an atom used to prefilter the templates: the atomic
+# number, whether it is aromatic, its formal charge, and whether it is in a
+# ring. In the description of a query, None means any value.
+AtomFeatures = collections.namedtuple(
+    'AtomFeatures', ['atomic_number', 'aromatic', 'charge', 'in_ring']
+)
+
+_any_atom = AtomFeatures(None, None, None, None)
+
+# The ways of matching the templates to a molecule: 'smarts' runs each in
+# turn, and 'tree' uses the decision tree on the atom properties.
+engines = ('smarts', 'tree')
+
+# The primitives of single-atom queries that are evaluated on the arrays of
+# atom properties, and the array for each.
+_array_primitives = {
+    'AtomType': 'atom_type',
+    'AtomAtomicNum': 'atomic_number',
+    'AtomIsAromatic': 'aromatic',
+    'AtomTotalDegree': 'degree',
+    'AtomExplicitDegree': 'explicit_degree',
+    'AtomHCount': 'h_count',
+    'AtomFormalCharge': 'charge',
+    'AtomMinRingSize': 'min_ring_size',
+    'AtomInNRings': 'n_rings',
+    'AtomInRing': 'in_ring',
+}
+
+
+def unique_matches(matches):
+    """Remove the matches that cover the same atoms as an earlier one.
+
+    This gives the same result as the 'uniquify' option of
+    GetSubstructMatches(), which compares each match with every one kept
+    so far and so takes time proportional to the square of the number of
+    matches, many minutes for a large system.
+
+    Parameters
+    ----------
+    matches : ((int,),)
+        The matches, as returned by GetSubstructMatches().
+
+    Returns
+    -------
+    [(int,)]
+        The first match for each distinct set of atoms.
+    """
+    seen = set()
+    result = []
+    for match in matches:
+        key = frozenset(match)
+        if key not in seen:
+            seen.add(key)
+            result.append(match)
+    return result
+
+
+class AtomArrays(object):
+
+    def __init__(self, molecule):
+        """The properties of the atoms of a molecule as NumPy arrays.
+
+        Each array is found from the RDKit atoms when first needed, and
+        kept, so that the molecule is gone through once for each property
+        rather than once for each template.
+
+        Parameters
+        ----------
+        molecule : rdkit.Chem.Mol
+            The molecule.
+        """
+        self.molecule = molecule
+        self._atoms = None
+        self._arrays = {}
+
+    def __getitem__(self, name):
+        """The array of a property, one of those in _array_primitives."""
+        if name not in self._arrays:
+            self._arrays[name] = self._compute(name)
+        return self._arrays[name]
+
+    @property
+    def n_atoms(self):
+        """The number of atoms in the molecule."""
+        return self.molecule.GetNumAtoms()
+
+    def _compute(self, name):
+        if name == 'atom_type':
+            return self['atomic_number'] + 1000 * self['aromatic']
+        if name == 'in_ring':
+            return (self['n_rings'] > 0).astype(np.int64)
+
+        if name in ('min_ring_size', 'n_rings'):
+            ring_info = self.molecule.GetRingInfo()
+            if name == 'min_ring_size':
+                values = [
+                    ring_info.MinAtomRingSize(i) for i in range(self.n_atoms)
+                ]
+            else:
+                values = [
+                    ring_info.NumAtomRings(i) for i in range(self.n_atoms)
+                ]
+            return np.array(values, dtype=np.int64)
+
+        # Getting the atoms by index is faster than Mol.GetAtoms()
+        if self._atoms is None:
+            self._atoms = [
+                self.molecule.GetAtomWithIdx(i) for i in range(self.n_atoms)
+            ]
+        atoms = self._atoms
+        if name == 'atomic_number':
+            values = [atom.GetAtomicNum() for atom in atoms]
+        elif name == 'aromatic':
+            values = [atom.GetIsAromatic() for atom in atoms]
+        elif name == 'degree':
+            values = [atom.GetTotalDegree() for atom in atoms]
+        elif name == 'explicit_degree':
+            values = [atom.GetDegree() for atom in atoms]
+        elif name == 'h_count':
+            values = [
+                atom.GetTotalNumHs(includeNeighbors=True) for atom in atoms
+            ]
+        elif name == 'charge':
+            values = [atom.GetFormalCharge() for atom in atoms]
+        else:
+            raise KeyError(f"Unknown atom property '{name}'")
+        return np.array(values, dtype=np.int64)
+
+
+def atom_features(atom):
+    """The features of an atom in a molecule, for prefiltering templates.
+
+    Ring membership is taken from the molecule's ring information, as the
+    SMARTS ring primitives do, rather than from Atom.IsInRing(), which
+    may perceive the rings again.
+
+    Parameters
+    ----------
+    atom : rdkit.Chem.Atom
+        The atom.
+
+    Returns
+    -------
+    AtomFeatures
+    """
+    return AtomFeatures(
+        atom.GetAtomicNum(),
+        atom.GetIsAromatic(),
+        atom.GetFormalCharge(),
+        atom.GetOwningMol().GetRingInfo().NumAtomRings(atom.GetIdx()) > 0,
+    )
+
+
+def molecule_features(molecule, arrays=None):
+    """The distinct atom features in a molecule.
+
+    Parameters
+    ----------
+    molecule : rdkit.Chem.Mol
+        The molecule.
+    arrays : AtomArrays = None
+        The arrays of the atom properties of the molecule, if already
+        made.
+
+    Returns
+    -------
+    {AtomFeatures}
+        The set of the features of the atoms.
+    """
+    if arrays is None:
+        arrays = AtomArrays(molecule)
+    return {
+        AtomFeatures(z, bool(aromatic), charge, bool(in_ring))
+        for z, aromatic, charge, in_ring in set(
+            zip(
+                arrays['atomic_number'].tolist(),
+                arrays['aromatic'].tolist(), arrays['charge'].tolist(),
+                arrays['in_ring'].tolist()
+            )
+        )
+    }
+
+
+def query_features(atom):
+    """The alternative atom features that a SMARTS query atom requires.
+
+    Only the simple primitives -- element, aromaticity, formal charge and
+    ring membership -- are considered. Anything else, including negations,
+    is treated as matching any atom, so the result may be looser than the
+    query but is never stricter.
+
+    Parameters
+    ----------
+    atom : rdkit.Chem.QueryAtom
+        The query atom.
+
+    Returns
+    -------
+    frozenset(AtomFeatures)
+        The alternatives, any of which may match, or None if the query
+        could match any atom.
+    """
+    lines = atom.DescribeQuery().splitlines()
+    alternatives, _ = _parse_query(lines, 0)
+    if _any_atom in alternatives:
+        return None
+    return alternatives
+
+
+def query_elements(atom):
+    """The elements that a SMARTS query atom can match.
+
+    Parameters
+    ----------
+    atom : rdkit.Chem.QueryAtom
+        The query atom.
+
+    Returns
+    -------
+    frozenset(int)
+        The atomic numbers the query can match, or None if it could
+        match any element.
+    """
+    alternatives = query_features(atom)
+    if alternatives is None:
+        return None
+    elements = frozenset(x.atomic_number for x in alternatives)
+    if None in elements:
+        return None
+    return elements
+
+
+def features_match(required, features):
+    """Whether the features of an atom satisfy a requirement.
+
+    Parameters
+    ----------
+    required : AtomFeatures
+        The requirement, with None for any value.
+    features : AtomFeatures
+        The features of the atom.
+
+    Returns
+    -------
+    bool
+    """
+    for want, have in zip(required, features):
+        if want is not None and want != have:
+            return False
+    return True
+
+
+def _merge(first, second):
+    """Combine two requirements that must both hold, or None if they
+    cannot."""
+    result = []
+    for a, b in zip(first, second):
+        if a is None:
+            result.append(b)
+        elif b is None or a == b:
+            result.append(a)
+        else:
+            return None
+    return AtomFeatures(*result)
+
+
+def _parse_query(lines, start):
+    """Parse one node of the description of a query.
+
+    Returns the set of alternative features the node requires and the
+    index of the line following the node.
+    """
+    line = lines[start]
+    indent = len(line) - len(line.lstrip())
+    words = line.split()
+    if words[0] in ('AtomAnd', 'AtomOr'):
+        children = []
+        i = start + 1
+        while i < len(lines) and (
+            len(lines[i]) - len(lines[i].lstrip()) > indent
+        ):
+            child, i = _parse_query(lines, i)
+            children.append(child)
+        if words[0] == 'AtomOr':
+            return frozenset().union(*children), i
+        result = {_any_atom}
+        for child in children:
+            merged = set()
+            for a in result:
+                for b in child:
+                    tmp = _merge(a, b)
+                    if tmp is not None:
+                        merged.add(tmp)
+            result = merged
+        return frozenset(result), i
+
+    result = _any_atom
+    if len(words) >= 3 and words[2] == '=':
+        value = int(words[1])
+        if words[0] == 'AtomType':
+            result = AtomFeatures(value % 1000, value >= 1000, None, None)
+        elif words[0] == 'AtomAtomicNum':
+            result = AtomFeatures(value, None, None, None)
+        elif words[0] == 'AtomIsAromatic':
+            result = AtomFeatures(None, value == 1, None, None)
+        elif words[0] == 'AtomIsAliphatic':
+            result = AtomFeatures(None, value != 1, None, None)
+        elif words[0] == 'AtomFormalCharge':
+            result = AtomFeatures(None, None, value, None)
+        elif words[0] == 'AtomInNRings':
+            result = AtomFeatures(None, None, None, value != 0)
+        elif words[0] == 'AtomMinRingSize':
+            result = AtomFeatures(None, None, None, value > 0)
+    return frozenset([result]), start + 1
+
+
+def array_query(atom):
+    """Translate a SMARTS query atom to a test on the atom arrays.
+
+    Parameters
+    ----------
+    atom : rdkit.Chem.QueryAtom
+        The query atom.
+
+    Returns
+    -------
+    tuple
+        The query as nested tuples, ('and', [...]) or ('or', [...]) for
+        the logical operations, ('any',) for any atom, and (array, value,
+        negated) for the primitives. None if the query has primitives
+        other than those in _array_primitives, such as recursive SMARTS,
+        which then need RDKit's substructure matching.
+    """
+    lines = atom.DescribeQuery().splitlines()
+    query, end = _parse_array_query(lines, 0)
+    if end != len(lines):
+        return None
+    return query
+
+
+def _parse_array_query(lines, start):
+    """Parse one node of the description of a query for array_query().
+
+    Returns the node and the index of the line following it.
+    """
+    line = lines[start]
+    indent = len(line) - len(line.lstrip())
+    words = line.split()
+    if words[0] in ('AtomAnd', 'AtomOr'):
+        children = []
+        i = start + 1
+        while i < len(lines) and (
+            len(lines[i]) - len(lines[i].lstrip()) > indent
+        ):
+            child, i = _parse_array_query(lines, i)
+            if child is None:
+                return None, len(lines) + 1
+            children.append(child)
+        return ('and' if words[0] == 'AtomAnd' else 'or', children), i
+
+    if words == ['AtomNull']:
+        return ('any',), start + 1
+    if (
+        len(words) != 4 or words[0] not in _array_primitives or
+        words[2] not in ('=', '!=') or words[3] != 'val'
+    ):
+        return None, len(lines) + 1
+
+    name = _array_primitives[words[0]]
+    value = int(words[1])
+    if words[0] == 'AtomInNRings' and value == -1:
+        # Any number of rings
+        name, value = 'in_ring', 1
+    return (name, value, words[2] == '!='), start + 1
+
+
+def evaluate_query(query, arrays):
+    """Find the atoms that match a query from array_query().
+
+    Parameters
+    ----------
+    query : tuple
+        The query.
+    arrays : AtomArrays
+        The arrays of the atom properties of the molecule.
+
+    Returns
+    -------
+    numpy.ndarray
+        Whether each atom matches.
+    """
+    if query[0] == 'and':
+        result = np.ones(arrays.n_atoms, dtype=bool)
+        for child in query[1]:
+            result &= evaluate_query(child, arrays)
+        return result
+    if query[0] == 'or':
+        result = np.zeros(arrays.n_atoms, dtype=bool)
+        for child in query[1]:
+            result |= evaluate_query(child, arrays)
+        return result
+    if query[0] == 'any':
+        return np.ones(arrays.n_atoms, dtype=bool)
+    name, value, negated = query
+    if negated:
+        return arrays[name] != value
+    return arrays[name] == value
+
+
+class CompiledTemplates(object):
+    #: The version of the compiled format, which is part of the key of the
+    #: on-disk cache. Increment it when the content of a template changes.
+    format_version = 7
+
+    def __init__(self, templates=None):
+        """The atom-typing templates with the SMARTS already parsed.
+
+        Parsing the SMARTS and working out which atoms of each pattern
+        carry an atom map number is independent of the molecule being
+        typed, so it is done once here rather than on every call.
+
+        The templates are kept in order of precedence: a template that
+        overrides another comes before it, and otherwise templates later
+        in the forcefield come first. The first template that matches an
+        atom gives its type, which is the same as matching in file order
+        with the last match winning, except that the 'overrides' are
+        honored even when the forcefield lists the templates out of order.
+
+        Parameters
+        ----------
+        templates : {str: {str: [str]}}
+            The templates from the forcefield, keyed by atom type, as
+            returned by Forcefield.get_templates().
+
+        Attributes
+        ----------
+        radius : int
+            The largest number of bonds from a typed atom to any other
+            atom in its template, or None if a template is disconnected.
+        tree : DecisionTree
+            The templates compiled into a decision tree on the properties
+            of the atoms, for the 'tree' engine.
+        """
+        self._templates = []
+        self.radius = 0
+        self.tree = None
+        if templates is not None:
+            self.compile(templates)
+
+    def __iter__(self):
+        return iter(self._templates)
+
+    def __len__(self):
+        return len(self._templates)
+
+    @property
+    def atom_types(self):
+        """The atom types that have templates, in matching order."""
+        result = []
+        for template in self._templates:
+            if template.atom_type not in result:
+                result.append(template.atom_type)
+        return result
+
+    @classmethod
+    def from_forcefield(cls, forcefield):
+        """Compile the templates of a forcefield.
+
+        Parameters
+        ----------
+        forcefield : seamm.Forcefield
+            The forcefield with the templates.
+
+        Returns
+        -------
+        CompiledTemplates
+        """
+        return cls(forcefield.get_templates())
+
+    def compile(self, templates):
+        """Parse the SMARTS of the templates and find the mapped atoms.
+
+        Parameters
+        ----------
+        templates : {str: {str: [str]}}
+            The templates from the forcefield, keyed by atom type.
+
+        Returns
+        -------
+        None
+        """
+        compiled = []
+        self.radius = 0
+        for atom_type in templates:
+            template = templates[atom_type]
+            for smarts in template['smarts']:
+                t0 = time.perf_counter()
+                pattern = rdkit.Chem.MolFromSmarts(smarts)
+                if pattern is None:
+                    logger.warning(
+                        f"Could not parse the SMARTS '{smarts}' for atom "
+                        f"type '{atom_type}'. Ignoring it."
+                    )
+                    continue
+
+                ind_map = {}
+                for atom in pattern.GetAtoms():
+                    map_num = atom.GetAtomMapNum()
+                    if map_num:
+                        ind_map[map_num - 1] = atom.GetIdx()
+                map_list = [ind_map[x] for x in sorted(ind_map)]
+
+                elements = set()
+                for x in map_list:
+                    tmp = query_elements(pattern.GetAtomWithIdx(x))
+                    if tmp is None:
+                        elements = None
+                        break
+                    elements.update(tmp)
+                if elements is not None:
+                    elements = frozenset(elements)
+
+                # How far the pattern reaches from the atoms it types
+                distances = rdkit.Chem.GetDistanceMatrix(pattern)
+                for x in map_list:
+                    radius = int(max(distances[x]))
+                    if radius > pattern.GetNumAtoms():
+                        # Disconnected pattern, so no bound on the radius
+                        self.radius = None
+                    elif self.radius is not None:
+                        self.radius = max(self.radius, radius)
+
+                requirements = []
+                for atom in pattern.GetAtoms():
+                    tmp = query_features(atom)
+                    if tmp is not None:
+                        requirements.append(tmp)
+
+                # Templates of one atom are tested on arrays of the atom
+                # properties rather than by substructure matching.
+                query = None
+                if pattern.GetNumAtoms() == 1:
+                    query = array_query(pattern.GetAtomWithIdx(0))
+
+                compiled.append(
+                    CompiledTemplate(
+                        atom_type, smarts, pattern, map_list, elements,
+                        tuple(requirements), query, time.perf_counter() - t0
+                    )
+                )
+
+        overrides = {
+            atom_type: templates[atom_type].get('overrides', [])
+            for atom_type in templates
+        }
+        self._templates = self._precedence_order(compiled, overrides)
+        logger.debug(f'Compiled {len(self._templates)} templates')
+
+        entries = []
+        for index, template in enumerate(self._templates):
+            if len(template.map_list) > 0:
+                queries = [
+                    array_query(template.pattern.GetAtomWithIdx(x))
+                    for x in template.map_list
+                ]
+                entries.append((index, queries, template.query is not None))
+        self.tree = DecisionTree(entries)
+
+    @staticmethod
+    def _precedence_order(compiled, overrides):
+        """Sort the templates so more specific ones come first.
+
+        The 'overrides' of each atom type form a directed acyclic graph
+        from the more specific type to the more generic ones. The
+        templates are sorted topologically on this graph, with ties broken
+        by taking templates later in the file first.
+
+        Parameters
+        ----------
+        compiled : [CompiledTemplate]
+            The templates in file order.
+        overrides : {str: [str]}
+            The atom types overridden by each atom type.
+
+        Returns
+        -------
+        [CompiledTemplate]
+            The templates in order of precedence.
+        """
+        candidates = list(reversed(compiled))
+        types = {template.atom_type for template in compiled}
+
+        # The number of types overriding each type that are not yet placed
+        n_overriding = {atom_type: 0 for atom_type in types}
+        for atom_type in types:
+            for generic in overrides.get(atom_type, []):
+                if generic in n_overriding:
+                    n_overriding[generic] += 1
+
+        result = []
+        remaining = {atom_type: 0 for atom_type in types}
+        for template in compiled:
+            remaining[template.atom_type] += 1
+        while len(candidates) > 0:
+            for template in candidates:
+                if n_overriding[template.atom_type] == 0:
+                    break
+            else:
+                logger.warning(
+                    'The overrides of the templates form a cycle: ' +
+                    ', '.join(sorted({t.atom_type for t in candidates}))
+                )
+                template = candidates[0]
+            candidates.remove(template)
+            result.append(template)
+            remaining[template.atom_type] -= 1
+            if remaining[template.atom_type] == 0:
+                for generic in overrides.get(template.atom_type, []):
+                    if generic in n_overriding:
+                        n_overriding[generic] -= 1
+        return result
+
+    def candidates(self, molecule, arrays=None):
+        """The templates that could match a molecule.
+
+        Each atom of a template must be able to match some atom of the
+        molecule, judged by element, aromaticity, formal charge and ring
+        membership, so that e.g. the templates for silicon are skipped
+        for molecules without silicon.
+
+        Parameters
+        ----------
+        molecule : rdkit.Chem.Mol
+            The molecule.
+        arrays : AtomArrays = None
+            The arrays of the atom properties of the molecule, if already
+            made.
+
+        Returns
+        -------
+        [CompiledTemplate]
+            The templates, in order of precedence.
+        """
+        features = molecule_features(molecule, arrays)
+        present = {}
+        result = []
+        for template in self._templates:
+            for requirement in template.requirements:
+                if requirement not in present:
+                    present[requirement] = any(
+                        features_match(alternative, atom)
+                        for alternative in requirement for atom in features
+                    )
+                if not present[requirement]:
+                    break
+            else:
+                result.append(template)
+        logger.debug(
+            f'{len(result)} of {len(self._templates)} templates could match'
+        )
+        return result
+
+    def assign(
+        self,
+        molecule,
+        atom_types=None,
+        profile=None,
+        engine='smarts',
+        arrays=None,
+        matches=None
+    ):
+        """Assign the atom types to an RDKit molecule.
+
+        The templates are matched in order of precedence and the first
+        match for an atom gives its final type. Templates needing an atom
+        that the molecule does not have, and those that can only match
+        elements whose atoms are all typed, are not run at all. Templates
+        of a single atom, which are many of them, are tested on NumPy
+        arrays of the atom properties, which are found once for the
+        molecule, rather than by RDKit's substructure matching.
+
+        Parameters
+        ----------
+        molecule : rdkit.Chem.Mol
+            The molecule to type.
+        atom_types : [str]
+            Optional initial atom types, which are updated in place. Atoms
+            with a type other than '?' keep that type.
+        profile : TypingProfile = None
+            If given, the time and matches of each template are added to it.
+        engine : str = 'smarts'
+            'smarts' to match the templates in turn, or 'tree' to send each
+            atom through the decision tree, which gives the same types.
+        arrays : AtomArrays = None
+            The arrays of the atom properties of the molecule, if already
+            made.
+        matches : {} = None
+            If given, the matches of each SMARTS in the molecule are kept
+            in it and reused, so that templates with the same SMARTS in
+            several forcefields are only matched once.
+
+        Returns
+        -------
+        [str]
+            The atom types, '?' for any atom without a type.
+        """
+        if engine not in engines:
+            raise ValueError(f"Unknown template engine '{engine}'")
+        if atom_types is None:
+            atom_types = ['?'] * molecule.GetNumAtoms()
+
+        if arrays is None:
+            arrays = AtomArrays(molecule)
+        if matches is None:
+            matches = {}
+        if engine == 'tree':
+            return self._assign_tree(
+                molecule, atom_types, arrays, profile, matches
+            )
+
+        # Count the untyped atoms of each element
+        untyped = collections.Counter()
+        atomic_numbers = arrays['atomic_number'].tolist()
+        for atno, atom_type in zip(atomic_numbers, atom_types):
+            if atom_type == '?':
+                untyped[atno] += 1
+
+        debug = logger.isEnabledFor(logging.DEBUG)
+        for template in self.candidates(molecule, arrays):
+            if len(untyped) == 0:
+                break
+            if template.elements is not None and untyped.keys().isdisjoint(
+                template.elements
+            ):
+                continue
+
+            if profile is not None:
+                t0 = time.perf_counter()
+            key = ('matches', template.smarts)
+            if key in matches:
+                template_matches = matches[key]
+            elif template.query is not None:
+                template_matches = [
+                    (i,) for i in np.flatnonzero(
+                        evaluate_query(template.query, arrays)
+                    ).tolist()
+                ]
+            else:
+                template_matches = molecule.GetSubstructMatches(
+                    template.pattern, uniquify=False, maxMatches=max_matches
+                )
+                if template.pattern.GetNumAtoms() > 1:
+                    template_matches = unique_matches(template_matches)
+            matches[key] = template_matches
+            if profile is not None:
+                seconds = time.perf_counter() - t0
+                n_set = 0
+                n_overridden = 0
+            if debug:
+                logger.debug(template.atom_type + ': ')
+            for match in template_matches:
+                atom_ids = [match[x] for x in template.map_list]
+                for x in atom_ids:
+                    if atom_types[x] == '?':
+                        atom_types[x] = template.atom_type
+                        atno = atomic_numbers[x]
+                        untyped[atno] -= 1
+                        if untyped[atno] == 0:
+                            del untyped[atno]
+                        if profile is not None:
+                            n_set += 1
+                    elif profile is not None:
+                        n_overridden += 1
+                if debug:
+                    tmp = [str(x) for x in atom_ids]
+                    logger.debug('\t' + ', '.join(tmp))
+            if profile is not None:
+                profile.add_template(
+                    template, seconds, len(template_matches), n_set,
+                    n_overridden
+                )
+
+        return atom_types
+
+    def _assign_tree(
+        self, molecule, atom_types, arrays, profile=None, matches=None
+    ):
+        """Assign the atom types using the decision tree, for assign().
+
+        The untyped atoms are grouped by the values of the properties
+        that the tree splits on, and each group is sent down the tree to a
+        leaf. The templates at the leaf are tried in turn, and the SMARTS
+        of those that need more than the properties of the atom are
+        matched once, when first needed, or taken from matches if they
+        were already matched for another set of templates.
+        """
+        if matches is None:
+            matches = {}
+        tree = self.tree
+        columns = [arrays[name].tolist() for name in tree.properties]
+        if len(columns) == 0:
+            columns = [[None] * arrays.n_atoms]
+        groups = {}
+        for i, values in enumerate(zip(*columns)):
+            if atom_types[i] == '?':
+                groups.setdefault(values, []).append(i)
+
+        typed_by = {}
+        statistics = {}
+        for values, atoms in groups.items():
+            steps = tree.leaf(dict(zip(tree.properties, values)))
+            for index, certain in steps:
+                template = self._templates[index]
+                if certain:
+                    hits = atoms
+                    atoms = []
+                else:
+                    if index not in typed_by:
+                        t0 = time.perf_counter()
+                        key = ('typed', template.smarts)
+                        if key not in matches:
+                            matches[key] = self._typed_atoms(
+                                molecule, template, arrays
+                            )
+                        typed_by[index] = matches[key]
+                        statistics[index] = [
+                            time.perf_counter() - t0,
+                            len(typed_by[index]), 0
+                        ]
+                    typed = typed_by[index]
+                    hits = [i for i in atoms if i in typed]
+                    atoms = [i for i in atoms if i not in typed]
+                for i in hits:
+                    atom_types[i] = template.atom_type
+                if profile is not None and len(hits) > 0:
+                    data = statistics.setdefault(index, [0.0, 0, 0])
+                    if certain:
+                        data[1] += len(hits)
+                    data[2] += len(hits)
+                if len(atoms) == 0:
+                    break
+
+        if profile is not None:
+            for index, (seconds, n_matches, n_set) in statistics.items():
+                profile.add_template(
+                    self._templates[index], seconds, n_matches, n_set
+                )
+        return atom_types
+
+    @staticmethod
+    def _typed_atoms(molecule, template, arrays):
+        """The atoms that a template would type, as a set of indices."""
+        if template.query is not None:
+            matches = np.flatnonzero(evaluate_query(template.query, arrays))
+            return set(matches.tolist())
+        matches = molecule.GetSubstructMatches(
+            template.pattern, uniquify=False, maxMatches=max_matches
+        )
+        if template.pattern.GetNumAtoms() > 1:
+            matches = unique_matches(matches)
+        return {match[x] for match in matches for x in template.map_list}
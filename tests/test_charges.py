@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the charges from bond increments."""
+
+import pytest
+
+from seamm_default_atomtyping.charges import (
+    ChargeTable, bond_arrays, bond_increment_charges
+)
+
+
+class Forcefield(object):
+    """Just enough of a forcefield for water and hydroxide."""
+
+    increments = {('o*', 'hw'): '-0.41', ('hw', 'o*'): '0.41'}
+
+    def __init__(self):
+        self.ff = {'atom_types': {'o*': {}, 'hw': {}, 'h*': {}}}
+
+    def charges(self, atom_type):
+        return ('default', (atom_type,), 'charges', {'Q': '0.0'})
+
+    def bond_increments(self, itype, jtype):
+        if (itype, jtype) not in self.increments:
+            raise RuntimeError(f'No bond increments for {itype}-{jtype}')
+        return (
+            'automatic', (itype, jtype), 'bond_increments', {
+                'deltaij': self.increments[(itype, jtype)],
+                'deltaji': self.increments[(jtype, itype)]
+            }
+        )
+
+
+def test_water():
+    """Two waters, with the bonds in either order."""
+    atomtypes = ['o*', 'hw', 'hw', 'hw', 'o*', 'hw']
+    bond_i, bond_j = bond_arrays([(0, 1, 1), (0, 2, 1), (3, 4, 1), (4, 5, 1)])
+    charges = bond_increment_charges(
+        ChargeTable(Forcefield()), atomtypes, bond_i, bond_j
+    )
+    assert charges.tolist() == pytest.approx(
+        [-0.82, 0.41, 0.41, 0.41, -0.82, 0.41]
+    )
+
+
+def test_subset():
+    """Only the requested atoms are updated."""
+    atomtypes = ['o*', 'hw', 'hw']
+    bond_i, bond_j = bond_arrays([(0, 1, 1), (0, 2, 1)])
+    charges = bond_increment_charges(
+        ChargeTable(Forcefield()),
+        atomtypes,
+        bond_i,
+        bond_j,
+        atoms=[1],
+        charges=[9.0, 9.0, 9.0]
+    )
+    assert charges.tolist() == pytest.approx([9.0, 0.41, 9.0])
+
+
+def test_table():
+    """The table looks up only the pairs of types used, and adds types."""
+    forcefield = Forcefield()
+    table = ChargeTable(forcefield)
+    assert len(table) == 0
+
+    ids = table.ids(['o*', 'hw', 'c'])
+    assert len(table) == 3
+    assert table.types[ids[2]] == 'c'
+    o, h = ids[0:2]
+    assert not table.known.any()
+
+    calls = []
+    lookup = forcefield.bond_increments
+
+    def bond_increments(itype, jtype):
+        calls.append((itype, jtype))
+        return lookup(itype, jtype)
+
+    forcefield.bond_increments = bond_increments
+    delta_ij, delta_ji = table.increments(ids[[0, 1, 0]], ids[[1, 0, 1]])
+    assert delta_ij.tolist() == pytest.approx([-0.41, 0.41, -0.41])
+    assert delta_ji.tolist() == pytest.approx([0.41, -0.41, 0.41])
+    assert len(calls) == 1
+    assert table.known.sum() == 2
+    assert table.delta[o, h] == pytest.approx(-0.41)
+
+    with pytest.raises(RuntimeError, match='h\\*-o\\*'):
+        table.increments(table.ids(['h*']), table.ids(['o*']))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the diagnostics of untyped atoms."""
+
+import json
+import os
+
+import pytest  # noqa: F401
+import rdkit.Chem
+
+from seamm_default_atomtyping.diagnostics import (
+    untyped_report, write_diagnostics
+)
+
+
+def test_report():
+    """Untyped atoms are grouped by their local environment."""
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('C[Si](C)(C)O[Si]'))
+    atom_types = [
+        '?' if atom.GetSymbol() == 'Si' else 'x'
+        for atom in molecule.GetAtoms()
+    ]
+    report = untyped_report(molecule, atom_types)
+    assert report['n_atoms'] == molecule.GetNumAtoms()
+    assert report['n_untyped'] == 2
+    assert len(report['environments']) == 2
+    for environment in report['environments']:
+        assert environment['element'] == 'Si'
+        assert environment['count'] == 1
+        assert '[Si' in environment['smiles']
+        assert ':1]' in environment['smiles']
+
+
+def test_repeated():
+    """Identical environments in a long chain are reported once."""
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('C' * 50))
+    atom_types = [
+        '?' if atom.GetSymbol() == 'C' else 'h'
+        for atom in molecule.GetAtoms()
+    ]
+    report = untyped_report(molecule, atom_types)
+    counts = sorted(e['count'] for e in report['environments'])
+    assert sum(counts) == 50
+    assert len(counts) == 3
+
+
+def test_write(tmp_path):
+    """The JSON report is written and the image drawn in the background."""
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('c1ccccc1[Si]'))
+    atom_types = [
+        '?' if atom.GetSymbol() == 'Si' else 'x'
+        for atom in molecule.GetAtoms()
+    ]
+    report, future = write_diagnostics(
+        molecule, atom_types, directory=str(tmp_path)
+    )
+    with open(tmp_path / 'missing_atom_types.json') as fd:
+        assert json.load(fd) == report
+    filename = future.result(timeout=60)
+    assert os.path.exists(filename)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the on-disk forcefield cache."""
+
+import os
+
+import pytest  # noqa: F401
+
+from seamm_default_atomtyping import forcefield_cache
+
+path = os.path.join(
+    os.path.dirname(forcefield_cache.__file__), 'data', 'pcff2018.frc'
+)
+
+
+def test_cache_key():
+    """The key depends on the file and the version."""
+    key = forcefield_cache.cache_key(path, '1.0')
+    assert key == forcefield_cache.cache_key(path, '1.0')
+    assert key != forcefield_cache.cache_key(path, '1.1')
+
+
+def test_round_trip(tmp_path):
+    """The second load comes from the cache and gives the same result."""
+    cache_dir = str(tmp_path)
+    ff1, templates1 = forcefield_cache.load_forcefield(
+        path, version='test', cache_dir=cache_dir
+    )
+    assert len(os.listdir(cache_dir)) == 1
+
+    ff2, templates2 = forcefield_cache.load_forcefield(
+        path, version='test', cache_dir=cache_dir
+    )
+    assert ff2.name == ff1.name
+    assert [t.smarts for t in templates2] == [t.smarts for t in templates1]
+
+    assert forcefield_cache.clear_cache(cache_dir) == 1
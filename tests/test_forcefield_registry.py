@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the registry of forcefield files."""
+
+import pytest  # noqa: F401
+
+import seamm_default_atomtyping
+from seamm_default_atomtyping import forcefield_registry
+
+
+def test_read_header():
+    """The names and version come from the header of the file."""
+    path = forcefield_registry.ForcefieldRegistry().path('pcff')
+    header = forcefield_registry.read_header(path)
+    assert header['forcefields'] == ['pcff']
+    assert header['version'] == '2020.10.5'
+
+
+def test_directories(tmp_path, monkeypatch):
+    """Forcefields are found in the given and configured directories."""
+    text = (
+        '!BIOSYM forcefield          1\n\n'
+        '#version test.frc 1.2 1-January-2020\n\n'
+        '#define {name}\n\n'
+        '!Ver  Ref    Function    Label\n\n'
+        '#atom_types test\n'
+    )
+    given = tmp_path / 'given'
+    given.mkdir()
+    (given / 'first.frc').write_text(text.format(name='first'))
+    configured = tmp_path / 'configured'
+    configured.mkdir()
+    (configured / 'second.frc').write_text(text.format(name='second'))
+    (configured / 'notes.txt').write_text('not a forcefield')
+    monkeypatch.setenv(
+        forcefield_registry.forcefield_path_variable, str(configured)
+    )
+
+    registry = forcefield_registry.ForcefieldRegistry([str(given)])
+    assert registry.names() == ['first', 'second', 'pcff']
+    assert registry.entries['second']['version'] == '1.2'
+    with pytest.raises(ValueError):
+        registry.path('third')
+
+
+def test_shared(tmp_path):
+    """Typers share a forcefield, which is only loaded when first used."""
+    typer1 = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    typer2 = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    assert typer1._forcefields == {}
+    assert 'pcff' in typer1.supported_forcefield
+    assert typer1.forcefield is typer2.forcefield
+    assert typer1.templates is typer2.templates
+
+
+def test_full_forcefield(tmp_path):
+    """The full forcefield has the same parameters as the lazy one."""
+    pytest.importorskip('seamm')
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    full = typer.full_forcefield
+    assert typer.forcefield.ff['quartic_bond'] == full.ff['quartic_bond']
+    assert typer.full_forcefield is full
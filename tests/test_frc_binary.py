@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the binary form of forcefields."""
+
+import os
+import shutil
+
+import pytest  # noqa: F401
+
+from seamm_default_atomtyping import frc_binary, frc_index
+
+path = os.path.join(
+    os.path.dirname(frc_index.__file__), 'data', 'pcff2018.frc'
+)
+
+
+def test_round_trip(tmp_path):
+    """The binary form gives the same parameters as the text."""
+    source = str(tmp_path / 'pcff.frc')
+    shutil.copy(path, source)
+    binary = frc_binary.write_binary(source)
+    assert binary == str(tmp_path / 'pcff.ffb')
+    assert os.path.getsize(binary) < os.path.getsize(source)
+
+    text = frc_index.TypingForcefield(source)
+    forcefield = frc_binary.load_binary(source)
+    assert isinstance(forcefield, frc_binary.BinaryForcefield)
+    assert forcefield.name == text.name
+    assert forcefield.data == text.data
+    for form in ('equivalence', 'auto_equivalence', 'templates'):
+        assert forcefield.ff[form] == text.ff[form]
+    assert forcefield.ff['atom_types'].keys() == text.ff['atom_types'].keys()
+    for i, j in (('c', 'hc'), ('hc', 'c'), ('c3', 'o'), ('cp', 'cp')):
+        expected = text.bond_increments(i, j)
+        result = forcefield.bond_increments(i, j)
+        assert result[0:2] == expected[0:2]
+        assert result[3]['deltaij'] == float(expected[3]['deltaij'])
+        assert result[3]['deltaji'] == float(expected[3]['deltaji'])
+
+    # The other sections are parsed from the text
+    assert forcefield.ff['quartic_bond'] == text.ff['quartic_bond']
+    text.close()
+
+
+def test_stale(tmp_path):
+    """A binary form that does not match the text is not used."""
+    source = tmp_path / 'pcff.frc'
+    shutil.copy(path, source)
+    frc_binary.main([str(source)])
+    with open(source, 'a') as fd:
+        fd.write('\n! Edited\n')
+
+    with pytest.raises(frc_binary.StaleBinaryError):
+        frc_binary.BinaryForcefield(
+            frc_binary.binary_path(str(source)), source=str(source)
+        )
+    forcefield = frc_binary.load_binary(str(source))
+    assert not isinstance(forcefield, frc_binary.BinaryForcefield)
+    assert forcefield.name == 'pcff'
+
+
+def test_written_when_parsed(tmp_path, monkeypatch):
+    """Parsing the text writes the binary form, which is then used."""
+    source = str(tmp_path / 'pcff.frc')
+    shutil.copy(path, source)
+    text = frc_binary.load_binary(source)
+    assert not isinstance(text, frc_binary.BinaryForcefield)
+    assert os.path.exists(frc_binary.binary_path(source))
+
+    # The hash of the file is not found again if it is given
+    digest = frc_binary.source_hash(source)
+
+    def source_hash(path):
+        raise AssertionError('The hash was found again')
+
+    monkeypatch.setattr(frc_binary, 'source_hash', source_hash)
+    forcefield = frc_binary.load_binary(source, digest)
+    assert isinstance(forcefield, frc_binary.BinaryForcefield)
+    assert forcefield.ff['templates'] == text.ff['templates']
+
+
+def test_read_only(tmp_path, monkeypatch):
+    """The text is still parsed if the binary form cannot be written."""
+    source = str(tmp_path / 'pcff.frc')
+    shutil.copy(path, source)
+
+    def mkstemp(**kwargs):
+        raise PermissionError('Read-only file system')
+
+    monkeypatch.setattr(frc_binary.tempfile, 'mkstemp', mkstemp)
+    forcefield = frc_binary.load_binary(source)
+    assert forcefield.name == 'pcff'
+    assert not os.path.exists(frc_binary.binary_path(source))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for reading just the sections of a forcefield needed for typing."""
+
+import os
+import pickle
+
+import pytest  # noqa: F401
+
+from seamm_default_atomtyping import forcefield_cache, frc_index
+
+path = os.path.join(
+    os.path.dirname(frc_index.__file__), 'data', 'pcff2018.frc'
+)
+
+
+def test_scan_sections():
+    """The offsets give the body of each section, without its header."""
+    text = (
+        b'!BIOSYM forcefield 1\n'
+        b'#version a.frc 1.0 1-July-91\n'
+        b'#define a\n'
+        b' 1.0 1 atom_types t\n'
+        b'#atom_types t\n'
+        b' 1.0 1 c 12.0 C 4 carbon\n'
+        b'#end\n'
+        b'#templates t\n'
+        b'{}'
+    )
+    sections = frc_index.scan_sections(text)
+    assert [s[0:2] for s in sections] == [
+        ('define', 'a'), ('atom_types', 't'), ('templates', 't')
+    ]
+    bodies = [text[start:end] for _, _, start, end in sections]
+    assert bodies == [
+        b' 1.0 1 atom_types t\n', b' 1.0 1 c 12.0 C 4 carbon\n', b'{}'
+    ]
+
+
+def test_same_as_full_parse():
+    """The sections for typing are parsed as by seamm.Forcefield."""
+    seamm = pytest.importorskip('seamm')
+
+    lazy = frc_index.TypingForcefield(path)
+    assert lazy.name == 'pcff'
+    assert lazy.ff.keys() == set()
+    full = seamm.Forcefield(filename=path)
+    for form in frc_index.typing_forms:
+        assert lazy.ff[form] == full.ff[form]
+    for i, j in (('c', 'hc'), ('hc', 'c'), ('c3', 'o'), ('cp', 'cp')):
+        assert lazy.bond_increments(i, j) == full.bond_increments(i, j)
+
+    # Pickled with everything parsed, so the file is no longer needed
+    copy = pickle.loads(pickle.dumps(lazy))
+    assert copy.ff['templates'] == full.ff['templates']
+    lazy.close()
+
+
+def test_other_sections():
+    """Any other section is parsed when first used, as by seamm.Forcefield."""
+    seamm = pytest.importorskip('seamm')
+
+    lazy = frc_index.TypingForcefield(path)
+    full = seamm.Forcefield(filename=path)
+    assert 'quartic_bond' in lazy.ff
+    assert lazy.ff['nonbond(9-6)'] == full.ff['nonbond(9-6)']
+    assert lazy.ff.keys() == {'nonbond(9-6)'}
+
+    # After pickling the file is read again for the other sections
+    copy = pickle.loads(pickle.dumps(lazy))
+    lazy.close()
+    for form in lazy.forms:
+        assert copy.ff[form] == full.ff[form]
+    assert lazy.ff['quartic_bond'] == full.ff['quartic_bond']
+    with pytest.raises(KeyError):
+        lazy.ff['charges']
+
+
+def test_charges_section(tmp_path):
+    """Forcefields with a charges section are parsed in full."""
+    with open(path) as fd:
+        text = fd.read()
+    text = text.replace(
+        ' 1.0  1     atom_types                       cff91\n',
+        ' 1.0  1     atom_types                       cff91\n'
+        ' 1.0  1     charges                          cff91\n',
+    )
+    modified = tmp_path / 'charges.frc'
+    modified.write_text(text)
+    with pytest.raises(frc_index.UnsupportedForcefieldError):
+        frc_index.TypingForcefield(str(modified))
+
+    forcefield, templates = forcefield_cache.load_forcefield(
+        path, use_cache=False
+    )
+    assert isinstance(forcefield, frc_index.TypingForcefield)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for building RDKit molecules from configurations."""
+
+import molsystem
+import pytest
+
+from seamm_default_atomtyping.molecule import (
+    configuration_to_graph, configuration_to_molecule, graph_signature,
+    graph_to_molecule, split_graph
+)
+
+
+@pytest.fixture()
+def configuration():
+    """An empty configuration in an in-memory database."""
+    system_db = molsystem.SystemDB(
+        filename='file:seamm_db?mode=memory&cache=shared'
+    )
+    system = system_db.create_system()
+    yield system.create_configuration()
+    system_db.close()
+
+
+def test_atom_order(configuration):
+    """The molecule keeps the atom order of the configuration."""
+    configuration.from_smiles('CCO')
+    molecule = configuration_to_molecule(configuration)
+    assert molecule.GetNumAtoms() == configuration.n_atoms
+    symbols = [atom.GetSymbol() for atom in molecule.GetAtoms()]
+    assert symbols == configuration.atoms.symbols
+    assert molecule.GetNumBonds() == configuration.bonds.n_bonds
+
+
+def test_charges(configuration):
+    """Formal charges are found from the valence."""
+    configuration.from_smiles('C[N+](C)(C)C')
+    molecule = configuration_to_molecule(configuration)
+    charges = [atom.GetFormalCharge() for atom in molecule.GetAtoms()]
+    assert charges[1] == 1
+    assert sum(charges) == 1
+
+
+def test_split_graph(configuration):
+    """Identical molecules have the same signature."""
+    configuration.from_smiles('O.CCO.O')
+    components = split_graph(configuration_to_graph(configuration))
+    assert len(components) == 3
+    assert sum(len(atoms) for atoms, _ in components) == configuration.n_atoms
+    signatures = [graph_signature(graph) for _, graph in components]
+    assert signatures[0] == signatures[2]
+    assert signatures[0] != signatures[1]
+
+
+def test_small_rings(configuration):
+    """Finding only small rings gives the same molecule for small rings."""
+    configuration.from_smiles('c1ccc2ccccc2c1C1CC1C1CCCCCCCCCC1')
+    graph = configuration_to_graph(configuration)
+    full = graph_to_molecule(graph)
+    small = graph_to_molecule(graph, max_ring_size=8)
+    assert [a.GetIsAromatic() for a in small.GetAtoms()] == [
+        a.GetIsAromatic() for a in full.GetAtoms()
+    ]
+    sizes = sorted(len(ring) for ring in small.GetRingInfo().AtomRings())
+    assert sizes == [3, 6, 6]
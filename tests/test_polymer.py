@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for typing polymer chains from their repeat units."""
+
+import pytest
+import rdkit.Chem
+
+import seamm_default_atomtyping
+from seamm_default_atomtyping.polymer import (
+    check_repeat_units, find_repeat_units, shorten_chain
+)
+
+
+def smiles_to_graph(smiles):
+    """The molecular graph of a SMILES, with the hydrogens at the end."""
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smiles))
+    rdkit.Chem.Kekulize(molecule, clearAromaticFlags=True)
+    atoms = molecule.GetAtoms()
+    return {
+        'atomic_numbers': [atom.GetAtomicNum() for atom in atoms],
+        'bonds': [
+            (
+                bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(),
+                int(bond.GetBondTypeAsDouble())
+            ) for bond in molecule.GetBonds()
+        ],
+        'formal_charges': None,
+    }
+
+
+def test_find_repeat_units():
+    """The repeat units of polystyrene are found, hydrogens and all."""
+    graph = smiles_to_graph('C' + 'CC(c1ccccc1)' * 20 + 'C')
+    units = find_repeat_units(graph)
+    assert len(units) >= 19
+    assert all(len(unit) == 16 for unit in units)
+    assert check_repeat_units(graph, units)
+
+    indices, short = shorten_chain(graph, units, 3)
+    assert len(short['atomic_numbers']) == len(indices)
+    assert len(indices) == len(graph['atomic_numbers']) - 16 * (len(units) - 6)
+    assert len(short['bonds']) == len(graph['bonds']) - 17 * (len(units) - 6)
+
+
+def test_not_a_polymer():
+    """Molecules without repeat units are left alone."""
+    assert find_repeat_units(smiles_to_graph('CC(O)c1ccc(N)cc1CC=O')) is None
+
+
+def test_type_polymer(tmp_path):
+    """Typing from the repeat units gives the same result as in full."""
+    graph = smiles_to_graph('O' + 'CCO' * 20 + 'CC(C)' * 40 + 'C')
+    full = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path), detect_repeat_units=False
+    )
+    fast = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    atomtypes, charges = full.type_graph(graph)
+    new_types, new_charges = fast.type_graph(graph)
+    assert new_types == atomtypes
+    assert new_charges == pytest.approx(charges)
+
+    # The repeat units of the polypropylene block, as from a builder
+    units = find_repeat_units(graph)
+    assert len(units) >= 39
+    new_types, new_charges = full.type_graph(graph, repeat_units=units)
+    assert new_types == atomtypes
+    assert new_charges == pytest.approx(charges)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the cache of atom typing results."""
+
+import pytest  # noqa: F401
+import rdkit.Chem
+
+from seamm_default_atomtyping.results_cache import TypingCache, canonical_key
+
+
+def molecule(smiles):
+    return rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smiles))
+
+
+def test_hit_in_other_atom_order():
+    """A hit is mapped onto the atom order of the new molecule."""
+    cache = TypingCache()
+    smiles, ranks = canonical_key(molecule('CCO'))
+    key = (smiles, 'pcff', '1')
+    types = ['c3', 'c2', 'oh', 'hc', 'hc', 'hc', 'hc', 'hc', 'ho']
+    charges = [float(i) for i in range(9)]
+    cache.put(key, ranks, types, charges)
+
+    smiles2, ranks2 = canonical_key(molecule('OCC'))
+    assert smiles2 == smiles
+    atomtypes, charges2 = cache.get((smiles2, 'pcff', '1'), ranks2)
+    assert atomtypes[0:3] == ['oh', 'c2', 'c3']
+    assert atomtypes[3] == 'ho'
+    assert charges2[0:3] == [2.0, 1.0, 0.0]
+
+    assert cache.get((smiles, 'pcff', '2'), ranks) is None
+    assert cache.statistics()['hits'] == 1
+    assert cache.statistics()['misses'] == 1
+
+
+def test_eviction():
+    """The least recently used molecule is evicted first."""
+    cache = TypingCache(maxsize=2)
+    keys = {}
+    for smiles in ('C', 'O', 'N'):
+        canonical, ranks = canonical_key(molecule(smiles))
+        keys[smiles] = ((canonical, 'pcff', '1'), ranks)
+        if smiles == 'N':
+            # Touch methane so that water is the oldest
+            assert cache.get(*keys['C']) is not None
+        cache.put(*keys[smiles], ['?'] * len(ranks))
+    assert len(cache) == 2
+    assert keys['O'][0] not in cache
+    assert keys['C'][0] in cache
+    assert cache.statistics()['evictions'] == 1
@@ -3,13 +3,366 @@
 
 """Tests for `seamm_default_atomtyping` package."""
 
+import os
+
 import pytest  # noqa: F401
 import seamm_default_atomtyping  # noqa: F401
 
 
+def write_variant(directory):
+    """Write a variant of PCFF in which methyl groups are only typed next
+    to O, returning its path."""
+    path = os.path.join(
+        os.path.dirname(seamm_default_atomtyping.__file__), 'data',
+        'pcff2018.frc'
+    )
+    with open(path) as fd:
+        text = fd.read()
+    text = text.replace('#define pcff\n', '#define pcff_variant\n')
+    text = text.replace('"[CX4H3:1]"', '"[CX4H3:1]O"')
+    variant = directory / 'variant.frc'
+    variant.write_text(text)
+    return variant
+
+
 def test_construction():
     """Just create an object and test its type."""
     result = seamm_default_atomtyping.SeammDefaultAtomtyping()
     assert str(type(result)) == (
         "<class 'seamm_default_atomtyping.seamm_default_atomt.SeammDefaultAtomtyping'>"  # noqa: E501
     )
+
+
+def test_lazy_import():
+    """Describing the plug-in does not load RDKit or run git."""
+    import subprocess
+    import sys
+
+    code = (
+        'import sys, seamm_default_atomtyping as s\n'
+        's.SeammDefaultAtomtypingStep().description()\n'
+        "heavy = ('rdkit', 'numpy', 'seamm', 'tkinter', 'PIL', 'subprocess')\n"
+        'print(sorted(m for m in heavy if m in sys.modules))\n'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', code],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    assert result.stdout.strip() == '[]'
+
+
+def test_assign_parameters_many(tmp_path):
+    """Typing in a process pool matches typing in this process."""
+    import molsystem
+
+    system_db = molsystem.SystemDB(
+        filename='file:seamm_db?mode=memory&cache=shared'
+    )
+    configurations = []
+    for smiles in ('CCO', 'O', 'CCCC', 'c1ccccc1O'):
+        configuration = system_db.create_system().create_configuration()
+        configuration.from_smiles(smiles)
+        configurations.append(configuration)
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    serial = typer.assign_parameters_many(configurations, workers=1)
+    parallel = typer.assign_parameters_many(configurations, workers=2)
+    assert parallel == serial
+    assert serial[1][0] == ['o*', 'hw', 'hw']
+    assert list(configurations[1].atoms['atomtypes_pcff']) == serial[1][0]
+
+    # The workers type with the selected forcefield and options
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path), engine='tree', ring_perception='small'
+    )
+    typer.select_forcefield(typer.add_forcefield(str(write_variant(tmp_path))))
+    serial = typer.assign_parameters_many(configurations, workers=1)
+    parallel = typer.assign_parameters_many(configurations, workers=2)
+    assert parallel == serial
+    assert serial[2][0][0] != 'c3'
+
+    system_db.close()
+
+
+@pytest.mark.parametrize('engine', ['smarts', 'tree'])
+def test_retype_graph(tmp_path, monkeypatch, engine):
+    """Retyping around a change gives the same result as full typing."""
+    import molsystem
+    from seamm_default_atomtyping.molecule import configuration_to_graph
+
+    system_db = molsystem.SystemDB(
+        filename='file:seamm_db?mode=memory&cache=shared'
+    )
+    configuration = system_db.create_system().create_configuration()
+    configuration.from_smiles('CCCCCCCCCCCCCCCCCCCCO')
+    graph = configuration_to_graph(configuration)
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path), engine=engine
+    )
+    atomtypes, charges = typer.type_graph(graph)
+
+    # The engines used
+    engines = set()
+    assign = typer.templates.assign
+
+    def spy(*args, **kwargs):
+        engines.add(kwargs.get('engine', 'smarts'))
+        return assign(*args, **kwargs)
+
+    monkeypatch.setattr(typer.templates, 'assign', spy)
+
+    # Forget the types of the end of the chain and retype it
+    previous = list(atomtypes)
+    previous[19] = None
+    previous[20] = 'c'
+    new_types, new_charges = typer.retype_graph(
+        graph, previous, [19], charges=charges
+    )
+    assert new_types == atomtypes
+    assert new_charges == pytest.approx(charges)
+    assert engines == {engine}
+
+    system_db.close()
+
+
+def test_retype_graph_size(tmp_path, monkeypatch):
+    """Retyping builds a molecule of the same size however large the
+    system is."""
+    import rdkit.Chem
+
+    from seamm_default_atomtyping import molecule
+    from seamm_default_atomtyping import seamm_default_atomtyping as module
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    sizes = []
+
+    def spy(graph, **kwargs):
+        sizes.append(len(graph['atomic_numbers']))
+        return molecule.graph_to_molecule(graph, **kwargs)
+
+    built = []
+    for n in (100, 1000):
+        # A chain with a benzene ring in the middle, given as alternating
+        # single and double bonds
+        smiles = 'C' * (n // 2) + 'c1ccc(cc1)' + 'C' * (n // 2) + 'O'
+        mol = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smiles))
+        rdkit.Chem.Kekulize(mol, clearAromaticFlags=True)
+        graph = {
+            'atomic_numbers': [atom.GetAtomicNum() for atom in mol.GetAtoms()],
+            'bonds': [
+                (
+                    bond.GetBeginAtomIdx(), bond.GetEndAtomIdx(),
+                    int(bond.GetBondTypeAsDouble())
+                ) for bond in mol.GetBonds()
+            ],
+            'formal_charges': None,
+        }
+        atomtypes, charges = typer.type_graph(graph)
+
+        monkeypatch.setattr(module, 'graph_to_molecule', spy)
+        sizes.clear()
+        changed = n // 2  # In the ring
+        previous = list(atomtypes)
+        previous[changed] = None
+        new_types, new_charges = typer.retype_graph(
+            graph, previous, [changed], charges=charges
+        )
+        monkeypatch.undo()
+        assert new_types == atomtypes
+        assert new_charges == pytest.approx(charges)
+        built.append(list(sizes))
+    assert len(built[0]) == 1
+    assert built[0] == built[1]
+
+
+def test_untyped_atoms(tmp_path):
+    """Untyped atoms in all the molecules are reported by their index."""
+    import json
+
+    import molsystem
+    from seamm_default_atomtyping.diagnostics import UntypedAtomsError
+    from seamm_default_atomtyping.molecule import configuration_to_graph
+
+    system_db = molsystem.SystemDB(
+        filename='file:seamm_db?mode=memory&cache=shared'
+    )
+    configuration = system_db.create_system().create_configuration()
+    configuration.from_smiles('CCO.C[Si].C[Si]')
+    graph = configuration_to_graph(configuration)
+    silicon = [
+        i for i, atno in enumerate(graph['atomic_numbers']) if atno == 14
+    ]
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    typer.directory = str(tmp_path)
+    with pytest.raises(UntypedAtomsError, match='missing_atom_types.json'):
+        typer.type_graph(graph)
+    report = typer.untyped_report
+    assert report['n_atoms'] == configuration.n_atoms
+    assert report['n_untyped'] == 2
+    assert report['environments'][0]['atoms'] == silicon
+    with open(tmp_path / 'missing_atom_types.json') as fd:
+        assert json.load(fd) == report
+
+    # Without bond increments, the types are stored as before
+    path = typer.registry.path('pcff')
+    with open(path) as fd:
+        text = fd.read()
+    text = text.replace('#define pcff\n', '#define pcff_types\n')
+    text = text.replace(' bond_increments    ', ' no_increments    ', 1)
+    variant = tmp_path / 'types.frc'
+    variant.write_text(text)
+    typer.select_forcefield(typer.add_forcefield(str(variant)))
+    assert not typer.have_bond_increments
+    (tmp_path / 'missing_atom_types.json').unlink()
+    typer.assign_parameters(configuration)
+    atomtypes = list(configuration.atoms['atomtypes_pcff_types'])
+    assert [atomtypes[i] for i in silicon] == ['?', '?']
+    assert 'charges_pcff_types' not in configuration.atoms
+    assert typer.untyped_report == report
+    assert (tmp_path / 'missing_atom_types.json').exists()
+
+    # The report is only for the latest system
+    configuration.from_smiles('CCO')
+    typer.type_graph(configuration_to_graph(configuration))
+    assert typer.untyped_report is None
+
+    system_db.close()
+
+
+def test_stream_parameters(tmp_path):
+    """Streaming, with large molecules in chunks, matches full typing."""
+    import molsystem
+    from seamm_default_atomtyping.molecule import configuration_to_graph
+
+    system_db = molsystem.SystemDB(
+        filename='file:seamm_db?mode=memory&cache=shared'
+    )
+    configuration = system_db.create_system().create_configuration()
+    configuration.from_smiles('CCCCCCCCCCCCCCCCCCCCO.O.O.c1ccccc1CCO')
+    graph = configuration_to_graph(configuration)
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    atomtypes, charges = typer.type_graph(graph)
+
+    parts = list(
+        typer.stream_parameters(configuration, chunk_size=10, batch_size=7)
+    )
+    assert sorted(i for atoms, _, _ in parts for i in atoms) == list(
+        range(configuration.n_atoms)
+    )
+    assert list(configuration.atoms['atomtypes_pcff']) == atomtypes
+    assert list(configuration.atoms['charges_pcff']) == pytest.approx(
+        charges
+    )
+
+    system_db.close()
+
+
+def test_total_charge(tmp_path, monkeypatch, caplog):
+    """The total charge is not checked if some molecules have no charges."""
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+
+    def type_molecule(molecule, use_cache=True):
+        if molecule.GetAtomWithIdx(0).GetAtomicNum() == 14:
+            return ['?', '?'], None
+        return ['x', 'x'], [0.5, 0.0]
+
+    monkeypatch.setattr(typer, 'type_molecule', type_molecule)
+    graph = {
+        'atomic_numbers': [6, 6, 14, 14],
+        'bonds': [(0, 1, 1), (2, 3, 1)],
+        'formal_charges': None,
+    }
+    parts = list(typer._stream_graph(graph))
+    assert len(parts) == 2
+    assert 'Total charge' not in caplog.text
+
+    del graph['atomic_numbers'][2:]
+    del graph['bonds'][1:]
+    list(typer._stream_graph(graph))
+    assert 'Total charge is not zero' in caplog.text
+
+
+def test_periodic_graph(tmp_path):
+    """A periodic chain is typed like the middle of a long chain."""
+    from seamm_default_atomtyping.periodic import unwrap_periodic_graph
+
+    # One CH2 per cell, bonded to the carbon in the next cell along c
+    graph = {
+        'atomic_numbers': [6, 1, 1],
+        'bonds': [(0, 1, 1), (0, 2, 1), (0, 0, 1)],
+        'offsets': [(0, 0, 0), (0, 0, 0), (0, 0, 1)],
+        'formal_charges': None,
+    }
+    supercell, repeats = unwrap_periodic_graph(graph, 6)
+    assert repeats == (1, 1, 7)
+    assert len(supercell['atomic_numbers']) == 21
+    assert len(supercell['bonds']) == 21
+
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    atomtypes, charges = typer.type_graph(graph)
+    assert atomtypes == ['c2', 'hc', 'hc']
+    assert sum(charges) == pytest.approx(0.0)
+
+
+def test_forcefields(tmp_path):
+    """Typing for several forcefields at once matches one at a time."""
+    import molsystem
+    from seamm_default_atomtyping.molecule import configuration_to_graph
+
+    variant = write_variant(tmp_path)
+    typer = seamm_default_atomtyping.SeammDefaultAtomtyping(
+        cache_dir=str(tmp_path)
+    )
+    assert typer.add_forcefield(str(variant)) == 'pcff_variant'
+    assert typer.supported_forcefield == ['pcff', 'pcff_variant']
+    assert typer.selected_forcefield == 'pcff'
+
+    system_db = molsystem.SystemDB(
+        filename='file:seamm_db?mode=memory&cache=shared'
+    )
+    configuration = system_db.create_system().create_configuration()
+    configuration.from_smiles('CCCO.COC.O')
+    graph = configuration_to_graph(configuration)
+
+    expected = {}
+    for name in ('pcff', 'pcff_variant'):
+        typer.select_forcefield(name)
+        expected[name] = typer.type_graph(graph)
+    typer.select_forcefield('pcff')
+    assert expected['pcff'][0] != expected['pcff_variant'][0]
+
+    typer.result_cache.clear()
+    result = typer.type_graph_forcefields(graph)
+    assert list(result) == ['pcff', 'pcff_variant']
+    for name, (atomtypes, charges) in result.items():
+        assert atomtypes == expected[name][0]
+        assert charges == pytest.approx(expected[name][1])
+
+    typer.assign_parameters(
+        configuration, forcefields=['pcff', 'pcff_variant']
+    )
+    for name, (atomtypes, charges) in expected.items():
+        assert list(configuration.atoms[f'atomtypes_{name}']) == atomtypes
+        assert list(configuration.atoms[f'charges_{name}']) == pytest.approx(
+            charges
+        )
+    assert typer.selected_forcefield == 'pcff'
+
+    system_db.close()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for the compiled SMARTS templates."""
+
+import pytest
+import rdkit.Chem
+
+from seamm_default_atomtyping.templates import (
+    AtomArrays, CompiledTemplates, array_query, evaluate_query, max_matches,
+    query_elements
+)
+
+templates = {
+    'c': {'smarts': ['[CX4:1]'], 'overrides': []},
+    'c3': {'smarts': ['[CX4H3:1]'], 'overrides': ['c']},
+    'o': {'smarts': ['[O:1]'], 'overrides': []},
+    'oh': {'smarts': ['[O:1][H]'], 'overrides': ['o']},
+    'hw': {'smarts': ['[H:1][O][H:2]'], 'overrides': []},
+}
+
+
+def test_compile():
+    """The SMARTS are parsed once, with the mapped atoms found."""
+    compiled = CompiledTemplates(templates)
+    assert len(compiled) == 5
+    assert compiled.atom_types == ['hw', 'oh', 'o', 'c3', 'c']
+    maps = {t.atom_type: t.map_list for t in compiled}
+    assert maps['hw'] == [0, 2]
+
+
+def test_assign():
+    """Later templates overwrite earlier ones."""
+    compiled = CompiledTemplates(templates)
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('CCO'))
+    atom_types = compiled.assign(molecule)
+    assert atom_types[0:3] == ['c3', 'c', 'oh']
+    assert atom_types[3:] == ['?'] * 6
+
+
+def test_overrides_precedence():
+    """A template wins over those it overrides, whatever the file order."""
+    out_of_order = {
+        'c3': {'smarts': ['[CX4H3:1]'], 'overrides': ['c']},
+        'c': {'smarts': ['[CX4:1]'], 'overrides': []},
+    }
+    compiled = CompiledTemplates(out_of_order)
+    assert compiled.atom_types == ['c3', 'c']
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('CC(C)(C)C'))
+    atom_types = compiled.assign(molecule)
+    assert atom_types[0:5] == ['c3', 'c', 'c3', 'c3', 'c3']
+
+
+def test_query_elements():
+    """The elements a query atom can match are found from the SMARTS."""
+    pattern = rdkit.Chem.MolFromSmarts('[CX4H3:1][c,n][!C][Si,#8]')
+    elements = [query_elements(atom) for atom in pattern.GetAtoms()]
+    assert elements == [{6}, {6, 7}, None, {8, 14}]
+
+
+def test_array_query():
+    """Single-atom queries on the atom arrays match as RDKit does."""
+    molecule = rdkit.Chem.AddHs(
+        rdkit.Chem.MolFromSmiles('C[N+](C)(C)CC1CC1c1ccc(O)cc1C(=O)[O-]')
+    )
+    arrays = AtomArrays(molecule)
+    for smarts in (
+        '[CX4H3:1]', '[CX4H2:1]', '[O:1]', '[NX4+:1]', '[c:1]', '[He:1]',
+        '[CX4r3:1]', '[C,N;!R:1]', '[#8;-1:1]', '[a;H1:1]', '[R2:1]',
+        '[D3:1]', '[*:1]'
+    ):
+        pattern = rdkit.Chem.MolFromSmarts(smarts)
+        query = array_query(pattern.GetAtomWithIdx(0))
+        assert query is not None, smarts
+        expected = [
+            match[0] for match in molecule.GetSubstructMatches(
+                pattern, uniquify=False, maxMatches=max_matches
+            )
+        ]
+        matches = evaluate_query(query, arrays).nonzero()[0].tolist()
+        assert matches == sorted(expected), smarts
+
+    pattern = rdkit.Chem.MolFromSmarts('[$(C=O):1]')
+    assert array_query(pattern.GetAtomWithIdx(0)) is None
+
+
+def test_tree():
+    """The decision tree gives the same types as matching in turn."""
+    compiled = CompiledTemplates(templates)
+    assert compiled.tree.n_nodes > 1
+    for smiles in ('CCO', 'CC(C)(C)C', 'O', 'C1CC1O', 'c1ccccc1O'):
+        molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles(smiles))
+        expected = compiled.assign(molecule)
+        assert compiled.assign(molecule, engine='tree') == expected
+    with pytest.raises(ValueError):
+        compiled.assign(molecule, engine='unknown')
+
+
+def test_prefilter():
+    """Templates needing atoms the molecule lacks are skipped."""
+    prefiltered = {
+        'c': {'smarts': ['[CX4:1]'], 'overrides': []},
+        'cp': {'smarts': ['[c:1]'], 'overrides': []},
+        'hsi': {'smarts': ['[H:1]-[Si]'], 'overrides': []},
+        'n+': {'smarts': ['[NX4+:1]'], 'overrides': []},
+        'ho': {'smarts': ['[H:1]-O'], 'overrides': []},
+    }
+    compiled = CompiledTemplates(prefiltered)
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('CCO'))
+    candidates = [t.atom_type for t in compiled.candidates(molecule)]
+    assert candidates == ['ho', 'c']
+
+
+def test_profile():
+    """The matches and atoms set by each template are counted."""
+    from seamm_default_atomtyping.profiling import TypingProfile
+
+    compiled = CompiledTemplates(templates)
+    molecule = rdkit.Chem.AddHs(rdkit.Chem.MolFromSmiles('CCO'))
+    profile = TypingProfile()
+    compiled.assign(molecule, profile=profile)
+    data = {t['atom_type']: t for t in profile.statistics()['templates']}
+    assert data['c3']['matches'] == 1
+    assert data['c3']['set'] == 1
+    assert data['c']['matches'] == 2
+    assert data['c']['set'] == 1
+    assert data['c']['overridden'] == 1
+    assert 'c3' in profile.report()
+
+
+def test_nested_phases():
+    """Time in a nested phase is not also counted in the outer phase."""
+    import time
+
+    from seamm_default_atomtyping.profiling import TypingProfile
+
+    profile = TypingProfile()
+    t0 = time.perf_counter()
+    with profile.phase('match'):
+        with profile.phase('load'):
+            time.sleep(0.02)
+    total = time.perf_counter() - t0
+    times = profile.phase_times
+    assert times['load'] >= 0.02
+    assert times['match'] < 0.01
+    assert sum(times.values()) <= total